@@ -17,6 +17,11 @@ Action:[这你是你要调用的工具，格式为 function_name(arg_name''arg_v
 """
 import requests
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "hello_agent"))
+from http_session import get_session,get_tavily_client
 
 def get_weather(city:str) -> str:
     """
@@ -26,8 +31,8 @@ def get_weather(city:str) -> str:
     url = f"https://wttr.in/{city}?format=j1"
 
     try:
-        # 发起网络请求
-        response = requests.get(url)
+        # 发起网络请求：复用共享会话的长连接，带超时和重试
+        response = get_session("weather").get(url)
         # 检查响应状态是否为200(成功)
         response.raise_for_status()
         # 解析返回的JSON数据
@@ -45,9 +50,6 @@ def get_weather(city:str) -> str:
         # 处理数据解析错误
         return f"错误:解析天气数据失败，可能是城市名无效 - {e}"
     
-import os
-from tavily import TavilyClient
-
 def get_attraction(city:str,weather:str) -> str:
     """
     根据城市和天气，使用Tavily Seach API搜索并返回优化后的景点推荐
@@ -56,8 +58,8 @@ def get_attraction(city:str,weather:str) -> str:
     api_key = os.environ.get("TAVILY_API_KEY")
     if not api_key:
         return "错误:未配置TAVILY_API_KEY环境变量。"
-    # 2.创建Tavily客户端
-    tavily = TavilyClient(api_key=api_key)
+    # 2.获取共享的Tavily客户端（同一个密钥只创建一次）
+    tavily = get_tavily_client(api_key)
     # 3.构建一个精确的查询
     query = f"{city}在{weather}天气下最值得去的旅游景点以及推荐理由"
     try:
@@ -2,7 +2,13 @@
 # 导入ABC (Abstract Base Class) 和 abstractmethod, 用于创建抽象基类和抽象方法。
 from abc import ABC,abstractmethod
 # 导入类型提示相关的模块，增强代码可读性和健壮性。
-from typing import Optional,Any
+from typing import Optional,Any,Callable,Generator,AsyncIterator,NamedTuple
+# 导入 asyncio，用于实现协程版本的运行循环 (arun / astream)。
+import asyncio
+# 导入线程池，同步驱动器用它并发执行一批请求。
+import concurrent.futures
+# 导入 dataclass，用于定义带可变默认值的请求类型。
+from dataclasses import dataclass,field
 # 从 messages 模块导入 Message 类，用于表示对话消息。
 from messages import Message
 # 从 hello_agents.core.llm 模块导入 HelloAgentsLLM 类，这是对大型语言模型的封装。
@@ -10,14 +16,226 @@ from hello_agents.core.llm import HelloAgentsLLM
 # 从 config 模块导入 Config 类，用于配置 Agent。
 from config import Config
 
+@dataclass(frozen=True)
+class LLMRequest:
+    """
+    运行步骤向驱动器发出的一次 LLM 调用请求。
+
+    Agent 的运行逻辑被写成一个生成器：每当需要调用 LLM 时就 yield 一个 LLMRequest，
+    驱动器负责真正发起调用（同步用 invoke，异步用 ainvoke），再把回复文本 send 回生成器。
+    这样同一份提示词构建与解析逻辑就能同时服务于 run 和 arun/astream。
+    """
+    messages:list # 发送给 LLM 的消息列表
+    kwargs:dict = field(default_factory=dict) # 传递给 LLM 调用的额外参数，每个请求使用独立的字典
+    final:bool = False # 为 True 表示这次调用的输出就是最终答案，astream 会把它逐块流式输出
+
+class ToolRequest(NamedTuple):
+    """
+    运行步骤向驱动器发出的一次工具(同步函数)调用请求。
+    同步驱动器直接调用；异步驱动器把它放到线程中执行，避免阻塞事件循环。
+    """
+    func:Callable[...,Any]
+    args:tuple = ()
+
+class Submit(NamedTuple):
+    """
+    把一个请求交给驱动器在后台执行，驱动器立即 send 回 None，不等待它完成。
+    结果之后通过 yield WaitAny() 逐个取回，适合按依赖关系随时提交新请求的调度逻辑。
+    """
+    key:Any # 调用方用来识别这个请求的标识
+    request:Any # LLMRequest 或 ToolRequest
+
+class WaitAny(NamedTuple):
+    """ 等待任意一个通过 Submit 提交的请求完成，驱动器 send 回 (key, 结果) """
+
+# 运行步骤生成器的类型：yield 请求，接收请求结果，最终 return 答案。
+# 也可以 yield 一个请求列表，驱动器会并发执行它们，并按相同顺序 send 回结果列表；
+# 或者 yield Submit / WaitAny，逐个提交请求、逐个取回先完成的结果。
+RunSteps = Generator[Any,Any,Any]
+
+def _dispatch(request:Any,llm:Any) -> Any:
+    """ 同步执行单个请求 """
+    if isinstance(request,ToolRequest):
+        return request.func(*request.args)
+    return llm.invoke(request.messages,**request.kwargs) or ""
+
+def _dispatch_batch(requests:list,llm:Any) -> list:
+    """ 用线程池并发执行一批请求，结果顺序与请求顺序一致 """
+    if len(requests) <= 1:
+        return [_dispatch(request,llm) for request in requests]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        return list(pool.map(lambda request:_dispatch(request,llm),requests))
+
+class _ThreadSubmissions:
+    """ 同步驱动器中通过 Submit 提交、还没有取回结果的请求，在线程池中执行 """
+    def __init__(self,llm:Any):
+        self.llm = llm
+        self.pool:Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.futures:dict = {} # future -> key
+
+    def submit(self,submit:Submit):
+        if self.pool is None:
+            self.pool = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="drive-steps")
+        self.futures[self.pool.submit(_dispatch,submit.request,self.llm)] = submit.key
+
+    def wait_any(self) -> tuple:
+        if not self.futures:
+            raise RuntimeError("WaitAny 之前没有通过 Submit 提交请求")
+        done,_ = concurrent.futures.wait(self.futures,return_when=concurrent.futures.FIRST_COMPLETED)
+        future = next(iter(done))
+        return self.futures.pop(future),future.result()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False,cancel_futures=True)
+
+def drive_steps(steps:RunSteps,llm:Any) -> Any:
+    """
+    同步驱动一个运行步骤生成器，返回生成器的最终返回值。
+
+    Args:
+        steps (RunSteps): Agent 的运行步骤生成器。
+        llm: 提供 invoke 方法的 LLM 实例。
+    """
+    submissions = _ThreadSubmissions(llm)
+    try:
+        request = next(steps)
+        while True:
+            if isinstance(request,Submit):
+                submissions.submit(request)
+                result = None
+            elif isinstance(request,WaitAny):
+                result = submissions.wait_any()
+            elif isinstance(request,list):
+                result = _dispatch_batch(request,llm)
+            else:
+                result = _dispatch(request,llm)
+            request = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        submissions.close()
+
+async def _ainvoke(llm:Any,request:LLMRequest) -> str:
+    """ 异步调用 LLM；如果 LLM 没有提供 ainvoke，则退回到在线程中调用 invoke。 """
+    if hasattr(llm,"ainvoke"):
+        return await llm.ainvoke(request.messages,**request.kwargs) or ""
+    return await asyncio.to_thread(llm.invoke,request.messages,**request.kwargs) or ""
+
+async def _adispatch(request:Any,llm:Any) -> Any:
+    """ 异步执行单个请求或一批请求，一批请求通过 asyncio.gather 并发执行 """
+    if isinstance(request,list):
+        return list(await asyncio.gather(*[_adispatch(item,llm) for item in request]))
+    if isinstance(request,ToolRequest):
+        return await asyncio.to_thread(request.func,*request.args)
+    return await _ainvoke(llm,request)
+
+class _TaskSubmissions:
+    """ 异步驱动器中通过 Submit 提交、还没有取回结果的请求，每个请求是一个任务 """
+    def __init__(self,llm:Any):
+        self.llm = llm
+        self.tasks:dict = {} # task -> key
+
+    async def dispatch(self,request:Any) -> Any:
+        """ 执行一个请求，Submit / WaitAny 之外的请求交给 _adispatch """
+        if isinstance(request,Submit):
+            self.tasks[asyncio.ensure_future(_adispatch(request.request,self.llm))] = request.key
+            return None
+        if isinstance(request,WaitAny):
+            if not self.tasks:
+                raise RuntimeError("WaitAny 之前没有通过 Submit 提交请求")
+            done,_ = await asyncio.wait(self.tasks,return_when=asyncio.FIRST_COMPLETED)
+            task = next(iter(done))
+            return self.tasks.pop(task),task.result()
+        return await _adispatch(request,self.llm)
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+async def adrive_steps(steps:RunSteps,llm:Any) -> Any:
+    """
+    异步驱动一个运行步骤生成器，返回生成器的最终返回值。
+    LLM 调用走异步客户端，同步工具调用放到线程中执行。
+    """
+    submissions = _TaskSubmissions(llm)
+    try:
+        request = next(steps)
+        while True:
+            result = await submissions.dispatch(request)
+            request = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        submissions.close()
+
+class AsyncRunMixin:
+    """
+    为 Agent 提供协程版本的运行方法 (arun / astream)。
+
+    使用该 Mixin 的类需要实现 `_run_steps(input_text, **kwargs)` 生成器，
+    并在 run 中通过 drive_steps 同步驱动它。一个事件循环即可同时服务大量会话，
+    不再需要为每个会话占用一个阻塞在 llm.invoke 上的线程。
+    """
+    def _run_steps(self,input_text:str,**kwargs) -> RunSteps:
+        """ 子类实现：以生成器形式描述 Agent 的运行逻辑。 """
+        raise NotImplementedError(f"{type(self).__name__} 未实现 _run_steps，无法使用 arun/astream")
+
+    async def arun(self,input_text:str,**kwargs) -> str:
+        """
+        run 的协程版本。
+
+        Args:
+            input_text (str): 用户输入或任务描述。
+            **kwargs: 与 run 相同的关键字参数。
+
+        Returns:
+            str: Agent 生成的最终响应。
+        """
+        return await adrive_steps(self._run_steps(input_text,**kwargs),self.llm)
+
+    async def astream(self,input_text:str,**kwargs) -> AsyncIterator[str]:
+        """
+        流式的协程版本。
+        标记为 final 的 LLM 调用会通过 llm.astream_invoke 逐块产出；
+        如果整个过程中没有可流式输出的调用，则在结束时一次性产出最终答案。
+        """
+        steps = self._run_steps(input_text,**kwargs)
+        submissions = _TaskSubmissions(self.llm)
+        streamed = False
+        final_answer = None
+        try:
+            request = next(steps)
+            while True:
+                if isinstance(request,(list,ToolRequest,Submit,WaitAny)):
+                    result = await submissions.dispatch(request)
+                elif request.final and hasattr(self.llm,"astream_invoke"):
+                    parts = []
+                    async for chunk in self.llm.astream_invoke(request.messages,**request.kwargs):
+                        parts.append(chunk)
+                        yield chunk
+                    streamed = True
+                    result = "".join(parts)
+                else:
+                    result = await _ainvoke(self.llm,request)
+                request = steps.send(result)
+        except StopIteration as stop:
+            final_answer = stop.value
+        finally:
+            submissions.close()
+
+        if not streamed and final_answer:
+            yield final_answer
+
 # 定义一个名为 Agent 的抽象基类，所有具体的 Agent 类都应继承自该类。
 # ABC 意味着这个类不能被直接实例化。
-class Agent(ABC):
+class Agent(AsyncRunMixin,ABC):
     """
     Agent基类 (Abstract Base Class for all Agents)。
     
     这个类为所有特定类型的 Agent（如 ReActAgent, ChatAgent 等）提供了一个通用的接口和基础功能。
     它定义了 Agent 的核心属性（如名称、LLM实例、系统提示等）和必须实现的方法（如 run）。
+    子类如果实现了 `_run_steps`，即可直接获得协程版本的 arun / astream。
     """
     def __init__(
         self,
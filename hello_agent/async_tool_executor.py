@@ -1,81 +1,231 @@
 # 异步工具执行支持
 import asyncio # 导入asyncio库，用于编写单线程并发代码
+import inspect # 用于判断工具是否提供了原生协程
 import concurrent.futures # 导入concurrent.futures模块，特别是ThreadPoolExecutor，用于在单独的线程中执行阻塞操作
-from typing import Dict,List,Any,Callable # 导入类型提示，增强代码可读性和健壮性
+from typing import Dict,List,Any,Callable,Optional,Awaitable # 导入类型提示，增强代码可读性和健壮性
 from hello_agents import ToolRegistry # 从hello_agents库导入ToolRegistry，这是一个用于管理和执行工具的类
 
 class AsyncToolExecutor:
     """
-    异步工具执行器。
-    这个类的主要功能是接收同步的工具函数调用，并通过一个线程池来异步地执行它们，
-    从而避免在asyncio事件循环中发生阻塞。
+    异步工具调度器。
+    - 提供原生协程的工具（Tool 对象的 async arun 方法，或注册的 async 函数）直接在事件循环中执行；
+      同步工具放到线程池中执行，避免阻塞事件循环；
+    - 每个工具可以单独限制并发数，超出的调用排队等待；
+    - 每次调用可以设置截止时间（包括排队时间），超时后取消：协程会被真正取消，
+      还没开始的线程任务不再执行，已经在运行的线程任务调用方不再等待，
+      但它在结束之前仍然占用该工具的并发名额；
+    - 必须在 async with 中使用，退出时关闭线程池，线程池的生命周期是确定的。
+
+    用法:
+        async with AsyncToolExecutor(registry,tool_limits={"search":2},default_timeout=30) as executor:
+            results = await executor.execute_tools_parallel(tasks)
     """
-    def __init__(self,registry:ToolRegistry,max_workers:int = 4):
+    def __init__(
+        self,
+        registry:ToolRegistry,
+        max_workers:int = 4,
+        tool_limits:Optional[Dict[str,int]] = None,
+        default_limit:Optional[int] = None,
+        default_timeout:Optional[float] = None,
+        timeouts:Optional[Dict[str,float]] = None,
+        wait_on_exit:bool = True
+    ):
         """
-        初始化异步工具执行器。
+        初始化异步工具调度器。
         :param registry: ToolRegistry的实例，包含了所有可用的工具。
-        :param max_workers: 线程池中的最大工作线程数。
+        :param max_workers: 线程池中的最大工作线程数，只有同步工具占用线程。
+        :param tool_limits: 按工具名限制同时执行的调用数，例如 {"search":2}。
+        :param default_limit: 没有单独设置的工具的并发上限，None 表示不限制（仍受线程池大小约束）。
+        :param default_timeout: 每次调用的默认截止时间（秒），None 表示不限制。
+        :param timeouts: 按工具名单独设置的截止时间，优先于 default_timeout。
+        :param wait_on_exit: 退出 async with 时是否等待仍在运行的线程结束。
+                             为 False 时只取消排队中的任务，已超时的慢工具不会拖住调用方。
         """
         self.registry = registry # 保存工具注册表的引用
-        # 创建一个线程池执行器，用于在后台线程中运行同步函数
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.max_workers = max_workers
+        self.tool_limits = tool_limits or {}
+        self.default_limit = default_limit
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.wait_on_exit = wait_on_exit
+        # 线程池和信号量在进入 async with 时创建，信号量绑定在当时的事件循环上
+        self.executor:Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._semaphores:Dict[str,asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "AsyncToolExecutor":
+        if self.executor is not None:
+            raise RuntimeError("AsyncToolExecutor 已经在使用中，不能重复进入")
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,thread_name_prefix="async-tool")
+        self._semaphores = {}
+        return self
+
+    async def __aexit__(self,exc_type,exc_val,exc_tb):
+        executor,self.executor = self.executor,None
+        if executor is None:
+            return
+        if self.wait_on_exit:
+            # 在默认线程池中等待，关闭过程不阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(None,lambda:executor.shutdown(wait=True,cancel_futures=True))
+        else:
+            executor.shutdown(wait=False,cancel_futures=True)
+
+    def _require_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self.executor is None:
+            raise RuntimeError("AsyncToolExecutor 需要在 async with 中使用")
+        return self.executor
+
+    def _semaphore(self,key:Optional[str]) -> Optional[asyncio.Semaphore]:
+        """ 返回工具的并发信号量，没有并发上限时返回 None """
+        if key is None:
+            return None
+        limit = self.tool_limits.get(key,self.default_limit)
+        if not limit:
+            return None
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(limit)
+        return self._semaphores[key]
+
+    def timeout_for(self,tool_name:Optional[str]) -> Optional[float]:
+        return self.timeouts.get(tool_name,self.default_timeout) if tool_name else self.default_timeout
+
+    async def _schedule(self,key:Optional[str],start:Callable[[],Any],timeout:Optional[float]) -> Any:
+        """
+        在并发上限和截止时间内执行一次调用。
+        截止时间从调用开始计算，排队等待信号量的时间也算在内；超时抛出 asyncio.TimeoutError。
+        start 返回协程，或者返回已经提交到线程池的 concurrent.futures.Future。
+        """
+        semaphore = self._semaphore(key)
+        loop = asyncio.get_running_loop()
+
+        def _release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass # 事件循环已经关闭，信号量也不会再被使用
+
+        async def _guarded():
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                task = start()
+            except BaseException:
+                if semaphore is not None:
+                    semaphore.release()
+                raise
+            if isinstance(task,concurrent.futures.Future):
+                # 线程任务在线程真正结束（或还没开始就被取消）时才释放名额，
+                # 超时后仍在运行的线程继续占用名额，并发上限对线程同样有效
+                if semaphore is not None:
+                    task.add_done_callback(_release)
+                return await asyncio.wrap_future(task)
+            try:
+                return await task
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+
+        if timeout is None:
+            return await _guarded()
+        return await asyncio.wait_for(_guarded(),timeout=timeout)
+
+    def _in_thread(self,func:Callable[...,Any],*args) -> Callable[[],concurrent.futures.Future]:
+        """ 把同步调用包装成提交到线程池的工厂。超时取消时，还没开始的任务不会再执行 """
+        executor = self._require_executor()
+        return lambda:executor.submit(func,*args)
+
+    def _native_coroutine(self,tool_name:str,input_data:str) -> Optional[Callable[[],Awaitable[str]]]:
+        """ 工具提供原生协程时返回启动它的工厂，参数传递方式与 ToolRegistry.execute_tool 一致 """
+        tool = self.registry.get_tool(tool_name)
+        if tool is not None:
+            arun = getattr(tool,"arun",None)
+            if arun is not None and inspect.iscoroutinefunction(arun):
+                return lambda:arun({"input":input_data})
+            return None
+        func = self.registry.get_function(tool_name)
+        if func is not None and inspect.iscoroutinefunction(func):
+            return lambda:func(input_data)
+        return None
 
-    async def execute_tool_async(self,tool_name:str,input_data:str) -> str:
+    async def execute_tool_async(self,tool_name:str,input_data:str,timeout:Optional[float] = None) -> str:
         """
         异步地执行单个工具。
-        这个方法将一个同步的工具执行调用（self.registry.execute_tool）包装成一个可以在asyncio中等待的异步任务。
-        它通过在线程池中运行同步函数来实现这一点。
+        有原生协程的工具直接等待，同步工具在线程池中执行（self.registry.execute_tool）。
+
+        :param timeout: 本次调用的截止时间（秒），默认按 timeouts / default_timeout。
+        :raises asyncio.TimeoutError: 超过截止时间。
         """
-        loop = asyncio.get_event_loop() # 获取当前的asyncio事件循环
-
-        # 定义一个内部函数，该函数将执行实际的同步工具调用
-        # 这是因为 loop.run_in_executor 需要一个不带参数的可调用对象
-        def _execute():
-            return self.registry.execute_tool(tool_name,input_data)
-        
-        # 在线程池（self.executor）中执行_execute函数，并等待其结果
-        # 这使得同步的、可能耗时的操作不会阻塞事件循环
-        result = await loop.run_in_executor(self.executor,_execute)
-        return result # 返回工具执行的结果
-
-    async def execute_tools_paraller(self,tasks:List[Dict[str,str]]) -> List[str]:
+        self._require_executor()
+        native = self._native_coroutine(tool_name,input_data)
+        if native is not None:
+            async def start():
+                try:
+                    return await native()
+                except Exception as e:
+                    # 与 ToolRegistry.execute_tool 的错误格式保持一致
+                    return f"错误：执行工具 '{tool_name}' 时发生异常: {str(e)}"
+        else:
+            start = self._in_thread(self.registry.execute_tool,tool_name,input_data)
+        return await self._schedule(tool_name,start,timeout if timeout is not None else self.timeout_for(tool_name))
+
+    async def run_in_pool(
+        self,
+        func:Callable[...,Any],
+        *args,
+        timeout:Optional[float] = None,
+        tool_name:Optional[str] = None
+    ) -> Any:
         """
-        并行地执行多个工具任务。
-        这个方法接收一个任务列表，为每个任务创建一个异步执行协程，并使用 asyncio.gather 来并发运行它们。
+        执行任意可调用对象，并可设置截止时间。
+        与 execute_tool_async 不同，这里不经过 registry，便于 Agent 复用自己的参数解析逻辑。
+        协程函数直接在事件循环中等待，同步函数在线程池中执行。
+
+        :param tool_name: 用于套用该工具的并发上限，为空时不限制并发。
+        :raises asyncio.TimeoutError: 超过截止时间。协程会被取消；已经开始运行的线程会继续运行直到结束，但调用方不再等待它。
+        """
+        if inspect.iscoroutinefunction(func):
+            start = lambda:func(*args)
+        else:
+            start = self._in_thread(func,*args)
+        return await self._schedule(tool_name,start,timeout)
+
+    def shutdown(self,wait:bool = True):
+        """
+        立即关闭线程池并取消排队中的任务，通常由 async with 自动完成。
+        wait=False 时不会等待已超时但仍在运行的工具线程。
+        """
+        executor,self.executor = self.executor,None
+        if executor is not None:
+            executor.shutdown(wait=wait,cancel_futures=True)
+
+    async def execute_tools_parallel(self,tasks:List[Dict[str,str]]) -> List[str]:
+        """
+        并行地执行多个工具任务，结果顺序与任务顺序一致。
+        并发数受 tool_limits 和线程池大小约束；超时的任务返回错误信息，不影响其他任务。
+        任务字典可以带 "timeout" 字段覆盖该任务的截止时间。
         """
         print(f"开始并执行{len(tasks)}个工具任务")
 
-        # 创建一个列表，用于存放所有的异步任务（协程）
-        async_tasks = []
-        for task in tasks:
+        async def _run(task:Dict[str,Any]) -> str:
             # 从任务字典中解析出工具名称和输入数据
             tool_name = task["tool_name"]
-            input_data = task["input_data"]
-            # 为每个任务调用 execute_tool_async，创建一个协程对象
-            async_task = self.execute_tool_async(tool_name,input_data)
-            # 将创建的协程添加到任务列表中
-            async_tasks.append(async_task)
+            timeout = task.get("timeout",self.timeout_for(tool_name))
+            try:
+                return await self.execute_tool_async(tool_name,task["input_data"],timeout=timeout)
+            except asyncio.TimeoutError:
+                return f"错误：工具 '{tool_name}' 执行超时({timeout}s)"
 
-        # 使用 asyncio.gather 并发地运行列表中的所有协程，并等待它们全部完成
-        # `*async_tasks` 是将列表解包成独立的参数传递给 gather
-        results = await asyncio.gather(*async_tasks)
+        # asyncio.gather 返回结果的顺序与传入协程的顺序一致
+        results = await asyncio.gather(*[_run(task) for task in tasks])
 
         print("所有工具执行完毕")
         return results # 返回一个包含所有任务结果的列表，其顺序与输入任务的顺序相对应
 
-    def __del__(self):
-        """
-        对象销毁时的清理操作。
-        确保线程池被安全地关闭，释放所有资源。
-        """
-        # 检查executor属性是否存在，以防初始化失败
-        if hasattr(self,'executor'):
-            # 关闭线程池，wait=True表示等待所有正在执行的任务完成后再关闭
-            self.executor.shutdown(wait=True)
+    # 保留旧的（拼写错误的）方法名，兼容已有调用方
+    execute_tools_paraller = execute_tools_parallel
 
 # 使用示例
 async def test_parallel_execution():
-    """ 
+    """
     测试并行工具执行功能的示例异步函数。
     这个函数展示了如何实例化AsyncToolExecutor并用它来并行处理一组不同的工具调用。
     """
@@ -85,9 +235,6 @@ async def test_parallel_execution():
     # 创建一个工具注册表实例
     registry = ToolRegistry()
 
-    # 创建一个异步工具执行器实例
-    executor = AsyncToolExecutor(registry)
-
     # 定义一个任务列表，每个任务都是一个字典，包含要调用的工具名和输入数据
     tasks = [
         {"tool_name":"search","input_data":"python编程"},
@@ -96,10 +243,12 @@ async def test_parallel_execution():
         {"tool_name":"calculator","input_data":"sqrt(16)"},
     ]
 
-    # 调用并行执行方法，并等待所有任务完成
-    results = await executor.execute_tools_paraller(tasks)
+    # 创建一个异步工具调度器，搜索最多同时执行2个，每个调用最多等待30秒
+    async with AsyncToolExecutor(registry,tool_limits={"search":2},default_timeout=30) as executor:
+        # 调用并行执行方法，并等待所有任务完成
+        results = await executor.execute_tools_parallel(tasks)
     print("并行执行结果:",results)
 
     # 遍历并打印每个任务的结果（为了简洁，只显示结果的前100个字符）
     for i,result in enumerate(results,1):
-        print(f"任务 {i+1} 结果:{result[:100]}...")
+        print(f"任务 {i} 结果:{result[:100]}...")
@@ -0,0 +1,409 @@
+# 编译型计算器引擎
+import ast
+import math
+import operator
+import numbers
+from functools import lru_cache
+from typing import Optional,List,Dict,Any,Tuple,FrozenSet
+
+# NumPy 是可选依赖：安装后批量计算走向量化路径，否则逐条计算
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 支持的二元运算
+_BINARY_OPERATORS = {
+    ast.Add:operator.add, # 加法
+    ast.Sub:operator.sub, # 减法
+    ast.Mult:operator.mul, # 乘法
+    ast.Div:operator.truediv, # 真除法
+    ast.FloorDiv:operator.floordiv, # 整除
+    ast.Mod:operator.mod, # 取模
+    ast.Pow:operator.pow, # 乘方
+}
+
+# 支持的一元运算
+_UNARY_OPERATORS = {
+    ast.USub:operator.neg, # 负号
+    ast.UAdd:operator.pos, # 正号
+}
+
+# math 模块中的全部常量
+CONSTANTS:Dict[str,float] = {name:getattr(math,name) for name in ("pi","e","tau","inf","nan")}
+
+# math 模块中的全部函数，外加几个常用的内置函数
+FUNCTIONS:Dict[str,Any] = {
+    name:getattr(math,name) for name in dir(math)
+    if not name.startswith("_") and callable(getattr(math,name))
+}
+FUNCTIONS.update({"abs":abs,"round":round,"min":min,"max":max})
+
+# 指令操作码：编译后的表达式是一个扁平的后缀指令序列，用栈来求值
+OP_CONST = 0 # (OP_CONST, 数值)
+OP_VAR = 1 # (OP_VAR, 变量名)
+OP_UNARY = 2 # (OP_UNARY, 函数)
+OP_BINARY = 3 # (OP_BINARY, 函数)
+OP_CALL = 4 # (OP_CALL, 函数, 参数个数, 函数名)
+
+class CalculatorLimitError(ValueError):
+    """ 表达式超出了安全限制（长度、嵌套深度、节点数或数值大小） """
+
+class EvaluationLimits:
+    """
+    受保护求值模式的安全限制。
+    深度嵌套的括号、超大的指数或阶乘这类病态输入可能让工作线程长时间卡住，
+    受保护模式在求值前检查语法树的规模，在求值时检查每一步的数值大小，超出限制立即报错。
+    """
+    def __init__(
+        self,
+        max_length:int = 1000,
+        max_depth:int = 32,
+        max_nodes:int = 256,
+        max_magnitude:float = 1e100,
+        max_exponent:float = 1024,
+        max_integer_argument:int = 1000
+    ):
+        self.max_length = max_length # 表达式最大字符数
+        self.max_depth = max_depth # 语法树最大嵌套深度
+        self.max_nodes = max_nodes # 语法树最大节点数
+        self.max_magnitude = max_magnitude # 任一中间结果的最大绝对值
+        self.max_exponent = max_exponent # 乘方运算指数的最大绝对值
+        self.max_integer_argument = max_integer_argument # factorial/comb/perm 参数以及 round 位数的最大绝对值
+
+DEFAULT_LIMITS = EvaluationLimits()
+
+# 参数稍大就会耗时很久的整数函数
+_INTEGER_HEAVY_FUNCTIONS = frozenset({"factorial","comb","perm"})
+
+def _check_magnitude(value:Any,limits:EvaluationLimits) -> Any:
+    if isinstance(value,numbers.Number) and not isinstance(value,bool):
+        # nan 与任何数比较都为 False，这里只拦截过大（含无穷大）的数值
+        if abs(value) > limits.max_magnitude:
+            raise CalculatorLimitError(f"数值超出限制:绝对值大于{limits.max_magnitude:g}")
+    return value
+
+def _check_power(base:Any,exponent:Any,limits:EvaluationLimits):
+    """ 在真正计算之前估算乘方结果的大小，避免 9**9**9 这样的输入长时间占用CPU """
+    if abs(exponent) > limits.max_exponent:
+        raise CalculatorLimitError(f"指数超出限制:绝对值大于{limits.max_exponent:g}")
+    if isinstance(exponent,complex) or isinstance(base,complex):
+        return
+    magnitude = abs(base)
+    if magnitude > 1 and exponent > 0 and exponent * math.log10(magnitude) > math.log10(limits.max_magnitude):
+        raise CalculatorLimitError(f"数值超出限制:乘方结果大于{limits.max_magnitude:g}")
+
+def _check_call(name:str,args:list,limits:EvaluationLimits):
+    """
+    在调用函数之前检查会引发大整数运算的参数：
+    整数函数的参数、round 的位数（round(1,-10**8) 要先算出 10**(10**8)）、
+    ldexp 和 pow 的指数。
+    """
+    if name in _INTEGER_HEAVY_FUNCTIONS and any(abs(arg) > limits.max_integer_argument for arg in args):
+        raise CalculatorLimitError(f"{name}的参数超出限制:大于{limits.max_integer_argument}")
+    if len(args) != 2:
+        return
+    if name == "round" and abs(args[1]) > limits.max_integer_argument:
+        raise CalculatorLimitError(f"round的位数超出限制:绝对值大于{limits.max_integer_argument}")
+    if name == "ldexp" and abs(args[1]) > limits.max_exponent:
+        raise CalculatorLimitError(f"指数超出限制:绝对值大于{limits.max_exponent:g}")
+    if name == "pow":
+        _check_power(args[0],args[1],limits)
+
+def _tree_stats(tree:ast.AST) -> Tuple[int,int]:
+    """
+    统计语法树的嵌套深度和节点数，用显式栈遍历，不会因为嵌套过深而递归溢出。
+    运算符节点（ast.Add 等）不计入规模。
+    """
+    stack = [(tree,1)]
+    max_depth = 0
+    count = 0
+    while stack:
+        node,depth = stack.pop()
+        count += 1
+        max_depth = max(max_depth,depth)
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child,(ast.operator,ast.unaryop,ast.expr_context)):
+                stack.append((child,depth + 1))
+    return max_depth,count
+
+class CompiledExpression:
+    """
+    编译后的表达式。
+    表达式只在编译时解析一次，之后每次求值都是对扁平指令序列的一次线性扫描，
+    不再递归遍历语法树，也不再重复构建运算符字典。
+    """
+    def __init__(self,source:str,code:Tuple[tuple,...],variables:FrozenSet[str],depth:int = 0,node_count:int = 0):
+        self.source = source
+        self.code = code
+        self.variables = variables # 表达式中引用的变量名
+        self.depth = depth # 语法树嵌套深度
+        self.node_count = node_count # 语法树节点数
+
+    def check_limits(self,limits:EvaluationLimits = DEFAULT_LIMITS):
+        """
+        检查表达式的长度、嵌套深度和节点数。
+
+        Raises:
+            CalculatorLimitError: 超出任一限制。
+        """
+        if len(self.source) > limits.max_length:
+            raise CalculatorLimitError(f"表达式过长:超过{limits.max_length}个字符")
+        if self.depth > limits.max_depth:
+            raise CalculatorLimitError(f"表达式嵌套过深:深度超过{limits.max_depth}")
+        if self.node_count > limits.max_nodes:
+            raise CalculatorLimitError(f"表达式过于复杂:节点数超过{limits.max_nodes}")
+
+    def evaluate(self,variables:Optional[Dict[str,Any]] = None) -> Any:
+        """
+        对表达式求值。
+
+        Args:
+            variables: 变量名到数值的映射，表达式不含变量时可以省略。
+        """
+        variables = variables or {}
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for instruction in self.code:
+            opcode = instruction[0]
+            if opcode == OP_CONST:
+                push(instruction[1])
+            elif opcode == OP_BINARY:
+                right = pop()
+                push(instruction[1](pop(),right))
+            elif opcode == OP_VAR:
+                name = instruction[1]
+                if name not in variables:
+                    raise NameError(f"变量{name}未赋值")
+                push(variables[name])
+            elif opcode == OP_UNARY:
+                push(instruction[1](pop()))
+            else:
+                argc = instruction[2]
+                args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                push(instruction[1](*args))
+        return stack[0]
+
+    def evaluate_guarded(self,variables:Optional[Dict[str,Any]] = None,limits:EvaluationLimits = DEFAULT_LIMITS) -> Any:
+        """
+        在安全限制下求值：乘方和整数函数在计算前检查参数，每个中间结果都检查数值大小。
+        比 evaluate 稍慢，适合处理不可信的输入。
+
+        Raises:
+            CalculatorLimitError: 数值超出限制。
+        """
+        variables = variables or {}
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for instruction in self.code:
+            opcode = instruction[0]
+            if opcode == OP_CONST:
+                push(_check_magnitude(instruction[1],limits))
+            elif opcode == OP_BINARY:
+                right = pop()
+                left = pop()
+                if instruction[1] is operator.pow:
+                    _check_power(left,right,limits)
+                push(_check_magnitude(instruction[1](left,right),limits))
+            elif opcode == OP_VAR:
+                name = instruction[1]
+                if name not in variables:
+                    raise NameError(f"变量{name}未赋值")
+                push(_check_magnitude(variables[name],limits))
+            elif opcode == OP_UNARY:
+                push(instruction[1](pop()))
+            else:
+                argc = instruction[2]
+                args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                _check_call(instruction[3],args,limits)
+                push(_check_magnitude(instruction[1](*args),limits))
+        return stack[0]
+
+    def evaluate_batch(self,bindings:List[Dict[str,Any]]) -> List[Any]:
+        """
+        用多组变量绑定对同一个表达式批量求值，结果与逐条调用 evaluate 一致。
+        安装了 NumPy 时，每个变量被组装成一个数组，整个批次只需扫描一次指令序列：
+        全部是浮点数的变量用 float 数组；含整数（或复数等）的变量用 object 数组，
+        逐元素按 Python 的规则运算，整数结果保持为整数。
+        向量化计算中出现除零、溢出、定义域错误等异常时，退回到逐条求值，
+        抛出的异常（或得到的 nan/inf/复数结果）与逐条求值完全相同。
+
+        Args:
+            bindings: 变量绑定列表，每个元素是一组 变量名->数值。
+
+        Returns:
+            List[Any]: 与 bindings 顺序一致的结果列表。
+        """
+        if not bindings:
+            return []
+        if np is None:
+            return [self.evaluate(binding) for binding in bindings]
+
+        arrays = {}
+        for name in self.variables:
+            if any(name not in binding for binding in bindings):
+                raise NameError(f"变量{name}未赋值")
+            values = [binding[name] for binding in bindings]
+            dtype = float if all(isinstance(value,(float,np.floating)) for value in values) else object
+            arrays[name] = np.asarray(values,dtype=dtype)
+
+        try:
+            with np.errstate(all="raise"):
+                result = self._evaluate_arrays(arrays)
+            result = np.broadcast_to(np.asarray(result,dtype=object) if np.ndim(result) == 0 else result,(len(bindings),))
+        except (ArithmeticError,ValueError,TypeError):
+            # 包括 NumPy 的 FloatingPointError：逐条求值，得到与 evaluate 相同的结果或异常
+            return [self.evaluate(binding) for binding in bindings]
+        # object 数组中可能混有 NumPy 标量，统一转换为 Python 数值
+        return [item.item() if isinstance(item,np.generic) else item for item in result.tolist()]
+
+    def _evaluate_arrays(self,arrays:Dict[str,Any]) -> Any:
+        """ 用变量数组扫描一次指令序列，返回结果数组（表达式不含变量时返回标量） """
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for instruction in self.code:
+            opcode = instruction[0]
+            if opcode == OP_CONST:
+                push(instruction[1])
+            elif opcode == OP_BINARY:
+                right = pop()
+                left = pop()
+                if instruction[1] is operator.pow:
+                    # 乘方转换为 object 数组按 Python 的规则逐元素计算：
+                    # np.power 与 float 的 ** 在最后一位上可能不同，负数的分数次幂也不会得到复数
+                    push(instruction[1](_as_object(left),_as_object(right)))
+                else:
+                    push(instruction[1](left,right))
+            elif opcode == OP_VAR:
+                push(arrays[instruction[1]])
+            elif opcode == OP_UNARY:
+                push(instruction[1](pop()))
+            else:
+                argc = instruction[2]
+                args = stack[len(stack) - argc:]
+                del stack[len(stack) - argc:]
+                float_only = all(_is_float_array(arg) or isinstance(arg,float) for arg in args)
+                push(_vectorized_function(instruction[3],argc,float_only)(*args))
+        return stack[0]
+
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.source!r}, {len(self.code)} instructions)"
+
+# 可以直接替换为 NumPy ufunc 的 math 函数：语义相同，并且结果逐位相同（精确计算或正确舍入）。
+# 不在这里的函数逐元素调用原函数，包括同名但语义不同的（remainder 是 IEEE 余数，np.remainder 是向下取整的模）、
+# 返回多个值的（frexp、modf）、对浮点数返回整数的（floor、ceil、trunc），
+# 以及 sin、exp 这类 NumPy 实现与 math 在最后一位上可能不同的函数
+_NUMPY_EQUIVALENTS = {
+    "sqrt":"sqrt",
+    "fabs":"fabs",
+    "copysign":"copysign",
+    "fmod":"fmod",
+    "degrees":"degrees",
+    "radians":"radians",
+}
+
+def _is_float_array(value:Any) -> bool:
+    return isinstance(value,np.ndarray) and value.dtype.kind == "f"
+
+def _as_object(value:Any) -> Any:
+    """ 把浮点数组转换为元素是 Python float 的 object 数组，其他值原样返回 """
+    return value.astype(object) if _is_float_array(value) else value
+
+@lru_cache(maxsize=256)
+def _vectorized_function(name:str,argc:int,float_only:bool = True):
+    """
+    返回函数的向量化版本。
+    参数全是浮点数、并且函数在 _NUMPY_EQUIVALENTS 中时，使用对应的单输出 NumPy ufunc；
+    否则用 np.vectorize 逐元素调用原函数（结果为 object 数组），整数参数和整数结果保持为整数。
+    """
+    candidate = getattr(np,_NUMPY_EQUIVALENTS.get(name,""),None)
+    if float_only and isinstance(candidate,np.ufunc) and candidate.nin == argc and candidate.nout == 1:
+        return candidate
+    vectorized = np.vectorize(FUNCTIONS[name],otypes=[object])
+    return lambda *args:vectorized(*args)
+
+def _compile_node(node:ast.AST,code:list,variables:set):
+    """ 后序遍历语法树，把节点依次转换为后缀指令 """
+    if isinstance(node,ast.Constant):
+        if isinstance(node.value,bool) or not isinstance(node.value,(int,float,complex)):
+            raise ValueError(f"不支持的常量:{node.value!r}")
+        code.append((OP_CONST,node.value))
+    elif isinstance(node,ast.BinOp):
+        op = _BINARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise ValueError(f"不支持的运算符:{type(node.op).__name__}")
+        _compile_node(node.left,code,variables)
+        _compile_node(node.right,code,variables)
+        code.append((OP_BINARY,op))
+    elif isinstance(node,ast.UnaryOp):
+        op = _UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise ValueError(f"不支持的运算符:{type(node.op).__name__}")
+        _compile_node(node.operand,code,variables)
+        code.append((OP_UNARY,op))
+    elif isinstance(node,ast.Call):
+        if not isinstance(node.func,ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ValueError("不支持的函数调用")
+        for arg in node.args:
+            _compile_node(arg,code,variables)
+        code.append((OP_CALL,FUNCTIONS[node.func.id],len(node.args),node.func.id))
+    elif isinstance(node,ast.Name):
+        if node.id in CONSTANTS:
+            code.append((OP_CONST,CONSTANTS[node.id]))
+        else:
+            variables.add(node.id)
+            code.append((OP_VAR,node.id))
+    else:
+        raise ValueError(f"不支持的语法:{type(node).__name__}")
+
+@lru_cache(maxsize=1024)
+def compile_expression(source:str) -> CompiledExpression:
+    """
+    把表达式编译为 CompiledExpression，相同的源文本只编译一次（LRU缓存）。
+
+    Raises:
+        SyntaxError: 表达式语法错误。
+        ValueError: 表达式包含不支持的语法、运算符或函数。
+    """
+    tree = ast.parse(source,mode="eval")
+    depth,node_count = _tree_stats(tree.body)
+    code = []
+    variables = set()
+    _compile_node(tree.body,code,variables)
+    return CompiledExpression(source,tuple(code),frozenset(variables),depth,node_count)
+
+def compile_guarded(source:str,limits:EvaluationLimits = DEFAULT_LIMITS) -> CompiledExpression:
+    """
+    在安全限制下编译表达式：先检查长度，再编译（命中缓存时不再解析），最后检查语法树的深度和节点数。
+
+    Raises:
+        CalculatorLimitError: 表达式超出安全限制。
+    """
+    source = source.strip()
+    # 在解析之前先拦截超长输入，解析本身的耗时与长度成正比
+    if len(source) > limits.max_length:
+        raise CalculatorLimitError(f"表达式过长:超过{limits.max_length}个字符")
+    try:
+        compiled = compile_expression(source)
+    except (RecursionError,MemoryError):
+        # 解析器和编译器在极深的嵌套上也会失败
+        raise CalculatorLimitError("表达式嵌套过深,无法解析")
+    compiled.check_limits(limits)
+    return compiled
+
+def evaluate_guarded(source:str,variables:Optional[Dict[str,Any]] = None,limits:EvaluationLimits = DEFAULT_LIMITS) -> Any:
+    """ 在安全限制下编译并求值一个表达式 """
+    return compile_guarded(source,limits).evaluate_guarded(variables,limits)
+
+def evaluate(source:str,variables:Optional[Dict[str,Any]] = None) -> Any:
+    """ 编译（或从缓存中取出）并求值一个表达式 """
+    return compile_expression(source.strip()).evaluate(variables)
+
+def evaluate_batch(source:str,bindings:List[Dict[str,Any]]) -> List[Any]:
+    """ 用多组变量绑定批量求值同一个表达式 """
+    return compile_expression(source.strip()).evaluate_batch(bindings)
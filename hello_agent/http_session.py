@@ -0,0 +1,125 @@
+# 共享的HTTP会话层
+import os
+import random
+import threading
+from typing import Optional,Dict,Tuple,Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 默认超时：(连接超时, 读取超时)，单位秒。可以用环境变量 HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT 覆盖
+DEFAULT_TIMEOUT:Tuple[float,float] = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT","3.05")),
+    float(os.getenv("HTTP_READ_TIMEOUT","10")),
+)
+
+# 这些状态码通常是暂时性的，值得重试
+RETRY_STATUS_CODES = (429,500,502,503,504)
+
+class JitteredRetry(Retry):
+    """
+    带随机抖动的重试策略。
+    在 urllib3 的指数退避时间上乘以 [0.5, 1.5) 的随机系数，
+    避免多个工具在同一时刻失败后又在同一时刻重试，把上游再次打垮。
+    """
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        # urllib3 2.x 在实例上提供 backoff_max，1.26 只有类属性 DEFAULT_BACKOFF_MAX
+        backoff_max = getattr(self,"backoff_max",self.DEFAULT_BACKOFF_MAX)
+        return min(backoff_max,backoff * random.uniform(0.5,1.5))
+
+class TimeoutSession(requests.Session):
+    """ 带默认超时的 Session，调用方没有显式传入 timeout 时使用 default_timeout """
+    def __init__(self,default_timeout:Union[float,Tuple[float,float],None] = DEFAULT_TIMEOUT):
+        super().__init__()
+        self.default_timeout = default_timeout
+
+    def request(self,method,url,**kwargs):
+        kwargs.setdefault("timeout",self.default_timeout)
+        return super().request(method,url,**kwargs)
+
+def create_session(
+    timeout:Union[float,Tuple[float,float],None] = DEFAULT_TIMEOUT,
+    retries:int = 3,
+    backoff_factor:float = 0.3,
+    pool_connections:int = 10,
+    pool_maxsize:int = 20,
+    status_forcelist:tuple = RETRY_STATUS_CODES
+) -> TimeoutSession:
+    """
+    创建一个带连接池、重试和默认超时的 Session。
+
+    Args:
+        timeout: 默认超时，可以是单个秒数或 (连接超时, 读取超时)。
+        retries: 连接错误和 status_forcelist 中状态码的最大重试次数。
+        backoff_factor: 指数退避的基数，第 n 次重试前大约等待 backoff_factor * 2**(n-1) 秒（带抖动）。
+        pool_connections: 缓存的连接池个数（按主机区分）。
+        pool_maxsize: 每个连接池保持的最大连接数，并发调用同一主机时需要足够大。
+        status_forcelist: 需要重试的HTTP状态码。
+    """
+    retry = JitteredRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        # 只重试幂等的请求方法
+        allowed_methods=frozenset({"GET","HEAD","OPTIONS"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry,pool_connections=pool_connections,pool_maxsize=pool_maxsize)
+    session = TimeoutSession(default_timeout=timeout)
+    session.mount("https://",adapter)
+    session.mount("http://",adapter)
+    return session
+
+_sessions:Dict[str,TimeoutSession] = {}
+_sessions_lock = threading.Lock()
+
+def get_session(name:str = "default",**kwargs) -> TimeoutSession:
+    """
+    按名称返回进程内共享的 Session，第一次调用时创建。
+    同一个名称的所有调用复用同一个连接池，TCP/TLS 握手只在第一次请求时发生。
+
+    Args:
+        name: 会话名称，不同的上游可以使用不同的会话，互不影响连接池和重试配置。
+        **kwargs: 第一次创建时传给 create_session 的参数，之后的调用会忽略。
+    """
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        if name not in _sessions:
+            _sessions[name] = create_session(**kwargs)
+        return _sessions[name]
+
+def close_sessions():
+    """ 关闭所有共享会话，释放连接池 """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+_tavily_clients:Dict[str,object] = {}
+
+def get_tavily_client(api_key:Optional[str] = None):
+    """
+    按 API 密钥返回共享的 TavilyClient，避免每次搜索都重新创建客户端。
+
+    Raises:
+        ImportError: 没有安装 tavily-python。
+        ValueError: 没有提供密钥，且环境变量 TAVILY_API_KEY 也未设置。
+    """
+    api_key = api_key or os.getenv("TAVILY_API_KEY")
+    if not api_key:
+        raise ValueError("未配置TAVILY_API_KEY")
+    client = _tavily_clients.get(api_key)
+    if client is None:
+        from tavily import TavilyClient
+        with _sessions_lock:
+            client = _tavily_clients.setdefault(api_key,TavilyClient(api_key=api_key))
+    return client
@@ -0,0 +1,188 @@
+# LLM响应缓存
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional,List,Dict,Any,Iterator,Literal
+
+# 默认的持久化缓存文件，与记忆数据 memory.db 放在同一目录下
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),"memory_data","llm_cache.db")
+
+def _content_to_text(content:Any) -> str:
+    """ 把消息内容统一成字符串，兼容 Message.to_dict 产生的列表形式内容 """
+    if isinstance(content,list):
+        return "".join(part if isinstance(part,str) else json.dumps(part,ensure_ascii=False,sort_keys=True) for part in content)
+    return "" if content is None else str(content)
+
+def normalize_messages(messages:List[Dict[str,Any]]) -> List[List[str]]:
+    """
+    归一化消息列表：只去掉每条消息首尾的空白。
+    内部的空白保持原样，代码缩进、换行不同的提示词不会被当成同一个请求。
+    """
+    normalized = []
+    for message in messages:
+        text = _content_to_text(message.get("content")).strip()
+        normalized.append([message.get("role",""),text])
+    return normalized
+
+def make_cache_key(
+    model:str,
+    temperature:Optional[float],
+    messages:List[Dict[str,Any]],
+    key_mode:Literal["normalized","exact"] = "normalized",
+    params:Optional[Dict[str,Any]] = None
+) -> str:
+    """
+    根据 (模型, 温度, 消息列表, 请求参数) 生成缓存键。
+
+    Args:
+        key_mode: "normalized" 使用归一化后的消息；"exact" 使用原始消息，任何字符差异都会产生不同的键。
+        params: 其他影响回复内容的请求参数，如 max_tokens、stop、tools，参数不同的请求不会互相命中。
+    """
+    if key_mode == "normalized":
+        payload_messages = normalize_messages(messages)
+    elif key_mode == "exact":
+        payload_messages = [[m.get("role",""),_content_to_text(m.get("content"))] for m in messages]
+    else:
+        raise ValueError(f"不支持的key_mode:{key_mode}.支持的是'normalized'或'exact'")
+    payload = json.dumps([model,temperature,payload_messages,params or {}],ensure_ascii=False,sort_keys=True,default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryLRUCache:
+    """ 带TTL的内存LRU缓存后端 """
+    def __init__(self,max_size:int = 1024,ttl:Optional[float] = 3600):
+        self.max_size = max_size
+        self.ttl = ttl # 过期时间（秒），None 表示永不过期
+        self._data:"OrderedDict[str,tuple]" = OrderedDict() # key -> (value, 写入时间)
+        self._lock = threading.Lock()
+
+    def get(self,key:str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value,created_at = item
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                del self._data[key]
+                return None
+            # 命中后移到末尾，表示最近使用
+            self._data.move_to_end(key)
+            return value
+
+    def set(self,key:str,value:str):
+        with self._lock:
+            self._data[key] = (value,time.time())
+            self._data.move_to_end(key)
+            # 超出容量时淘汰最久未使用的条目
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SQLiteCache:
+    """ 基于SQLite文件的持久化缓存后端，进程重启后缓存依然有效 """
+    def __init__(self,path:str = DEFAULT_CACHE_PATH,ttl:Optional[float] = 7 * 24 * 3600,table:str = "llm_cache"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+        self._lock = threading.Lock()
+        # 允许在多个线程中共用同一个连接，由 self._lock 保证串行访问
+        self._conn = sqlite3.connect(path,check_same_thread=False)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self,key:str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?",(key,)).fetchone()
+            if row is None:
+                return None
+            value,created_at = row
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?",(key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def set(self,key:str,value:str):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                (key,value,time.time())
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+class LLMResponseCache:
+    """
+    LLM响应缓存。
+    在 MyLLM.invoke / stream_invoke 之前查询缓存，命中时直接返回，避免重复的API调用。
+    后端可以是 MemoryLRUCache 或 SQLiteCache，也可以是任何提供 get/set 方法的对象。
+    """
+    def __init__(
+        self,
+        backend:Optional[Any] = None,
+        key_mode:Literal["normalized","exact"] = "normalized",
+        replay_chunk_size:int = 16
+    ):
+        self.backend = backend if backend is not None else MemoryLRUCache()
+        self.key_mode = key_mode
+        self.replay_chunk_size = replay_chunk_size # 流式重放时每个文本块的字符数
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self,model:str,temperature:Optional[float],messages:List[Dict[str,Any]],params:Optional[Dict[str,Any]] = None) -> str:
+        return make_cache_key(model,temperature,messages,self.key_mode,params)
+
+    def get(self,model:str,temperature:Optional[float],messages:List[Dict[str,Any]],params:Optional[Dict[str,Any]] = None) -> Optional[str]:
+        """ 查询缓存，并更新命中/未命中统计 """
+        value = self.backend.get(self.key(model,temperature,messages,params))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self,model:str,temperature:Optional[float],messages:List[Dict[str,Any]],response:str,params:Optional[Dict[str,Any]] = None):
+        """ 写入缓存，空回复不缓存 """
+        if response:
+            self.backend.set(self.key(model,temperature,messages,params),response)
+
+    def replay(self,response:str) -> Iterator[str]:
+        """ 把缓存的完整回复切成小块，模拟流式输出 """
+        for start in range(0,len(response),self.replay_chunk_size):
+            yield response[start:start + self.replay_chunk_size]
+
+    def stats(self) -> Dict[str,Any]:
+        """ 返回命中次数、未命中次数和命中率 """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits":self.hits,
+                "misses":self.misses,
+                "hit_rate":self.hits / total if total else 0.0,
+                "size":len(self.backend),
+            }
@@ -13,6 +13,22 @@ MY_DEFAULT_PROMPT = """
 '''
 """
 
+# DAG 规划提示词模版：每个步骤显式声明依赖，互不依赖的步骤可以并行执行
+MY_DAG_PLANNER_PROMPT = """
+你是一个顶级的AI规划专家。你的任务是将用户提出的复杂问题分解成一个由多个简单步骤组成的行动计划。
+请为每个步骤指定一个从1开始的编号id，并在deps中列出它所依赖的前置步骤的id。
+如果一个步骤不需要任何前置步骤的结果，deps为空列表，这样它可以与其他步骤并行执行。
+最后一个步骤必须汇总所需的结果，给出问题的最终答案。
+
+问题:
+{question}
+
+请严格按照以下格式输出你的计划：
+```python
+[{{"id":1,"step":"步骤1","deps":[]}},{{"id":2,"step":"步骤2","deps":[]}},{{"id":3,"step":"步骤3","deps":[1,2]}},...]
+```
+"""
+
 # 默认执行器提示词模版
 DEFAULT_EXECUTOR_PROMPT = """
 你是一位顶级的AI执行专家。你的任务是严格按照给定的计划，一步步地解决问题。
@@ -36,30 +52,100 @@ DEFAULT_EXECUTOR_PROMPT = """
 
 # 导入必要的库
 import ast  # 用于安全地评估字符串形式的Python字面量（如列表）
-from typing import Optional, List, Dict, Any  # 用于类型注解，增强代码可读性和健壮性
+from typing import Optional, List, Dict, Any, Union, Literal  # 用于类型注解，增强代码可读性和健壮性
 from hello_agents import HelloAgentsLLM  # 导入自定义的大语言模型客户端
-from agent import Agent  # 导入基础Agent类
+from agent import Agent, LLMRequest, Submit, WaitAny, RunSteps, drive_steps  # 导入基础Agent类以及步骤驱动相关工具
 from messages import Message  # 导入消息类，用于记录对话历史
 from config import Config  # 导入配置类
+from token_utils import estimate_tokens  # 用于估算提示词的token数量
+
+def normalize_plan(plan: List[Union[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    将计划统一转换为 DAG 形式：[{"id":1,"step":"...","deps":[...]}, ...]。
+
+    - 线性计划（字符串列表）被视为一条链：每一步依赖上一步。
+    - DAG 计划中引用了不存在的步骤、存在重复id或出现环时，退回到按列表顺序的链式计划。
+
+    Args:
+        plan: 字符串列表或带依赖的字典列表。
+
+    Returns:
+        List[Dict[str, Any]]: 按拓扑顺序排列的步骤列表。
+
+    Raises:
+        ValueError: 步骤的 id 不是整数或字符串，或 deps 不是由整数/字符串组成的列表。
+    """
+    if all(isinstance(item, str) for item in plan):
+        return [{"id": i, "step": step, "deps": [i - 1] if i > 1 else []} for i, step in enumerate(plan, 1)]
+
+    steps = []
+    for i, item in enumerate(plan, 1):
+        if isinstance(item, dict):
+            step_id = item.get("id", i)
+            deps = item.get("deps", []) or []
+            if not isinstance(step_id, (int, str)) or isinstance(step_id, bool):
+                raise ValueError(f"第{i}个步骤的id必须是整数或字符串，实际为: {step_id!r}")
+            if not isinstance(deps, (list, tuple)):
+                raise ValueError(f"步骤{step_id}的deps必须是列表，实际为: {deps!r}")
+            if not all(isinstance(dep, (int, str)) and not isinstance(dep, bool) for dep in deps):
+                raise ValueError(f"步骤{step_id}的deps只能包含步骤id，实际为: {deps!r}")
+            steps.append({
+                "id": step_id,
+                "step": str(item.get("step", "")),
+                "deps": list(deps)
+            })
+        else:
+            steps.append({"id": i, "step": str(item), "deps": []})
+
+    ids = [step["id"] for step in steps]
+    valid = len(set(ids)) == len(ids) and all(dep in ids for step in steps for dep in step["deps"])
+    ordered = _topological_order(steps) if valid else None
+    if ordered is None:
+        print("⚠️ 计划中的依赖关系无效，按列表顺序串行执行")
+        return normalize_plan([step["step"] for step in steps])
+    return ordered
+
+def _topological_order(steps: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """ 对步骤做拓扑排序（同层保持原有顺序），存在环时返回 None """
+    remaining = list(steps)
+    done = set()
+    ordered = []
+    while remaining:
+        ready = [step for step in remaining if all(dep in done for dep in step["deps"])]
+        if not ready:
+            return None
+        for step in ready:
+            ordered.append(step)
+            done.add(step["id"])
+            remaining.remove(step)
+    return ordered
 
 class Planner:
     """
     规划器 (Planner) - 负责将用户的复杂问题分解为一系列更简单、可执行的步骤。
     这是实现“规划与解决”模式的第一步。
     """
-    def __init__(self, llm_client: HelloAgentsLLM, prompt_template: Optional[str] = None):
+    def __init__(
+        self,
+        llm_client: HelloAgentsLLM,
+        prompt_template: Optional[str] = None,
+        plan_mode: Literal["linear", "dag"] = "linear"
+    ):
         """
         初始化规划器。
 
         Args:
             llm_client (HelloAgentsLLM): 用于与大语言模型交互的客户端实例。
-            prompt_template (Optional[str]): 可选的自定义提示词模板。如果未提供，则使用默认模板 MY_DEFAULT_PROMPT。
+            prompt_template (Optional[str]): 可选的自定义提示词模板。如果未提供，则根据 plan_mode 使用默认模板。
+            plan_mode (str): "linear" 生成字符串列表形式的线性计划；"dag" 生成带依赖关系的计划。
         """
         self.llm_client = llm_client  # 保存LLM客户端实例
-        # 如果用户没有提供自定义模板，则使用默认的规划提示词模板
-        self.prompt_template = prompt_template if prompt_template else MY_DEFAULT_PROMPT
+        self.plan_mode = plan_mode
+        # 如果用户没有提供自定义模板，则使用与规划模式对应的默认提示词模板
+        default_template = MY_DAG_PLANNER_PROMPT if plan_mode == "dag" else MY_DEFAULT_PROMPT
+        self.prompt_template = prompt_template if prompt_template else default_template
 
-    def plan(self, question: str, **kwargs) -> List[str]:
+    def plan(self, question: str, **kwargs) -> List[Union[str, Dict[str, Any]]]:
         """
         根据用户的问题生成一个行动计划。
 
@@ -68,7 +154,15 @@ class Planner:
             **kwargs: 传递给LLM调用的额外参数 (例如 temperature, max_tokens等)。
 
         Returns:
-            List[str]: 一个包含多个步骤描述字符串的列表。如果生成或解析失败，则返回空列表。
+            List: 线性模式下是步骤描述字符串的列表；DAG 模式下是 {"id","step","deps"} 字典的列表。
+                  如果生成或解析失败，则返回空列表。
+        """
+        return drive_steps(self.plan_steps(question, **kwargs), self.llm_client)
+
+    def plan_steps(self, question: str, **kwargs) -> RunSteps:
+        """
+        plan 的步骤生成器版本：yield 一次 LLM 调用请求，返回解析后的计划列表。
+        同步的 plan 和 Agent 的 arun/astream 共用这一份提示词构建与解析逻辑。
         """
         # 将用户问题填充到提示词模板中，生成完整的prompt
         prompt = self.prompt_template.format(question=question)
@@ -77,7 +171,7 @@ class Planner:
 
         print("--- 正在生成计划 ---")
         # 调用LLM，获取生成的计划文本。如果返回None，则默认为空字符串。
-        response_text = self.llm_client.invoke(messages, **kwargs) or ""
+        response_text = yield LLMRequest(messages, kwargs)
         print(f"✅ 计划已生成:\n{response_text}")
 
         try:
@@ -87,7 +181,10 @@ class Planner:
             # 使用 ast.literal_eval 安全地将字符串转换为Python列表对象，避免eval()的安全风险
             plan = ast.literal_eval(plan_str)
             # 确保解析结果确实是一个列表，否则返回空列表
-            return plan if isinstance(plan, list) else []
+            if not isinstance(plan, list):
+                return []
+            # DAG 模式下统一成带依赖的字典列表，并校验依赖关系
+            return normalize_plan(plan) if self.plan_mode == "dag" and plan else plan
         except (ValueError, SyntaxError, IndexError) as e:
             # 捕获解析过程中可能出现的错误（如格式不正确，找不到代码块等）
             print(f"❌ 解析计划时出错: {e}")
@@ -98,62 +195,237 @@ class Planner:
             print(f"❌ 解析计划时发生未知错误: {e}")
             return []
 
+class HistoryManager:
+    """
+    执行历史管理器 - 在 token 预算内渲染步骤历史与计划。
+
+    - 历史整体不超过预算时，所有步骤原样保留；
+    - 超出预算时，最近 keep_recent 个步骤原样保留，更早的步骤压缩为一行：结果只保留前 truncate_chars 个字符
+      （这是截断而不是由 LLM 生成的摘要，按步骤缓存，逐步累积）；
+    - 仍然超出时，从最早的截断行开始合并为一句省略说明，最后才截断最近步骤的结果。
+    计划列表过长时，只展示当前步骤附近的若干步。
+    """
+    def __init__(self, token_budget: int = 2000, keep_recent: int = 2, truncate_chars: int = 80, plan_window: int = 8):
+        """
+        Args:
+            token_budget (int): 历史部分的token预算。
+            keep_recent (int): 原样保留的最近步骤数。
+            truncate_chars (int): 较早步骤压缩为一行时，结果保留的字符数。
+            plan_window (int): 计划列表超过该步数时，只展示当前步骤前后各一半的步骤。
+        """
+        self.token_budget = token_budget
+        self.keep_recent = max(0, keep_recent)
+        self.truncate_chars = truncate_chars
+        self.plan_window = plan_window
+        self._truncated_lines: Dict[Any, str] = {}  # 步骤id -> 截断后的一行
+
+    def reset(self):
+        """ 开始执行新计划前清空截断行缓存 """
+        self._truncated_lines.clear()
+
+    @staticmethod
+    def _verbatim(record: Dict[str, Any]) -> str:
+        return f"步骤{record['id']}:{record['step']}\n 结果:{record['result']}\n\n"
+
+    def _truncated_line(self, record: Dict[str, Any]) -> str:
+        """ 把一个步骤压缩为一行，结果截断到 truncate_chars 个字符，同一步骤只处理一次 """
+        if record["id"] not in self._truncated_lines:
+            result = " ".join(str(record["result"]).split())
+            if len(result) > self.truncate_chars:
+                result = result[:self.truncate_chars] + "..."
+            self._truncated_lines[record["id"]] = f"步骤{record['id']}:{record['step']} → {result}\n"
+        return self._truncated_lines[record["id"]]
+
+    def render_history(self, records: List[Dict[str, Any]]) -> str:
+        """
+        在预算内渲染历史。
+
+        Args:
+            records: 按执行顺序排列的 {"id","step","result"} 列表。
+        """
+        full = "".join(self._verbatim(record) for record in records)
+        if estimate_tokens(full) <= self.token_budget:
+            return full
+
+        split = max(len(records) - self.keep_recent, 0)
+        older, recent = records[:split], records[split:]
+        recent_text = "".join(self._verbatim(record) for record in recent)
+        lines = [self._truncated_line(record) for record in older]
+
+        # 从最早的截断行开始省略，直到满足预算
+        omitted = 0
+        while lines and estimate_tokens("".join(lines) + recent_text) > self.token_budget:
+            lines.pop(0)
+            omitted += 1
+        header = f"(已省略更早的{omitted}个步骤)\n" if omitted else ""
+        older_text = header + ("较早步骤(结果已截断):\n" + "".join(lines) + "\n" if lines else "")
+
+        # 仍然超出预算时，把剩余预算平均分给最近的步骤，截断它们的结果
+        remaining = self.token_budget - estimate_tokens(older_text)
+        if recent and estimate_tokens(recent_text) > remaining:
+            share = max(remaining // len(recent), 0)
+            recent_text = ""
+            for record in recent:
+                result = str(record["result"])
+                while result and estimate_tokens(result) > share:
+                    result = result[:len(result) * 3 // 4]
+                recent_text += self._verbatim({**record, "result": result + "..."})
+        return older_text + recent_text
+
+    def render_plan(self, step_texts: List[str], current_index: int) -> str:
+        """
+        渲染计划列表，格式与直接把列表填入提示词时相同（Python 列表的字符串形式）。
+        过长时只展示当前步骤附近的步骤，被省略的部分用列表中的说明项代替。
+        """
+        total = len(step_texts)
+        if total <= self.plan_window:
+            return str(step_texts)
+        half = self.plan_window // 2
+        start = min(max(current_index - half, 0), total - self.plan_window)
+        end = start + self.plan_window
+        shown = list(step_texts[start:end])
+        if start > 0:
+            shown.insert(0, f"...(前{start}步省略)")
+        if end < total:
+            shown.append(f"...(后{total - end}步省略，共{total}步)")
+        return str(shown)
+
 class Executor:
     """
     执行器 (Executor) - 负责按照规划器生成的计划，一步步地执行任务。
     它会在执行每一步时，都考虑原始问题、完整计划以及之前步骤的结果。
     """
-    def __init__(self, llm_client: HelloAgentsLLM, prompt_template: Optional[str] = None):
+    def __init__(
+        self,
+        llm_client: HelloAgentsLLM,
+        prompt_template: Optional[str] = None,
+        max_concurrency: int = 4,
+        history_manager: Optional[HistoryManager] = None
+    ):
         """
         初始化执行器。
 
         Args:
             llm_client (HelloAgentsLLM): 用于与大语言模型交互的客户端实例。
             prompt_template (Optional[str]): 可选的自定义执行提示词模板。如果未提供，则使用默认模板 DEFAULT_EXECUTOR_PROMPT。
+            max_concurrency (int): 同时执行的互不依赖步骤的最大数量。
+            history_manager (Optional[HistoryManager]): 历史管理器，控制每步提示词中历史与计划的长度。
         """
         self.llm_client = llm_client  # 保存LLM客户端实例
         # 如果用户没有提供自定义模板，则使用默认的执行提示词模板
         self.prompt_template = prompt_template if prompt_template else DEFAULT_EXECUTOR_PROMPT
+        self.max_concurrency = max(1, max_concurrency)
+        self.history_manager = history_manager or HistoryManager()
+        # 每一步提示词的token统计，用于观察历史压缩带来的节省
+        self.step_token_counts: List[Dict[str, Any]] = []
 
-    def execute(self, question: str, plan: List[str], **kwargs) -> str:
+    def execute(self, question: str, plan: List[Union[str, Dict[str, Any]]], **kwargs) -> str:
         """
-        按顺序执行计划中的每一个步骤，并返回最终结果。
+        按依赖关系执行计划中的每一个步骤，并返回最终结果。
 
         Args:
             question (str): 用户的原始问题。
-            plan (List[str]): 由规划器生成的步骤列表。
+            plan (List): 由规划器生成的步骤列表，线性的字符串列表会被当作一条链来执行。
             **kwargs: 传递给LLM调用的额外参数。
 
         Returns:
             str: 执行完所有步骤后得到的最终答案。
         """
-        history = ""  # 用于存储已完成步骤及其结果的字符串，作为后续步骤的上下文
-        final_answer = ""  # 用于存储最后一个步骤的输出作为最终答案
+        return drive_steps(self.execute_steps(question, plan, **kwargs), self.llm_client)
 
-        print("\n--- 正在执行计划 ---")
-        # 遍历计划中的每一个步骤，并带上索引（从1开始）
-        for i, step in enumerate(plan, 1):
-            print(f"\n -> 正在执行步骤 {i}/{len(plan)}:{step}")
+    def execute_steps(self, question: str, plan: List[Union[str, Dict[str, Any]]], **kwargs) -> RunSteps:
+        """
+        execute 的步骤生成器版本，按依赖关系调度：
+        每个步骤在它自己的依赖全部完成后立即提交（Submit），同时执行的步骤不超过 max_concurrency 个，
+        再逐个取回先完成的结果（WaitAny），不会因为无关的慢步骤而等待。
+        每个步骤的 history 只包含它的祖先步骤的结果。
+        只有一个步骤可以执行、且没有其他步骤在执行时直接 yield 请求；
+        计划中最后一个步骤的输出就是最终答案，它的请求被标记为 final，便于 astream 流式输出。
+        """
+        steps = normalize_plan(plan)
+        step_texts = [step["step"] for step in steps]
+        ancestors = self._collect_ancestors(steps)
+        results: Dict[Any, str] = {}  # 步骤id -> 执行结果
+        last_id = steps[-1]["id"] if steps else None
+        positions = {step["id"]: index for index, step in enumerate(steps)}
+        self.history_manager.reset()
+        self.step_token_counts = []
+
+        def build_request(step: Dict[str, Any]) -> LLMRequest:
+            print(f"\n -> 正在执行步骤 {step['id']}/{len(steps)}:{step['step']}")
+            # 只把祖先步骤的结果作为历史上下文，并由历史管理器控制在预算之内
+            records = [
+                {"id": other["id"], "step": other["step"], "result": results[other["id"]]}
+                for other in steps if other["id"] in ancestors[step["id"]]
+            ]
+            history = self.history_manager.render_history(records)
             # 准备当前步骤的提示词，包含所有必要的上下文信息
             prompt = self.prompt_template.format(
                 question=question,
-                plan=plan,
+                plan=self.history_manager.render_plan(step_texts, positions[step["id"]]),
                 history=history if history else "无",  # 如果历史为空，则显示"无"
-                current_step=step
+                current_step=step["step"]
             )
+            self._record_token_count(step["id"], prompt, history, records)
             # 构造LLM API的消息
             messages = [{"role": "user", "content": prompt}]
+            return LLMRequest(messages, kwargs, final=(step["id"] == last_id))
 
-            # 调用LLM执行当前步骤
-            response_text = self.llm_client.invoke(messages, **kwargs) or ""
-            # 将当前步骤和其结果追加到历史记录中，为下一步提供上下文
-            history += f"步骤{i}:{step}\n 结果:{response_text}\n\n"
-            # 更新最终答案为当前步骤的结果（循环结束后，这将是最后一个步骤的结果）
-            final_answer = response_text
-            print(f"✅ 步骤{i}已完成，结果:{final_answer}")
-
-        # 返回最后一个步骤的执行结果作为整个任务的最终答案
-        return final_answer
+        print("\n--- 正在执行计划 ---")
+        pending = list(steps)
+        in_flight = 0  # 已经提交、还没有取回结果的步骤数
+        while pending or in_flight:
+            ready = [step for step in pending if all(dep in results for dep in step["deps"])]
+            if not in_flight and len(ready) == 1:
+                # 没有其他步骤可以并行，直接 yield 请求，最终步骤可以被流式输出
+                step = ready[0]
+                pending.remove(step)
+                self._record_result(step, (yield build_request(step)), results)
+                continue
+            # 在并发上限之内，提交所有依赖都已完成的步骤
+            for step in ready[:self.max_concurrency - in_flight]:
+                pending.remove(step)
+                request = build_request(step)
+                if in_flight:
+                    print(f"⚡ 步骤{step['id']}与其他{in_flight}个步骤并行执行")
+                yield Submit(step["id"], request)
+                in_flight += 1
+            # 取回最先完成的步骤，依赖它的步骤在下一轮就可以提交
+            step_id, response_text = yield WaitAny()
+            in_flight -= 1
+            self._record_result(steps[positions[step_id]], response_text, results)
+
+        # 返回计划中最后一个步骤的执行结果作为整个任务的最终答案
+        return results.get(last_id, "")
+
+    @staticmethod
+    def _record_result(step: Dict[str, Any], response_text: str, results: Dict[Any, str]):
+        results[step["id"]] = response_text
+        print(f"✅ 步骤{step['id']}已完成，结果:{response_text}")
+
+    def _record_token_count(self, step_id: Any, prompt: str, history: str, records: List[Dict[str, Any]]):
+        """ 记录本步提示词的token数，以及不做任何压缩时历史部分的token数 """
+        uncompressed = sum(estimate_tokens(HistoryManager._verbatim(record)) for record in records)
+        count = {
+            "step": step_id,
+            "prompt_tokens": estimate_tokens(prompt),
+            "history_tokens": estimate_tokens(history),
+            "uncompressed_history_tokens": uncompressed,
+        }
+        self.step_token_counts.append(count)
+        print(f"📏 步骤{step_id}提示词约 {count['prompt_tokens']} tokens (历史 {count['history_tokens']}/{uncompressed})")
+
+    @staticmethod
+    def _collect_ancestors(steps: List[Dict[str, Any]]) -> Dict[Any, set]:
+        """ 计算每个步骤的全部祖先步骤id（步骤已按拓扑顺序排列） """
+        ancestors: Dict[Any, set] = {}
+        for step in steps:
+            collected = set()
+            for dep in step["deps"]:
+                collected.add(dep)
+                collected |= ancestors[dep]
+            ancestors[step["id"]] = collected
+        return ancestors
 
 class PlanAndSolveAgent(Agent):
     """
@@ -172,7 +444,10 @@ class PlanAndSolveAgent(Agent):
         llm_client: HelloAgentsLLM,
         system_prompt: Optional[str] = None,
         config: Optional[Config] = None,
-        custom_prompts: Optional[Dict[str, str]] = None
+        custom_prompts: Optional[Dict[str, str]] = None,
+        plan_mode: Literal["linear", "dag"] = "linear",
+        max_concurrency: int = 4,
+        history_manager: Optional[HistoryManager] = None
     ):
         """
         初始化 Plan and Solve Agent。
@@ -183,6 +458,9 @@ class PlanAndSolveAgent(Agent):
             system_prompt (Optional[str]): 系统的顶级提示词（如果需要）。
             config (Optional[Config]): 配置对象。
             custom_prompts (Optional[Dict[str, str]]): 一个包含自定义提示词模板的字典，键为 "planner" 和 "executor"。
+            plan_mode (str): "linear" 为线性计划，"dag" 为带依赖关系、可并行执行的计划。
+            max_concurrency (int): DAG 模式下同时执行的步骤数上限。
+            history_manager (Optional[HistoryManager]): 执行历史管理器，用于控制每步提示词的token预算。
         """
         # 调用父类Agent的构造函数进行基本初始化
         super().__init__(name, llm_client, system_prompt, config)
@@ -196,9 +474,9 @@ class PlanAndSolveAgent(Agent):
             executor_prompt = None
 
         # 实例化规划器组件
-        self.planner = Planner(llm_client, planner_prompt)
+        self.planner = Planner(llm_client, planner_prompt, plan_mode=plan_mode)
         # 实例化执行器组件
-        self.executor = Executor(llm_client, executor_prompt)
+        self.executor = Executor(llm_client, executor_prompt, max_concurrency=max_concurrency, history_manager=history_manager)
 
     def run(self, input_text: str, **kwargs) -> str:
         """
@@ -211,10 +489,14 @@ class PlanAndSolveAgent(Agent):
         Returns:
             str: 问题的最终答案。
         """
+        return drive_steps(self._run_steps(input_text, **kwargs), self.llm)
+
+    def _run_steps(self, input_text: str, **kwargs) -> RunSteps:
+        """ 规划与执行两个阶段的步骤生成器，同时供 run 和 arun/astream 驱动 """
         print(f"\n🤖:{self.name}开始处理问题{input_text}")
 
         # --- 阶段1: 生成计划 ---
-        plan = self.planner.plan(input_text, **kwargs)
+        plan = yield from self.planner.plan_steps(input_text, **kwargs)
         # 检查计划是否成功生成
         if not plan:
             # 如果计划列表为空，说明规划失败，任务无法继续
@@ -228,7 +510,7 @@ class PlanAndSolveAgent(Agent):
             return final_answer
 
         # --- 阶段2: 执行计划 ---
-        final_answer = self.executor.execute(input_text, plan, **kwargs)
+        final_answer = yield from self.executor.execute_steps(input_text, plan, **kwargs)
         print(f"\n --- 任务完成 ---\n最终答案:{final_answer}")
 
         # 将成功的交互（用户问题和最终答案）记录到历史消息中
@@ -1,10 +1,102 @@
 import os
 # 导入os模块，用于访问环境变量，例如获取API密钥
-from typing import Optional,List,Dict,Any
+import time
+import bisect
+import threading
+# 计时、直方图分桶以及线程锁
+from concurrent.futures import ThreadPoolExecutor,wait,FIRST_COMPLETED
+# 线程池用于同时向多个搜索源发起请求
+from typing import Optional,List,Dict,Any,Literal,Tuple,Union
 # 导入类型提示，增强代码的可读性和健壮性
+from search_cache import SearchResultCache
+# 搜索结果缓存，相同（或仅有空白、大小写差异）的查询不再重复调用API
+from source_health import SourceHealthTracker
+# 搜索源健康度跟踪与熔断，持续失败的搜索源会被暂时跳过
+from http_session import get_session,get_tavily_client
+# 共享的HTTP会话与客户端，复用连接，避免每次查询都重新握手
+
+# SerpAPI 的 JSON 接口，直接用共享会话请求，不再每次查询都创建 serpapi.GoogleSearch
+SERPAPI_ENDPOINT = "https://serpapi.com/search.json"
 from hello_agents import ToolRegistry
 # 从hello_agents库导入ToolRegistry，用于注册和管理工具
 
+# 搜索源在结果中显示的名称
+SOURCE_LABELS = {"tavily":"Tavily","serper":"Serper"}
+
+class LatencyHistogram:
+    """
+    单个搜索源的延迟直方图。
+    按固定的毫秒边界分桶计数，内存占用恒定，可以粗略估算任意分位数。
+    """
+    # 各个桶的上边界（毫秒），最后一个桶收纳所有更慢的请求
+    DEFAULT_BOUNDS = (50,100,250,500,1000,2500,5000,10000)
+
+    def __init__(self,bounds:tuple = DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0 # 总请求数
+        self.errors = 0 # 失败（异常或结果无效）的请求数
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self,seconds:float,ok:bool = True):
+        """ 记录一次请求的耗时 """
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds,ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            if not ok:
+                self.errors += 1
+
+    def percentile(self,q:float) -> Optional[float]:
+        """ 估算第 q 分位（0~100）的延迟，返回所在桶的上边界（毫秒）；没有数据时返回 None """
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = self.count * q / 100
+            seen = 0
+            for index,bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= target and bucket_count:
+                    return float(self.bounds[index]) if index < len(self.bounds) else float("inf")
+            return float("inf")
+
+    def snapshot(self) -> Dict[str,Any]:
+        """ 返回直方图的快照，桶用 "<=上边界ms" 作为键 """
+        with self._lock:
+            buckets = {f"<={bound}ms":count for bound,count in zip(self.bounds,self.counts)}
+            buckets[f">{self.bounds[-1]}ms"] = self.counts[-1]
+            count,errors,total_ms = self.count,self.errors,self.total_ms
+        return {
+            "count":count,
+            "errors":errors,
+            "mean_ms":total_ms / count if count else 0.0,
+            "p50_ms":self.percentile(50),
+            "p95_ms":self.percentile(95),
+            "buckets":buckets,
+        }
+
+class _FetchAttempt:
+    """
+    并发模式下发往一个搜索源的一次请求。
+    请求结束和调用方超时放弃两者谁先发生，谁就把结果记入健康度跟踪器，保证每次请求只记录一次。
+    """
+    def __init__(self,source:str,timeout:float):
+        self.source = source
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self._claimed = False
+        self._lock = threading.Lock()
+
+    def claim(self) -> bool:
+        """ 取得记录权，只有第一次调用返回 True """
+        with self._lock:
+            if self._claimed:
+                return False
+            self._claimed = True
+            return True
+
 class MyAdvancedSearchTool:
     """
     自定义高级搜索工具类。
@@ -12,15 +104,50 @@ class MyAdvancedSearchTool:
     并根据可用性自动选择最佳的搜索源。
     这种模式提高了工具的鲁棒性和适应性。
     """
-    def __init__(self):
+    def __init__(
+        self,
+        mode:Literal["sequential","race","merge"] = "sequential",
+        source_timeout:float = 10.0,
+        merge_timeout:float = 5.0,
+        max_results:int = 5,
+        cache:Optional[SearchResultCache] = None,
+        health:Optional[SourceHealthTracker] = None
+    ):
         """
         类的构造函数（初始化方法）。
         在创建类的实例时被调用，用于设置初始属性。
+
+        Args:
+            mode: 搜索模式。
+                "sequential" 按顺序逐个尝试搜索源（原有行为）；
+                "race" 同时查询所有搜索源，返回第一个通过校验的结果，其余请求被放弃；
+                "merge" 同时查询所有搜索源，最多等待 merge_timeout 秒，把各源结果去重后统一排序。
+            source_timeout: race 模式下等待第一个有效结果的最长时间（秒）。
+            merge_timeout: merge 模式下等待各搜索源的最长时间（秒），超时未返回的源被忽略。
+            max_results: merge 模式下输出的最大结果条数。
+            cache: 搜索结果缓存，为空时不缓存。只有成功的结果会被缓存，TTL 由返回结果的搜索源决定。
+            health: 搜索源健康度跟踪器，为空时使用默认配置创建一个。
+                搜索源按观测到的错误率和p95延迟排序，熔断中的搜索源会被跳过。
         """
+        if mode not in ("sequential","race","merge"):
+            raise ValueError(f"不支持的搜索模式:{mode}.支持的是'sequential'、'race'或'merge'")
         self.name = "my_advanced_search"  # 定义工具的名称
         self.description = "智能搜索工具，支持多个搜索源，自动选择最佳结果"  # 定义工具的功能描述
+        self.mode = mode
+        self.source_timeout = source_timeout
+        self.merge_timeout = merge_timeout
+        self.max_results = max_results
+        self.cache = cache
+        self.health = health if health is not None else SourceHealthTracker()
         self.search_sources = []  # 初始化一个空列表，用于存储可用的搜索源名称
         self._setup_search_sources()  # 调用内部方法来检测和配置可用的搜索源
+        # 每个搜索源一个延迟直方图，所有模式下的请求都会被记录
+        self.latency_histograms:Dict[str,LatencyHistogram] = {source:LatencyHistogram() for source in self.search_sources}
+        # 并发模式共用的线程池，第一次并发查询时创建，close() 时关闭。被放弃的请求仍会在后台跑完，所以线程数留出余量
+        self._executor:Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # 已提交但还没有记入健康度的并发请求，超过截止时间仍未结束的会被记为失败
+        self._inflight:set = set()
 
     def _setup_search_sources(self):
         """
@@ -30,10 +157,8 @@ class MyAdvancedSearchTool:
         # 检查名为"TAVILY_API_KEY"的环境变量是否存在
         if os.getenv("TAVILY_API_KEY"):
             try:
-                # 尝试导入Tavily客户端库
-                from tavily import TavilyClient
-                # 如果导入成功，则创建Tavily客户端实例
-                self.tavily = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+                # 获取进程内共享的Tavily客户端实例（第一次调用时创建）
+                self.tavily = get_tavily_client(os.getenv("TAVILY_API_KEY"))
                 # 将'tavily'添加到可用搜索源列表中
                 self.search_sources.append("tavily")
                 print("Tavily搜索源已启用")
@@ -44,15 +169,10 @@ class MyAdvancedSearchTool:
         # --- 检查Serper搜索源的可用性 ---
         # 检查名为"SERPER_API_KEY"的环境变量是否存在
         if os.getenv("SERPER_API_KEY"):
-            try:
-                # 尝试导入serpapi库以确认其可用性
-                import serpapi
-                # 将'serper'添加到可用搜索源列表中
-                self.search_sources.append("serper")
-                print("Serper搜索源已启用")
-            except ImportError:
-                # 如果serpapi库没有安装，则捕获ImportError并打印提示信息
-                print("Serper库未安装")
+            # 直接调用HTTP接口，不再依赖serpapi库
+            # 将'serper'添加到可用搜索源列表中
+            self.search_sources.append("serper")
+            print("Serper搜索源已启用")
         
         # 在设置完成后，打印最终的可用搜索源列表
         if self.search_sources:
@@ -64,7 +184,7 @@ class MyAdvancedSearchTool:
     def search(self,query:str) -> str:
         """
         执行智能搜索的核心公共方法。
-        它会按顺序尝试所有已启用的搜索源，直到获得一个有效结果为止。
+        它会按搜索源的健康度顺序尝试所有已启用且未熔断的搜索源，直到获得一个有效结果为止。
         """
         # 检查输入的查询字符串是否为空或只包含空格
         if not query.strip():
@@ -81,42 +201,286 @@ class MyAdvancedSearchTool:
     """ 
         print(f"开始智能搜索:{query}")
 
+        if self.cache is not None:
+            # 不同模式的结果格式不同，按模式划分缓存命名空间
+            return self.cache.get_or_fetch(query,self._search_uncached,namespace=f"{self.name}:{self.mode}")
+        return self._search_uncached(query)[0]
+
+    def _search_uncached(self,query:str) -> Tuple[str,Union[str,List[str],None]]:
+        """
+        按当前模式执行一次真实的搜索。
+
+        Returns:
+            (结果文本, 结果所属的搜索源)；所有搜索源都失败时搜索源为 None，结果不会被缓存。
+        """
+        # 按健康度排序，熔断中的搜索源不参与本次搜索
+        sources = self.health.ordered(self.search_sources)
+        if not sources:
+            return "所有搜索源都暂时不可用(已熔断)，请稍后重试",None
+        if self.mode == "race":
+            return self._search_race(query,sources)
+        if self.mode == "merge":
+            return self._search_merge(query,sources)
+        return self._search_sequential(query,sources)
+
+    def _search_sequential(self,query:str,sources:List[str]) -> Tuple[str,Optional[str]]:
+        """ 顺序模式：按健康度从高到低依次尝试搜索源，直到获得一个有效结果为止 """
         # --- 依次尝试所有可用的搜索源 ---
-        # 遍历在_setup_search_sources中初始化的搜索源列表
-        for source in self.search_sources:
+        for source in sources:
+            # 熔断器可能在排序之后打开，或者半开状态下的探测名额已被其他查询占用
+            if not self.health.allow(source):
+                continue
             try:
-                # 如果当前搜索源是 'tavily'
-                if source == "tavily":
-                    result = self._search_with_tavily(query)
-                    # 检查结果是否有效（非空且不包含错误信息）
-                    if result and "未找到" not in result:
-                        return f"Tavily搜索结果是:{result}"  # 如果有效，立即返回结果
-
-                # 如果当前搜索源是 'serper'
-                elif source == "serper":
-                    result = self._search_with_serper(query)
-                    # 检查结果是否有效
-                    if result and "未找到" not in result:
-                        return f"Serper搜索结果是:{result}"  # 如果有效，立即返回结果
-            
+                data = self._timed_fetch(source,query)
+                # 检查结构化结果是否有效（有搜索结果或直接答案），有效才格式化并立即返回
+                if self._is_valid(data):
+                    return f"{SOURCE_LABELS[source]}搜索结果是:{self._format(source,data)}",source
             except Exception as e:
                 # 如果在调用某个搜索源API时发生任何异常，打印错误信息并继续尝试下一个源
                 print(f"{source}搜索失败:{e}")
                 continue
 
         # 如果遍历完所有搜索源都没有成功返回结果，则返回最终的失败信息
-        return "所有搜索源都失败了，请检查网络和API"
+        return "所有搜索源都失败了，请检查网络和API",None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """ 返回并发模式共用的线程池，不存在（或已被 close 关闭）时创建 """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(2,len(self.search_sources) * 2),thread_name_prefix="search")
+            return self._executor
+
+    def close(self,wait:bool = False):
+        """
+        关闭并发模式的线程池，取消还没开始的请求。之后再发起并发查询会重新创建线程池。
+
+        Args:
+            wait: 是否等待仍在执行的请求结束。
+        """
+        with self._executor_lock:
+            executor,self._executor = self._executor,None
+        if executor is not None:
+            executor.shutdown(wait=wait,cancel_futures=True)
+
+    def __enter__(self) -> "MyAdvancedSearchTool":
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
+
+    def _submit_all(self,query:str,sources:List[str],timeout:float) -> Dict[Any,_FetchAttempt]:
+        """
+        向熔断器放行的每个搜索源提交一个请求，返回 future -> 请求。
+        timeout 是请求的截止时间（秒），超过后仍未结束的请求会被记为该搜索源的一次失败。
+        """
+        executor = self._get_executor()
+        self._expire_overdue()
+        futures = {}
+        for source in sources:
+            if not self.health.allow(source):
+                continue
+            attempt = _FetchAttempt(source,timeout)
+            with self._executor_lock:
+                self._inflight.add(attempt)
+            futures[executor.submit(self._timed_fetch,source,query,attempt)] = attempt
+        return futures
+
+    def _expire(self,attempt:_FetchAttempt):
+        """ 调用方不再等待一个还没结束的请求：记为该搜索源的一次失败，让一直挂起的搜索源也能触发熔断 """
+        with self._executor_lock:
+            self._inflight.discard(attempt)
+        if attempt.claim():
+            print(f"{attempt.source}搜索超时，记为失败")
+            self.health.record(attempt.source,time.monotonic() - attempt.started,False)
+
+    def _expire_overdue(self):
+        """ 把超过截止时间仍未结束的请求（包括竞速中被放弃的请求）记为失败 """
+        now = time.monotonic()
+        with self._executor_lock:
+            overdue = [attempt for attempt in self._inflight if attempt.deadline <= now]
+        for attempt in overdue:
+            self._expire(attempt)
+
+    def _cancel_pending(self,futures:Dict[Any,_FetchAttempt],pending:set,expire:bool = False):
+        """
+        取消还没开始的请求，并归还它们占用的熔断探测名额。
+        expire 为 True 时，已经在执行、无法取消的请求立即记为失败（已到截止时间）。
+        """
+        for future in pending:
+            attempt = futures[future]
+            if future.cancel():
+                attempt.claim()
+                with self._executor_lock:
+                    self._inflight.discard(attempt)
+                self.health.release(attempt.source)
+            elif expire:
+                self._expire(attempt)
+
+    def _search_race(self,query:str,sources:List[str]) -> Tuple[str,Optional[str]]:
+        """
+        竞速模式：同时向所有搜索源发起请求，返回最先完成且通过校验的结果。
+        一个慢或者失败的搜索源不会再拖慢整个查询。
+        """
+        futures = self._submit_all(query,sources,self.source_timeout)
+        pending = set(futures)
+        deadline = time.monotonic() + self.source_timeout
+        timed_out = False
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                done,pending = wait(pending,timeout=remaining,return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = futures[future].source
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        print(f"{source}搜索失败:{e}")
+                        continue
+                    # 空结果不算赢得竞速，继续等待其他搜索源
+                    if self._is_valid(data):
+                        return f"{SOURCE_LABELS[source]}搜索结果是:{self._format(source,data)}",source
+        finally:
+            # 取消还没开始的请求；已经在执行的请求无法中断，结果会被直接丢弃。
+            # 超时时它们记为失败；竞速已有赢家时它们继续在后台执行，结束（或超过截止时间）时再记录
+            self._cancel_pending(futures,pending,expire=timed_out)
+        return "所有搜索源都失败了，请检查网络和API",None
+
+    def _search_merge(self,query:str,sources:List[str]) -> Tuple[str,Optional[List[str]]]:
+        """
+        合并模式：同时向所有搜索源发起请求，在 merge_timeout 内收集所有返回的结果，
+        按链接去重后用倒数排名融合（RRF）排序：多个搜索源都靠前返回的结果排在前面。
+        """
+        futures = self._submit_all(query,sources,self.merge_timeout)
+        if not futures:
+            return "所有搜索源都暂时不可用(已熔断)，请稍后重试",None
+        done,pending = wait(futures,timeout=self.merge_timeout)
+        # 超时未返回的搜索源记为失败
+        self._cancel_pending(futures,pending,expire=True)
+
+        answers = []
+        responded = []
+        merged:Dict[str,Dict[str,Any]] = {}
+        # 按搜索源的健康度顺序处理，保证同分时结果稳定
+        for future,attempt in futures.items():
+            source = attempt.source
+            if future not in done:
+                continue
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"{source}搜索失败:{e}")
+                continue
+            if not self._is_valid(data):
+                continue
+            responded.append(source)
+            if data.get("answer"):
+                answers.append(data["answer"])
+            for rank,item in enumerate(data.get("items",[]),1):
+                key = self._dedup_key(item)
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = {**item,"score":0.0,"sources":[]}
+                elif len(item.get("snippet","")) > len(entry.get("snippet","")):
+                    # 同一条结果保留更完整的摘要
+                    entry["snippet"] = item["snippet"]
+                entry["score"] += 1.0 / (60 + rank)
+                entry["sources"].append(source)
+
+        if not responded:
+            return "所有搜索源都失败了，请检查网络和API",None
+
+        ranked = sorted(merged.values(),key=lambda entry:entry["score"],reverse=True)[:self.max_results]
+        result = f"合并搜索结果(来源:{', '.join(SOURCE_LABELS[source] for source in responded)}):\n"
+        if answers:
+            result += f"AI直接答案:{answers[0]}\n\n"
+        for i,entry in enumerate(ranked,1):
+            sources = "/".join(SOURCE_LABELS[source] for source in entry["sources"])
+            result += f"[{i}] {entry.get('title','')} ({sources})\n"
+            result += f"    {entry.get('snippet','')[:150]}\n\n"
+        return result,responded
+
+    @staticmethod
+    def _dedup_key(item:Dict[str,Any]) -> str:
+        """ 去重键：优先使用去掉协议、www 和末尾斜杠的链接，没有链接时使用标题 """
+        url = (item.get("url") or "").strip().lower()
+        if url:
+            url = url.split("://",1)[-1]
+            if url.startswith("www."):
+                url = url[4:]
+            return url.rstrip("/")
+        return "title:" + (item.get("title") or "").strip().lower()
+
+    @staticmethod
+    def _is_valid(data:Optional[Dict[str,Any]]) -> bool:
+        """
+        结果校验：在格式化之前检查结构化结果，至少有一条搜索结果或一个直接答案。
+        格式化后的文本总带有标题行，不能用来判断是否搜到了内容。
+        """
+        return bool(data) and bool(data.get("items") or data.get("answer"))
+
+    def _timed_fetch(self,source:str,query:str,attempt:Optional[_FetchAttempt] = None) -> Dict[str,Any]:
+        """
+        调用单个搜索源，把耗时记入该源的延迟直方图，并把结果报告给健康度跟踪器。
+        只有抛出异常（或并发模式下超过截止时间）才算作搜索源故障，没有搜到结果不影响熔断。
+        attempt 已经因超时被记为失败时，不再重复记录健康度。
+        """
+        fetch = self._fetch_tavily if source == "tavily" else self._fetch_serper
+        start = time.perf_counter()
+        ok = False
+        raised = True
+        try:
+            data = fetch(query)
+            raised = False
+            ok = self._is_valid(data)
+            return data
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency_histograms[source].record(elapsed,ok)
+            if attempt is not None:
+                with self._executor_lock:
+                    self._inflight.discard(attempt)
+            if attempt is None or attempt.claim():
+                self.health.record(source,elapsed,not raised)
+
+    def _format(self,source:str,data:Dict[str,Any]) -> str:
+        """ 把搜索源的结构化结果格式化为文本 """
+        return self._format_tavily(data) if source == "tavily" else self._format_serper(data)
+
+    def latency_stats(self) -> Dict[str,Dict[str,Any]]:
+        """ 返回每个搜索源的延迟直方图快照 """
+        return {source:histogram.snapshot() for source,histogram in self.latency_histograms.items()}
+
+    def health_stats(self) -> Dict[str,Dict[str,Any]]:
+        """ 返回每个搜索源的熔断状态、滚动错误率和p95延迟 """
+        self._expire_overdue()
+        return self.health.snapshot()
 
     def _search_with_tavily(self,query:str) -> str:
         """
         使用Tavily API执行搜索的内部方法。
         """
+        return self._format_tavily(self._fetch_tavily(query))
+
+    def _fetch_tavily(self,query:str) -> Dict[str,Any]:
+        """ 调用Tavily API，返回结构化结果 {"answer","items":[{"title","url","snippet"}]} """
         # 调用Tavily客户端的search方法，设置查询和最大结果数
         response = self.tavily.search(query=query,max_results=3)
+        return {
+            "answer":response.get("answer"),
+            "items":[
+                {"title":item.get("title",""),"url":item.get("url",""),"snippet":item.get("content","")}
+                for item in response.get("results",[])
+            ],
+        }
 
+    @staticmethod
+    def _format_tavily(data:Dict[str,Any]) -> str:
         # 检查Tavily是否返回了AI生成的直接答案
-        if response.get("answer"):
-            result = f"AI直接答案:{response['answer']}\n\n"
+        if data.get("answer"):
+            result = f"AI直接答案:{data['answer']}\n\n"
         else:
             result = " "
         
@@ -124,11 +488,11 @@ class MyAdvancedSearchTool:
         result += "相关结果:\n"
 
         # 遍历返回的搜索结果列表（最多取前3个）
-        for i, item in enumerate(response.get('results', [])[:3], 1):
+        for i, item in enumerate(data.get('items', [])[:3], 1):
             # 格式化每条结果，包括序号、标题和内容摘要
             result += f"[{i}] {item.get('title', '')}\n"
             # 内容摘要只取前150个字符，以保持简洁
-            result += f"    {item.get('content', '')[:150]}...\n\n"
+            result += f"    {item.get('snippet', '')[:150]}...\n\n"
 
         return result
 
@@ -136,41 +500,55 @@ class MyAdvancedSearchTool:
         """
         使用Serper (Google Search) API执行搜索的内部方法。
         """
-        # 在函数内部导入serpapi，这是一种延迟加载的模式
-        import serpapi
+        return self._format_serper(self._fetch_serper(query))
 
-        # 创建GoogleSearch对象并配置参数
-        search = serpapi.GoogleSearch({
+    def _fetch_serper(self,query:str) -> Dict[str,Any]:
+        """ 调用Serper (Google Search) API，返回结构化结果 {"answer","items":[{"title","url","snippet"}]} """
+        # 通过共享会话请求，连接池里的连接会被后续查询复用；暂时性错误由会话自动重试
+        response = get_session("serpapi").get(SERPAPI_ENDPOINT,params={
+            "engine":"google",
             "q":query,  # 设置搜索查询
             "api_key":os.getenv("SERPER_API_KEY"),  # 从环境变量获取API密钥
             "num":3  # 请求返回的结果数量
-        })   
+        })
+        response.raise_for_status()
 
-        # 执行搜索并获取字典格式的返回结果
-        results = search.get_dict()
+        # 获取字典格式的返回结果
+        results = response.json()
+        return {
+            "answer":None,
+            "items":[
+                {"title":res.get("title",""),"url":res.get("link",""),"snippet":res.get("snippet","")}
+                for res in results.get("organic_results",[])
+            ],
+        }
 
+    @staticmethod
+    def _format_serper(data:Dict[str,Any]) -> str:
         # 初始化结果字符串
         result = "Google搜索结果:\n"
-        # 检查响应中是否包含'organic_results'（自然搜索结果）
-        if "organic_results" in results:
-            # 遍历自然搜索结果列表（最多取前3个）
-            for i, res in enumerate(results["organic_results"][:3], 1):
-                # 格式化每条结果，包括序号、标题和摘要（snippet）
-                result += f"[{i}] {res.get('title', '')}\n"
-                result += f"    {res.get('snippet', '')}\n\n"
+        # 遍历自然搜索结果列表（最多取前3个）
+        for i, res in enumerate(data.get("items",[])[:3], 1):
+            # 格式化每条结果，包括序号、标题和摘要（snippet）
+            result += f"[{i}] {res.get('title', '')}\n"
+            result += f"    {res.get('snippet', '')}\n\n"
             
         return result
 
-def create_advanced_search_registry():
+def create_advanced_search_registry(mode:Literal["sequential","race","merge"] = "sequential",**kwargs):
     """
     一个工厂函数，用于创建并配置一个包含高级搜索工具的ToolRegistry实例。
     这个函数封装了工具的实例化和注册过程。
+
+    Args:
+        mode: 搜索模式，见 MyAdvancedSearchTool。
+        **kwargs: 透传给 MyAdvancedSearchTool 的其他参数（source_timeout、merge_timeout 等）。
     """
     # 创建一个ToolRegistry的实例
     registry = ToolRegistry()
 
     # 创建MyAdvancedSearchTool工具的实例
-    search_tool = MyAdvancedSearchTool()
+    search_tool = MyAdvancedSearchTool(mode=mode,**kwargs)
 
     # 将search_tool实例的search方法注册到registry中
     registry.register_function(
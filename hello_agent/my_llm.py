@@ -1,8 +1,145 @@
 import os
-from typing import Optional
-from openai import OpenAI # 穷人家的孩子没有openai的api，所以使用gemini的api
+import time
+import asyncio
+import threading
+import weakref
+from typing import Optional,AsyncIterator,Iterator,Dict,Any,Tuple
+from openai import OpenAI,AsyncOpenAI,DefaultHttpxClient,DefaultAsyncHttpxClient # 穷人家的孩子没有openai的api，所以使用gemini的api
+import httpx
 import google.generativeai as genai
 from hello_agents import HelloAgentsLLM
+from llm_cache import LLMResponseCache
+
+class LLMClientRegistry:
+    """
+    进程级的LLM客户端注册表。
+    按 (provider, base_url, api_key, timeout) 复用 OpenAI 客户端及其底层的 HTTP 连接池，
+    避免每创建一个 Agent / LLM 实例就重新建立连接池和 TLS 握手。
+
+    - 连接池大小、keep-alive 过期时间可通过 configure 配置；
+    - 超过 idle_ttl 秒没有被取用的客户端会从注册表中移除并关闭，释放连接池。
+      因此调用方不要长期持有客户端，每次请求前都通过 get_client / get_async_client 取用（MyLLM 就是这样做的）；
+    - hits / misses 计数器可用于观察复用效果。
+    """
+    def __init__(
+        self,
+        max_connections:int = 20,
+        max_keepalive_connections:int = 10,
+        keepalive_expiry:float = 30.0,
+        idle_ttl:float = 600.0
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        # 同步客户端: key -> {"client":OpenAI,"last_used":时间戳}
+        self._clients:Dict[Tuple,Dict[str,Any]] = {}
+        # 异步客户端的连接绑定在事件循环上，因此按事件循环分别保存，事件循环被回收后自动释放
+        self._async_clients:"weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self,**options):
+        """ 修改连接池配置，只影响之后新建的客户端。可选项与构造函数参数相同。 """
+        for key,value in options.items():
+            if not hasattr(self,key) or key.startswith("_"):
+                raise ValueError(f"未知的连接池配置项:{key}")
+            setattr(self,key,value)
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _lookup(self,entries:Dict[Tuple,Dict[str,Any]],key:Tuple,factory) -> Any:
+        """ 在给定的条目字典中查找客户端，不存在则用 factory 创建。调用方需持有锁。 """
+        now = time.monotonic()
+        self._evict_idle(entries,now)
+        entry = entries.get(key)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = {"client":factory()}
+            entries[key] = entry
+        entry["last_used"] = now
+        return entry["client"]
+
+    def _evict_idle(self,entries:Dict[Tuple,Dict[str,Any]],now:float,loop:Optional[asyncio.AbstractEventLoop] = None):
+        """ 移除并关闭空闲超时的客户端。loop 不为空时表示这些是绑定在该事件循环上的异步客户端 """
+        expired = [key for key,entry in entries.items() if now - entry["last_used"] > self.idle_ttl]
+        for key in expired:
+            self._close(entries.pop(key)["client"],loop)
+            self.evictions += 1
+
+    @staticmethod
+    def _close(client:Any,loop:Optional[asyncio.AbstractEventLoop] = None):
+        """ 关闭客户端，释放底层连接池。异步客户端要在它所属的事件循环中关闭 """
+        try:
+            if loop is None:
+                client.close()
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(lambda:loop.create_task(client.close()))
+        except Exception as e:
+            print(f"关闭LLM客户端失败:{e}")
+
+    def get_client(self,provider:str,base_url:Optional[str],api_key:Optional[str],timeout:float) -> OpenAI:
+        """ 获取共享的同步客户端 """
+        key = (provider,base_url,api_key,timeout)
+        with self._lock:
+            return self._lookup(self._clients,key,lambda:OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=timeout,
+                http_client=DefaultHttpxClient(limits=self._limits())
+            ))
+
+    def get_async_client(self,provider:str,base_url:Optional[str],api_key:Optional[str],timeout:float) -> AsyncOpenAI:
+        """ 获取当前事件循环中共享的异步客户端，必须在协程中调用 """
+        loop = asyncio.get_running_loop()
+        key = (provider,base_url,api_key,timeout)
+        with self._lock:
+            entries = self._async_clients.setdefault(loop,{})
+            self._evict_idle(entries,time.monotonic(),loop)
+            return self._lookup(entries,key,lambda:AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=timeout,
+                http_client=DefaultAsyncHttpxClient(limits=self._limits())
+            ))
+
+    def evict_idle(self):
+        """ 立即清理所有空闲超时的客户端 """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(self._clients,now)
+            for loop,entries in self._async_clients.items():
+                self._evict_idle(entries,now,loop)
+
+    def stats(self) -> Dict[str,int]:
+        """ 返回注册表的命中、未命中、淘汰次数以及当前缓存的客户端数量 """
+        with self._lock:
+            return {
+                "hits":self.hits,
+                "misses":self.misses,
+                "evictions":self.evictions,
+                "clients":len(self._clients),
+                "async_clients":sum(len(entries) for entries in self._async_clients.values()),
+            }
+
+# 全局共享的客户端注册表
+client_registry = LLMClientRegistry(
+    max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS","20")),
+    max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE","10")),
+    idle_ttl=float(os.getenv("LLM_POOL_IDLE_TTL","600"))
+)
+
+# 不参与响应缓存键计算的请求参数：温度单独计入，其余只影响请求的传输方式
+_CACHE_IGNORED_PARAMS = ("temperature","stream","timeout","extra_headers")
 
 class MyLLM(HelloAgentsLLM):
     def __init__(
@@ -11,8 +148,11 @@ class MyLLM(HelloAgentsLLM):
         api_key:Optional[str] = None,
         base_url:Optional[str] = None,
         provider:Optional[str] = "auto",
+        cache:Optional[LLMResponseCache] = None,
         **kwargs
     ):
+        # 可选的响应缓存，为 None 时不启用缓存
+        self.cache = cache
     
         # 检查provider是否为我们想处理的“modelscope”
         if provider == "modelscope":
@@ -32,10 +172,103 @@ class MyLLM(HelloAgentsLLM):
             self.temperature = kwargs.get("temperature",0.7)
             self.max_tokens = kwargs.get("max_tokens")
             self.timeout = kwargs.get("timeout",60)
-
-        # 使用获取的参数创建OpenAI客户端实例
-            self._client = OpenAI(api_key=self.api_key,base_url=self.base_url,timeout=self.timeout)
+            # OpenAI客户端由全局注册表统一管理，见 _client 属性
 
         else:
-            # 如果不是modelscope，则完全使用父类的原始逻辑来处理
-            super().__init__(model=model,api_key=api_key,base_url=base_url,provider=provider,**kwargs)
\ No newline at end of file
+            # 如果不是modelscope，则使用父类的原始逻辑解析配置；
+            # 父类创建客户端时调用的 _create_client 已被重写，不会再新建连接池
+            super().__init__(model=model,api_key=api_key,base_url=base_url,provider=provider,**kwargs)
+
+    def _create_client(self) -> OpenAI:
+        """ 重写父类方法：从全局注册表获取共享的OpenAI客户端，相同配置的实例复用同一个连接池 """
+        return client_registry.get_client(self.provider,self.base_url,self.api_key,self.timeout)
+
+    @property
+    def _client(self) -> OpenAI:
+        """ 每次使用时都从注册表取用，空闲淘汰后的客户端已经关闭，这里会拿到新建的客户端 """
+        return self._create_client()
+
+    @_client.setter
+    def _client(self,client:OpenAI):
+        # 客户端由注册表统一管理，忽略父类构造函数中的赋值
+        pass
+
+    def _cache_params(self,**kwargs) -> dict:
+        """ 参与缓存键计算的请求参数：除温度（单独计入）和只影响传输的参数外，其余参数都会改变回复内容 """
+        params = {k:v for k,v in kwargs.items() if k not in _CACHE_IGNORED_PARAMS}
+        params["max_tokens"] = kwargs.get("max_tokens",self.max_tokens)
+        return params
+
+    def _cache_lookup(self,messages:list,**kwargs) -> Optional[str]:
+        """ 查询响应缓存，未启用缓存或未命中时返回 None """
+        if self.cache is None:
+            return None
+        return self.cache.get(self.model,kwargs.get("temperature",self.temperature),messages,self._cache_params(**kwargs))
+
+    def _cache_store(self,messages:list,response:str,**kwargs):
+        if self.cache is not None:
+            self.cache.set(self.model,kwargs.get("temperature",self.temperature),messages,response,self._cache_params(**kwargs))
+
+    def invoke(self,messages:list,**kwargs) -> str:
+        """ 非流式调用，启用缓存时先查询缓存 """
+        cached = self._cache_lookup(messages,**kwargs)
+        if cached is not None:
+            return cached
+        response = super().invoke(messages,**kwargs)
+        self._cache_store(messages,response,**kwargs)
+        return response
+
+    def stream_invoke(self,messages:list,**kwargs) -> Iterator[str]:
+        """ 流式调用，缓存命中时把缓存的回复分块重放；未命中时边输出边累积，完整结束后写入缓存 """
+        cached = self._cache_lookup(messages,**kwargs)
+        if cached is not None:
+            yield from self.cache.replay(cached)
+            return
+        parts = []
+        for chunk in super().stream_invoke(messages,**kwargs):
+            parts.append(chunk)
+            yield chunk
+        self._cache_store(messages,"".join(parts),**kwargs)
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """ 从全局注册表获取当前事件循环中与同步客户端配置相同的异步客户端 """
+        return client_registry.get_async_client(self.provider,self.base_url,self.api_key,self.timeout)
+
+    def _completion_params(self,messages:list,**kwargs) -> dict:
+        """ 组装 chat.completions.create 的参数，与同步 invoke 的参数处理方式保持一致 """
+        params = {
+            "model":self.model,
+            "messages":messages,
+            "temperature":kwargs.get("temperature",self.temperature),
+            "max_tokens":kwargs.get("max_tokens",self.max_tokens),
+        }
+        params.update({k:v for k,v in kwargs.items() if k not in ("temperature","max_tokens")})
+        return params
+
+    async def ainvoke(self,messages:list,**kwargs) -> str:
+        """ invoke 的协程版本，一个事件循环可以同时等待大量请求而不占用线程 """
+        cached = self._cache_lookup(messages,**kwargs)
+        if cached is not None:
+            return cached
+        response = await self._get_async_client().chat.completions.create(**self._completion_params(messages,**kwargs))
+        content = response.choices[0].message.content
+        self._cache_store(messages,content,**kwargs)
+        return content
+
+    async def astream_invoke(self,messages:list,**kwargs) -> AsyncIterator[str]:
+        """ stream_invoke 的协程版本，逐块产出回复文本 """
+        cached = self._cache_lookup(messages,**kwargs)
+        if cached is not None:
+            for chunk in self.cache.replay(cached):
+                yield chunk
+            return
+        parts = []
+        stream = await self._get_async_client().chat.completions.create(stream=True,**self._completion_params(messages,**kwargs))
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content or ""
+            if content:
+                parts.append(content)
+                yield content
+        self._cache_store(messages,"".join(parts),**kwargs)
@@ -1,4 +1,6 @@
-MY_REACT_PROMPT = """你是一个具备推理和行动能力的AI助手。你可以通过思考分析问题，然后调用合适的工具来获取信息，最终给出准确的答案。
+# ReAct 提示词的公共部分：角色、可用工具、回应格式与重要提醒。
+# 完整模板与增量模式的静态前缀都由它拼接而成，修改说明时只需要改这一处
+_REACT_BASE_PROMPT = """你是一个具备推理和行动能力的AI助手。你可以通过思考分析问题，然后调用合适的工具来获取信息，最终给出准确的答案。
 
 ## 可用工具
 {tools}
@@ -16,24 +18,81 @@ Action: 选择一个行动，格式必须是以下之一:
 2. 工具调用的格式必须严格遵循:工具名[参数]
 3. 只有当你确信有足够信息回答问题时，才使用Finish
 4. 如果工具返回的信息不够，继续使用其他工具或相同工具的不同参数
+"""
 
-## 当前任务
+# 当前任务部分
+_REACT_TASK_PROMPT = """## 当前任务
 **Question:** {question}
+"""
 
+# 完整模板：公共部分 + 当前任务 + 执行历史，每一步整体渲染
+MY_REACT_PROMPT = _REACT_BASE_PROMPT + "\n" + _REACT_TASK_PROMPT + """
 ## 执行历史
 {history}
 
 现在开始你的推理和行动:
 """
 
+# 增量模式下的静态前缀：说明与工具描述，每个工具注册表版本只渲染一次
+MY_REACT_SYSTEM_PROMPT = _REACT_BASE_PROMPT + "5. 之前步骤的 Action 和 Observation 会以后续消息的形式给出\n"
+
+# 增量模式下的任务消息
+MY_REACT_QUESTION_PROMPT = _REACT_TASK_PROMPT + "\n现在开始你的推理和行动:"
+
 # my_react_agent.py
 import re
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Any
 from hello_agents import ReActAgent, HelloAgentsLLM, ToolRegistry
 from messages import Message
 from config import Config
+from agent import AsyncRunMixin, LLMRequest, ToolRequest, RunSteps, drive_steps
+from token_utils import estimate_messages_tokens
+from versioned_tool_registry import VersionedToolRegistry, ensure_versioned
+
+class ReActPromptBuilder:
+    """
+    增量式的 ReAct 提示词构建器。
 
-class MyReActAgent(ReActAgent):
+    静态前缀（说明 + 工具描述）按工具注册表的版本只渲染一次，作为 system 消息；
+    问题作为第一条 user 消息；之后每一步只追加一条 Action(assistant) 和一条 Observation(user) 消息。
+    这样每一步的消息列表都是上一步的前缀扩展，支持前缀缓存的服务商可以复用已计算的部分。
+    """
+
+    def __init__(self, system_template: str = MY_REACT_SYSTEM_PROMPT, question_template: str = MY_REACT_QUESTION_PROMPT):
+        self.system_template = system_template
+        self.question_template = question_template
+        self._prefix_version = None
+        self._prefix = ""
+        self._messages: List[Dict[str, str]] = []
+
+    def render_prefix(self, tool_registry: VersionedToolRegistry) -> str:
+        """ 返回静态前缀，注册表版本不变时直接复用上次渲染的结果 """
+        version = (id(tool_registry), tool_registry.version)
+        if version != self._prefix_version:
+            self._prefix = tool_registry.render(
+                ("react_prefix", self.system_template),
+                lambda tools_desc: self.system_template.format(tools=tools_desc)
+            )
+            self._prefix_version = version
+        return self._prefix
+
+    def start(self, tool_registry: VersionedToolRegistry, question: str):
+        """ 开始一个新任务：重置消息列表为 [静态前缀, 问题] """
+        self._messages = [
+            {"role": "system", "content": self.render_prefix(tool_registry)},
+            {"role": "user", "content": self.question_template.format(question=question)},
+        ]
+
+    def add_step(self, action: str, observation: str):
+        """ 追加一步的 Action 与 Observation """
+        self._messages.append({"role": "assistant", "content": f"Action: {action}"})
+        self._messages.append({"role": "user", "content": f"Observation: {observation}"})
+
+    def messages(self) -> List[Dict[str, str]]:
+        """ 返回当前消息列表的副本，避免调用方修改内部状态 """
+        return list(self._messages)
+
+class MyReActAgent(AsyncRunMixin, ReActAgent):
     """
     重写的ReAct Agent - 推理与行动结合的智能体
     """
@@ -49,36 +108,42 @@ class MyReActAgent(ReActAgent):
         custom_prompt: Optional[str] = None
     ):
         super().__init__(name, llm, system_prompt, config)
-        self.tool_registry = tool_registry
+        # 包装成带版本号的注册表，工具描述按版本缓存
+        self.tool_registry = ensure_versioned(tool_registry)
         self.max_steps = max_steps
         self.current_history: List[str] = []
         self.prompt_template = custom_prompt if custom_prompt else MY_REACT_PROMPT
+        # 自定义模板无法拆分出静态前缀，此时退回到每步完整渲染的方式
+        self.prompt_builder = None if custom_prompt else ReActPromptBuilder()
+        # 每一步发送给LLM的提示词大小
+        self.step_prompt_sizes: List[Dict[str, Any]] = []
         print(f"✅ {self.name} 初始化完成，最大步数: {max_steps}")
 
 
     def run(self, input_text: str, **kwargs) -> str:
         """重写父类方法，并运行ReAct Agent"""
+        return drive_steps(self._run_steps(input_text, **kwargs), self.llm)
+
+    def _run_steps(self, input_text: str, **kwargs) -> RunSteps:
+        """ReAct 循环的步骤生成器，同时供 run 和 arun/astream 驱动"""
         self.current_history = []
+        self.step_prompt_sizes = []
         current_step = 0
 
         print(f"\n🤖 {self.name} 开始处理问题: {input_text}")
+        if self.prompt_builder:
+            self.prompt_builder.start(self.tool_registry, input_text)
 
         while current_step < self.max_steps:
             current_step += 1
             print(f"\n--- 第 {current_step} 步 ---")
 
             # 1. 构建提示词
-            tools_desc = self.tool_registry.get_tools_description()
-            history_str = "\n".join(self.current_history)
-            prompt = self.prompt_template.format(
-                tools=tools_desc,
-                question=input_text,
-                history=history_str
-            )
+            messages = self._build_messages(input_text)
+            self._record_prompt_size(current_step, messages)
 
             # 2. 调用LLM
-            messages = [{"role": "user", "content": prompt}]
-            response_text = self.llm.invoke(messages, **kwargs)
+            response_text = yield LLMRequest(messages, kwargs)
 
             # 3. 解析输出
             thought, action = self._parse_output(response_text)
@@ -97,9 +162,11 @@ class MyReActAgent(ReActAgent):
             # 5. 执行工具调用
             if action:
                 tool_name, tool_input = self._parse_action(action)
-                observation = self.tool_registry.execute_tool(tool_name, tool_input)
+                observation = yield ToolRequest(self.tool_registry.execute_tool, (tool_name, tool_input))
                 self.current_history.append(f"Action: {action}")
                 self.current_history.append(f"Observation: {observation}")
+                if self.prompt_builder:
+                    self.prompt_builder.add_step(action, observation)
 
         # 达到最大步数
         final_answer = "抱歉，我无法在限定步数内完成这个任务。"
@@ -111,3 +178,20 @@ class MyReActAgent(ReActAgent):
         self.add_message(Message(final_answer, "assistant"))
         return final_answer
 
+    def _build_messages(self, input_text: str) -> List[Dict[str, str]]:
+        """构建本步的消息列表：默认使用增量构建器，自定义模板时完整渲染成一条用户消息"""
+        if self.prompt_builder:
+            return self.prompt_builder.messages()
+        prompt = self.prompt_template.format(
+            tools=self.tool_registry.get_tools_description(),
+            question=input_text,
+            history="\n".join(self.current_history)
+        )
+        return [{"role": "user", "content": prompt}]
+
+    def _record_prompt_size(self, step: int, messages: List[Dict[str, str]]):
+        """记录并打印本步提示词的大小"""
+        chars = sum(len(message["content"]) for message in messages)
+        tokens = estimate_messages_tokens(messages)
+        self.step_prompt_sizes.append({"step": step, "messages": len(messages), "chars": chars, "tokens": tokens})
+        print(f"📏 提示词大小: {len(messages)} 条消息, {chars} 字符, 约 {tokens} tokens")
@@ -25,10 +25,16 @@ DEFAULT_PROMPT = {
     """
 }
 
-from typing import Optional,List,Dict,Any
+import re
+import time
+import difflib
+from collections import Counter
+from typing import Optional,List,Dict,Any,Literal
 from hello_agents import HelloAgentsLLM,ReflectionAgent
 from messages import Message
 from config import Config
+from agent import AsyncRunMixin,LLMRequest,RunSteps,drive_steps
+from token_utils import estimate_tokens
 
 class Memory:
     """
@@ -60,7 +66,84 @@ class Memory:
                 return record['content']
         return ""
 
-class MyReflectionAgent(ReflectionAgent):
+class ConvergenceDetector:
+    """
+    收敛检测器，决定反思循环是否可以提前结束。
+
+    - 相邻两次执行结果的相似度达到阈值时，认为优化已经收敛；
+    - 累计 token 数或耗时超出预算时停止；
+    相似度使用廉价的指标：词片段(shingle)多重集上的 Jaccard 系数，或 difflib 的编辑相似度。
+    两者都考虑词序和重复次数，只是调换了段落顺序或重复了内容的草稿不会被误判为收敛。
+    """
+    def __init__(
+        self,
+        metric:Literal["jaccard","edit_ratio"] = "jaccard",
+        threshold:float = 0.95,
+        max_tokens:Optional[int] = None,
+        max_latency:Optional[float] = None,
+        shingle_size:int = 3
+    ):
+        """
+        Args:
+            metric: 相似度指标，"jaccard"（词片段多重集的 Jaccard 系数）或 "edit_ratio"。
+            threshold: 相似度达到该值即视为收敛。
+            max_tokens: 单次运行的token预算（提示词+回复的估算值），None 表示不限制。
+            max_latency: 单次运行的耗时预算（秒），None 表示不限制。
+            shingle_size: "jaccard" 指标中每个片段包含的连续词数。
+        """
+        if metric not in ("jaccard","edit_ratio"):
+            raise ValueError(f"不支持的相似度指标:{metric}.支持的是'jaccard'或'edit_ratio'")
+        self.metric = metric
+        self.threshold = threshold
+        self.max_tokens = max_tokens
+        self.max_latency = max_latency
+        self.shingle_size = max(1,shingle_size)
+        self.tokens_used = 0
+        self._start_time = time.monotonic()
+
+    def start(self):
+        """ 开始一次新的运行，重置计数 """
+        self.tokens_used = 0
+        self._start_time = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start_time
+
+    def add_usage(self,prompt:str,response:str):
+        """ 累计一次LLM调用的token估算值 """
+        self.tokens_used += estimate_tokens(prompt) + estimate_tokens(response)
+
+    @staticmethod
+    def _tokens(text:str) -> List[str]:
+        # 英文/数字按词切分，中文等其他字符按单字切分
+        return re.findall(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]",text.lower())
+
+    def _shingles(self,text:str) -> Counter:
+        """ 由连续 shingle_size 个词组成的片段及其出现次数，文本不足一个片段时整体作为一个片段 """
+        tokens = self._tokens(text)
+        size = min(self.shingle_size,len(tokens))
+        return Counter(tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)) if tokens else Counter()
+
+    def similarity(self,previous:str,current:str) -> float:
+        """ 计算两次执行结果的相似度，取值 0~1 """
+        if self.metric == "edit_ratio":
+            return difflib.SequenceMatcher(None,previous,current).ratio()
+        previous_shingles,current_shingles = self._shingles(previous),self._shingles(current)
+        if not previous_shingles and not current_shingles:
+            return 1.0
+        # 多重集 Jaccard：交集取较小的次数，并集取较大的次数
+        return sum((previous_shingles & current_shingles).values()) / sum((previous_shingles | current_shingles).values())
+
+    def budget_exceeded(self) -> Optional[str]:
+        """ 超出预算时返回停止原因，否则返回 None """
+        if self.max_tokens is not None and self.tokens_used >= self.max_tokens:
+            return "token_budget"
+        if self.max_latency is not None and self.elapsed >= self.max_latency:
+            return "latency_budget"
+        return None
+
+class MyReflectionAgent(AsyncRunMixin,ReflectionAgent):
     """
     重写的Reflection Agent - 反思与改进的智能体
     """
@@ -71,7 +154,8 @@ class MyReflectionAgent(ReflectionAgent):
         system_prompt:Optional[str] = None,
         config:Optional[Config] = None,
         max_iterations:int = 5,
-        custom_prompts:Optional[Dict[str,str]] = None
+        custom_prompts:Optional[Dict[str,str]] = None,
+        convergence:Optional[ConvergenceDetector] = None
         
         # ⭐️ [关键修复] ⭐️
         # 我们移除了 tool_registry:ToolRegistry
@@ -95,15 +179,27 @@ class MyReflectionAgent(ReflectionAgent):
         # (您的 Memory 和 prompts 逻辑保持不变)
         self.memory = Memory()
         self.prompts = custom_prompts if custom_prompts else DEFAULT_PROMPT
+        # 收敛检测：相邻结果近乎相同或超出预算时提前结束
+        self.convergence = convergence or ConvergenceDetector()
+        # 最近一次运行的结束原因，以及每轮迭代的相似度、token与耗时记录
+        self.stop_reason = ""
+        self.run_log:List[Dict[str,Any]] = []
         print(f"✅ {name} (反思智能体) 初始化完成。")
 
 
     def run(self,input_text:str,**kwargs) -> str:
         """ 重写父类方法，并运行Reflection Agent """
+        return drive_steps(self._run_steps(input_text,**kwargs),self.llm)
+
+    def _run_steps(self,input_text:str,**kwargs) -> RunSteps:
+        """ 反思循环的步骤生成器，同时供 run 和 arun/astream 驱动 """
         print(f"🤖{self.name}:开始处理任务:{input_text}")
 
-        # 重置记忆
+        # 重置记忆与收敛检测状态
         self.memory = Memory()
+        self.convergence.start()
+        self.stop_reason = "max_iterations"
+        self.run_log = []
         task = input_text # 为了清晰，我们重命名 input_text
 
         # 1.初始执行
@@ -112,12 +208,15 @@ class MyReflectionAgent(ReflectionAgent):
         # ⭐️ [修复] 确保 .format() 使用 'task'
         # (假设 'initial' 模板使用 {task})
         initial_prompt = self.prompts['initial'].format(task=task) 
-        initial_result = self._get_llm_response(initial_prompt,**kwargs)
+        initial_result = yield self._llm_request(initial_prompt,**kwargs)
+        self.convergence.add_usage(initial_prompt,initial_result)
         self.memory.add_record("execution",initial_result)
 
         # 2.迭代循环，反思与优化
         for i in range(self.max_iterations):
             print(f"\n---第{i+1}/{self.max_iterations}轮迭代---")
+            if self._check_budget():
+                break
 
             # a.反思
             print("\n -> 正在进行反思...")
@@ -129,12 +228,16 @@ class MyReflectionAgent(ReflectionAgent):
                 task = task,
                 code = last_result  # <-- 修复了 'content' -> 'code'
             )
-            feedback = self._get_llm_response(reflect_prompt,**kwargs)
+            feedback = yield self._llm_request(reflect_prompt,**kwargs)
+            self.convergence.add_usage(reflect_prompt,feedback)
             self.memory.add_record("reflection",feedback)
 
             # b.检查是否需要停止
             if "无需改进" in feedback or "no need for improvement" in feedback.lower():
                 print("\n✅ 反思认为结果已无需改进，任务完成。")
+                self.stop_reason = "no_improvement_needed"
+                break
+            if self._check_budget():
                 break
 
             # c.优化
@@ -147,11 +250,26 @@ class MyReflectionAgent(ReflectionAgent):
                 task = task,
                 feedback = feedback
             )
-            refined_result = self._get_llm_response(refine_prompt,**kwargs)
+            refined_result = yield self._llm_request(refine_prompt,**kwargs)
+            self.convergence.add_usage(refine_prompt,refined_result)
             self.memory.add_record("execution",refined_result)
+
+            # d.比较前后两次结果，近乎相同时说明继续优化已无意义
+            similarity = self.convergence.similarity(last_result,refined_result)
+            self.run_log.append({
+                "iteration":i + 1,
+                "similarity":similarity,
+                "tokens":self.convergence.tokens_used,
+                "elapsed":self.convergence.elapsed,
+            })
+            print(f"📐 与上一轮结果的相似度:{similarity:.3f}")
+            if similarity >= self.convergence.threshold:
+                print("\n✅ 优化结果已收敛，提前结束。")
+                self.stop_reason = "converged"
+                break
         
         final_result = self.memory.get_last_execution()
-        print(f"\n---任务完成---\n最终结果:\n{final_result}")
+        print(f"\n---任务完成({self.stop_reason})---\n最终结果:\n{final_result}")
 
         # 保存到历史记录
         self.add_message(Message(input_text,"user"))
@@ -159,6 +277,19 @@ class MyReflectionAgent(ReflectionAgent):
 
         return final_result
 
+    def _check_budget(self) -> bool:
+        """ 超出token或耗时预算时记录停止原因并返回 True """
+        reason = self.convergence.budget_exceeded()
+        if reason:
+            print(f"\n⏹️ 超出预算({reason})，停止迭代。")
+            self.stop_reason = reason
+            return True
+        return False
+
+    def _llm_request(self,prompt:str,**kwargs) -> LLMRequest:
+        """构造单条用户消息的LLM调用请求，由驱动器负责同步或异步地发起调用"""
+        return LLMRequest([{"role": "user", "content": prompt}],kwargs)
+
     def _get_llm_response(self, prompt: str, **kwargs) -> str:
         """调用LLM并获取完整响应"""
         messages = [{"role": "user", "content": prompt}]
@@ -1,8 +1,107 @@
-from typing import Optional,Iterator
+from typing import Optional,Iterator,Dict,List,Any
 from hello_agents import HelloAgentsLLM,SimpleAgent,Config,Message
+from async_tool_executor import AsyncToolExecutor
+from agent import AsyncRunMixin,LLMRequest,ToolRequest,RunSteps,drive_steps
+from versioned_tool_registry import VersionedToolRegistry,ensure_versioned
+from search_cache import SearchResultCache
+import asyncio
+import concurrent.futures
+import threading
+import weakref
+import time
+import json
 import re
 
-class MySimpleAgent(SimpleAgent):
+# 工具调用标记的格式: [TOOL_CALL:tool_name:parameters]
+TOOL_CALL_PREFIX = "[TOOL_CALL:"
+TOOL_CALL_PATTERN = re.compile(r'\[TOOL_CALL:([^:]+):([^\]]+)\]')
+
+# search 工具返回的出错/降级结果：错误前缀、没有搜到结果、某个搜索源失败的提示。这样的结果不写入缓存
+_SEARCH_ERROR_PREFIXES = ("错误：","错误:")
+_SEARCH_FAILURE_PATTERN = re.compile(r"❌ 未找到相关搜索结果|⚠️[^\n]*(搜索失败|未返回有效结果)")
+
+# 进程内所有 Agent 共用的后台事件循环，第一次并发调用工具时在一个守护线程中启动
+_tool_loop:Optional[asyncio.AbstractEventLoop] = None
+_tool_loop_lock = threading.Lock()
+
+def _shared_tool_loop() -> asyncio.AbstractEventLoop:
+    global _tool_loop
+    with _tool_loop_lock:
+        if _tool_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever,name="agent-tools",daemon=True).start()
+            _tool_loop = loop
+        return _tool_loop
+
+class _ToolCallStreamParser:
+    """
+    流式工具调用解析器。
+    逐块接收LLM的输出，一旦某个 `[TOOL_CALL:name:params]` 标记的右方括号到达，就立即产出该工具调用；
+    标记之外的文本原样产出。可能是标记开头的尾部文本会先暂存，等后续文本到达后再决定。
+    """
+    def __init__(self,detect_tools:bool = True):
+        self.detect_tools = detect_tools
+        self._buffer = ""
+
+    def feed(self,chunk:str) -> List[tuple]:
+        """
+        输入一个文本块，返回解析出的事件列表。
+        每个事件是 ("text",文本) 或 ("tool_call",工具调用字典) 二元组。
+        """
+        if not self.detect_tools:
+            return [("text",chunk)] if chunk else []
+
+        self._buffer += chunk
+        events = []
+        while self._buffer:
+            start = self._buffer.find(TOOL_CALL_PREFIX)
+            if start == -1:
+                # 没有完整的标记开头，保留可能是标记前缀的尾部
+                keep = self._partial_prefix_length(self._buffer)
+                text = self._buffer[:len(self._buffer) - keep]
+                if text:
+                    events.append(("text",text))
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+                break
+
+            if start > 0:
+                events.append(("text",self._buffer[:start]))
+                self._buffer = self._buffer[start:]
+
+            end = self._buffer.find("]")
+            if end == -1:
+                # 标记还没结束，等待更多文本
+                break
+
+            candidate = self._buffer[:end + 1]
+            self._buffer = self._buffer[end + 1:]
+            match = TOOL_CALL_PATTERN.fullmatch(candidate)
+            if match:
+                tool_name,parameters = match.groups()
+                events.append(("tool_call",{
+                    "tool_name":tool_name,
+                    "parameters":parameters.strip(),
+                    "original":candidate
+                }))
+            else:
+                # 形似标记但格式不对，按普通文本处理
+                events.append(("text",candidate))
+        return events
+
+    def flush(self) -> List[tuple]:
+        """ 流结束时调用，把暂存的剩余文本作为普通文本产出。 """
+        text,self._buffer = self._buffer,""
+        return [("text",text)] if text else []
+
+    @staticmethod
+    def _partial_prefix_length(text:str) -> int:
+        """ 返回 text 末尾与 TOOL_CALL_PREFIX 开头重合的最长长度。 """
+        for length in range(min(len(text),len(TOOL_CALL_PREFIX) - 1),0,-1):
+            if TOOL_CALL_PREFIX.startswith(text[-length:]):
+                return length
+        return 0
+
+class MySimpleAgent(AsyncRunMixin,SimpleAgent):
     """
     重写的简单对话Agent
     这个类是一个自定义Agent的示例，它继承自框架提供的`SimpleAgent`基类。
@@ -17,7 +116,13 @@ class MySimpleAgent(SimpleAgent):
         system_prompt:Optional[str] = None,
         config:Optional[Config] = None,
         tool_registry:Optional["ToolRegistry"] = None,
-        enable_tool_calling:bool = True
+        enable_tool_calling:bool = True,
+        parallel_tool_calls:bool = False,
+        max_tool_workers:int = 4,
+        tool_timeout:Optional[float] = 30.0,
+        tool_timeouts:Optional[Dict[str,float]] = None,
+        tool_concurrency:Optional[Dict[str,int]] = None,
+        search_cache:Optional[SearchResultCache] = None
     ):
         """
         Agent的初始化方法。
@@ -29,13 +134,32 @@ class MySimpleAgent(SimpleAgent):
         - config: Agent的配置选项。
         - tool_registry: 工具注册表，管理所有可用的工具。
         - enable_tool_calling: 是否启用工具调用功能的开关。
+        - parallel_tool_calls: 是否并发执行同一轮回复中的多个工具调用。
+        - max_tool_workers: 并发模式下线程池的最大工作线程数。
+        - tool_timeout: 并发模式下每个工具调用的默认超时时间（秒），None 表示不限制。
+        - tool_timeouts: 按工具名单独设置的超时时间，优先于 tool_timeout。
+        - tool_concurrency: 并发模式下按工具名限制同时执行的调用数，例如 {"search":2}。
+        - search_cache: `search` 工具的结果缓存，为空时不缓存。
         """
         # 调用父类的初始化方法，完成基本设置
         super().__init__(name,llm,system_prompt,config)
-        # 保存工具注册表实例
-        self.tool_registry = tool_registry
+        # 保存工具注册表实例，包装成带版本号的注册表以便缓存工具描述
+        self.tool_registry = ensure_versioned(tool_registry)
         # 确定是否启用工具调用：必须全局启用并且传入了工具注册表
         self.enable_tool_calling = enable_tool_calling and tool_registry is not None
+        # 并发工具调用相关配置
+        self.parallel_tool_calls = parallel_tool_calls
+        self.max_tool_workers = max_tool_workers
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.tool_concurrency = tool_concurrency or {}
+        self.search_cache = search_cache
+        # 最近一轮工具调用的耗时统计（按时完成的工具串行总耗时、超时个数、实际墙钟耗时、节省的时间）
+        self.last_tool_timing:Dict[str,Any] = {}
+        # 并发工具调用的调度器，第一次使用时创建；close()、退出 with 或 Agent 被回收时关闭它的线程池
+        self._tool_runtime_lock = threading.Lock()
+        self._tool_executor:Optional[AsyncToolExecutor] = None
+        self._tool_finalizer:Optional[weakref.finalize] = None
         # 打印初始化状态信息，方便调试
         print(f"{self.name}:初始化完成，工具调用：{'start' if self.enable_tool_calling else 'disabled'}")
 
@@ -53,6 +177,13 @@ class MySimpleAgent(SimpleAgent):
         返回:
         - LLM生成的最终回复字符串。
         """
+        return drive_steps(self._run_steps(input_text,max_tool_iterations,**kwargs),self.llm)
+
+    def _run_steps(self,input_text:str,max_tool_iterations:int = 3,**kwargs) -> RunSteps:
+        """
+        run 的步骤生成器版本，同时被 run（同步）和 arun/astream（异步）驱动。
+        每次需要调用LLM时 yield 一个 LLMRequest，需要执行工具时 yield 一个 ToolRequest。
+        """
         print(f"{self.name}:正在处理{input_text}")
 
         # 初始化本次对话的消息列表
@@ -72,8 +203,8 @@ class MySimpleAgent(SimpleAgent):
 
         # 如果未启用工具调用，则执行简单的问答流程
         if not self.enable_tool_calling:
-            # 直接调用LLM获取回复
-            response = self.llm.invoke(messages,**kwargs)
+            # 直接调用LLM获取回复，这次调用的输出就是最终答案
+            response = yield LLMRequest(messages,kwargs,final=True)
             # 将用户的输入和LLM的回复添加到历史记录中
             self.add_message(Message(input_text,"user"))
             self.add_message(Message(response,"assistant"))
@@ -82,7 +213,7 @@ class MySimpleAgent(SimpleAgent):
             return response
 
         # 如果启用了工具调用，则调用专门处理工具逻辑的方法
-        return self._run_with_tools(messages,input_text,max_tool_iterations,**kwargs)
+        return (yield from self._run_with_tools(messages,input_text,max_tool_iterations,**kwargs))
 
     
     def _get_enhanced_system_prompt(self) -> str:
@@ -102,11 +233,18 @@ class MySimpleAgent(SimpleAgent):
         if not self.enable_tool_calling:
             return base_prompt
 
-        # 从工具注册表获取所有工具的描述
-        tools_description = self.tool_registry.get_tools_description()
-        # 如果没有工具或描述为空，也只返回基础提示词
+        # 工具部分只依赖工具描述，按注册表版本缓存，工具不变时不再重复拼接
+        return base_prompt + self.tool_registry.render("simple_agent_tools_section",self._render_tools_section)
+
+    @staticmethod
+    def _render_tools_section(tools_description:str) -> str:
+        """
+        根据工具描述渲染系统提示词中的工具部分。
+        没有可用工具时返回空字符串。
+        """
+        # 如果没有工具或描述为空，不追加工具部分
         if not tools_description or tools_description == "暂无可用工具":
-            return base_prompt
+            return ""
 
         # 构建工具描述部分
         tools_section = "\n\n## 可用工具\n"
@@ -120,12 +258,11 @@ class MySimpleAgent(SimpleAgent):
         tools_section += "例如:`[TOOL_CALL:search:Python编程]` 或 `[TOOL_CALL:memory:recall=用户信息]`\n\n"
         tools_section += "工具调用结果会自动插入到对话中，然后你可以基于结果继续回答。\n"
 
-        # 将基础提示词和工具部分拼接后返回
-        return base_prompt + tools_section
+        return tools_section
 
-    def _run_with_tools(self,messages:list,input_text:str,max_tool_iterations:int,**kwargs) -> str:
+    def _run_with_tools(self,messages:list,input_text:str,max_tool_iterations:int,**kwargs) -> RunSteps:
         """
-        实现支持工具调用的核心逻辑（类似于ReAct模式）。
+        实现支持工具调用的核心逻辑（类似于ReAct模式），以步骤生成器的形式编写。
         在一个循环中，Agent会：
         1. 调用LLM获取回复。
         2. 解析回复中是否包含工具调用指令。
@@ -147,21 +284,18 @@ class MySimpleAgent(SimpleAgent):
         # 循环直到达到最大迭代次数
         while current_iteration < max_tool_iterations:
             # 第一步：调用LLM获取回复（或下一步行动）
-            response = self.llm.invoke(messages,**kwargs)
+            response = yield LLMRequest(messages,kwargs)
             # 第二步：解析回复，查找工具调用指令
             tool_calls = self._parse_tool_calls(response)
 
             # 如果检测到工具调用
             if tool_calls:
                 print(f"检测到{len(tool_calls)}个工具调用")
-                # 执行所有工具调用并收集结果
-                tool_results = []
-                clean_response = response  # 用于存放清除了工具调用语法后的回复
+                # 执行所有工具调用并收集结果（结果顺序与工具调用标记的顺序一致）
+                tool_results = yield ToolRequest(self._execute_tool_calls,(tool_calls,))
 
+                clean_response = response  # 用于存放清除了工具调用语法后的回复
                 for call in tool_calls:
-                    # 执行单个工具调用
-                    result = self._execute_tool_call(call["tool_name"],call["parameters"])
-                    tool_results.append(result)
                     # 从LLM的原始回复中移除工具调用指令文本
                     clean_response = clean_response.replace(call["original"],"")
 
@@ -183,7 +317,7 @@ class MySimpleAgent(SimpleAgent):
         
         # 如果循环因为达到最大次数而终止，但还没有最终回复，则再调用一次LLM生成最终回复
         if current_iteration >= max_tool_iterations and not final_response:
-            final_response = self.llm.invoke(messages,**kwargs)
+            final_response = yield LLMRequest(messages,kwargs,final=True)
 
         # 将用户的原始输入和Agent的最终回复保存到历史记录
         self.add_message(Message(input_text,"user"))
@@ -210,8 +344,7 @@ class MySimpleAgent(SimpleAgent):
         # :             - 匹配字面量 ":"
         # ([^\]]+)      - 捕获组2: 匹配一个或多个非右方括号字符（即参数）
         # \]            - 匹配字面量 "]"
-        pattern = r'\[TOOL_CALL:([^:]+):([^\]]+)\]'
-        matches = re.findall(pattern,text)
+        matches = TOOL_CALL_PATTERN.findall(text)
 
         tool_calls = []
         # 遍历所有匹配项
@@ -224,6 +357,137 @@ class MySimpleAgent(SimpleAgent):
             })
         return tool_calls
 
+    def _execute_tool_calls(self,tool_calls:List[Dict[str,str]]) -> List[str]:
+        """ 执行一轮回复中的所有工具调用，根据配置选择并发或串行，结果顺序与标记顺序一致。 """
+        if self.parallel_tool_calls and len(tool_calls) > 1:
+            return self._execute_tool_calls_concurrently(tool_calls)
+        return [self._execute_tool_call(call["tool_name"],call["parameters"]) for call in tool_calls]
+
+    def _execute_tool_calls_concurrently(self,tool_calls:List[Dict[str,str]]) -> List[str]:
+        """
+        通过 Agent 共用的 AsyncToolExecutor 并发执行同一轮回复中的所有工具调用。
+        每个工具有各自的超时时间，超时的工具返回错误信息而不会拖住其他工具。
+        调度器运行在 Agent 自己的后台事件循环中，因此调用方所在线程是否已有事件循环都不影响。
+
+        参数:
+        - tool_calls: _parse_tool_calls 解析出的工具调用列表。
+
+        返回:
+        - 与 tool_calls 顺序一致的工具结果字符串列表。
+        """
+        start = time.perf_counter()
+        pending = [self._submit_tool_call(call) for call in tool_calls]
+        timed_results = self._collect_tool_results(pending)
+        wall_time = time.perf_counter() - start
+
+        # 串行执行时的预计耗时 = 按时完成的工具耗时之和，与实际墙钟耗时之差就是并发节省的时间。
+        # 超时的调用没有真实耗时，不计入估算，只记录个数
+        finished = [elapsed for _,elapsed,timed_out in timed_results if not timed_out]
+        serial_time = sum(finished)
+        self.last_tool_timing = {
+            "tool_count":len(tool_calls),
+            "timed_out":len(tool_calls) - len(finished),
+            "serial_time":serial_time,
+            "wall_time":wall_time,
+            "saved_time":max(serial_time - wall_time,0.0),
+        }
+        print(f"并发执行{len(tool_calls)}个工具，耗时{wall_time:.2f}s，节省约{self.last_tool_timing['saved_time']:.2f}s（不含超时的调用）")
+        return [result for result,_,_ in timed_results]
+
+    def _tool_runtime(self) -> tuple:
+        """
+        返回 (共享的事件循环, 本 Agent 的 AsyncToolExecutor)，调度器第一次使用时创建。
+        所有轮次、run 和 stream_run 都复用同一个调度器，工具的并发上限因此在整个 Agent 范围内生效；
+        事件循环由进程内所有 Agent 共用，每个 Agent 只额外持有一个按需创建线程的线程池。
+        """
+        loop = _shared_tool_loop()
+        with self._tool_runtime_lock:
+            if self._tool_executor is None:
+                # 不等待已超时的后台线程，避免一个慢工具拖住关闭过程
+                executor = AsyncToolExecutor(
+                    self.tool_registry,
+                    max_workers=self.max_tool_workers,
+                    tool_limits=self.tool_concurrency,
+                    wait_on_exit=False
+                )
+                asyncio.run_coroutine_threadsafe(executor.__aenter__(),loop).result()
+                self._tool_executor = executor
+                # 调用方没有调用 close() 时，Agent 被回收后也会关闭线程池
+                self._tool_finalizer = weakref.finalize(self,executor.shutdown,False)
+            return loop,self._tool_executor
+
+    def close(self):
+        """ 关闭工具调度器的线程池，之后再调用工具会重新创建。 """
+        with self._tool_runtime_lock:
+            finalizer = self._tool_finalizer
+            self._tool_executor = self._tool_finalizer = None
+        if finalizer is not None:
+            finalizer()
+
+    def __enter__(self) -> "MySimpleAgent":
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
+
+    def _submit_tool_call(self,call:Dict[str,str]) -> tuple:
+        """
+        立即把一个工具调用提交给调度器，返回 (工具调用, Future, 截止时间)。
+        截止时间从提交时刻开始计算，排队等待的时间也算在内。
+        """
+        loop,executor = self._tool_runtime()
+        tool_name = call["tool_name"]
+        timeout = self.tool_timeouts.get(tool_name,self.tool_timeout)
+
+        def _timed():
+            # 只统计工具真正执行的时间，不含排队等待并发名额的时间
+            call_start = time.perf_counter()
+            result = self._execute_tool_call(tool_name,call["parameters"])
+            return result,time.perf_counter() - call_start
+
+        async def _run_one():
+            return await executor.run_in_pool(_timed,timeout=timeout,tool_name=tool_name)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return call,asyncio.run_coroutine_threadsafe(_run_one(),loop),deadline
+
+    def _collect_tool_results(self,pending:List[tuple]) -> List[tuple]:
+        """
+        等待 _submit_tool_call 提交的调用，返回与 pending 顺序一致的 (结果, 耗时, 是否超时) 列表。
+        用 concurrent.futures.wait 同时等待所有调用，每个调用按自己的截止时间判定超时，
+        等待时间不会因为逐个等待而累加。
+        """
+        results:Dict[int,tuple] = {}
+        waiting = {future:index for index,(_,future,_) in enumerate(pending)}
+
+        def _timed_out(index:int):
+            call = pending[index][0]
+            timeout = self.tool_timeouts.get(call["tool_name"],self.tool_timeout)
+            results[index] = (f"工具调用失败:工具{call['tool_name']}执行超时({timeout}s)",0.0,True)
+
+        while waiting:
+            deadlines = [pending[index][2] for index in waiting.values() if pending[index][2] is not None]
+            wait_for = max(min(deadlines) - time.monotonic(),0.0) if deadlines else None
+            done,_ = concurrent.futures.wait(list(waiting),timeout=wait_for,return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = waiting.pop(future)
+                try:
+                    result,elapsed = future.result()
+                    results[index] = (result,elapsed,False)
+                except (asyncio.TimeoutError,concurrent.futures.TimeoutError):
+                    _timed_out(index)
+                except Exception as e:
+                    results[index] = (f"工具调用失败{e}",0.0,False)
+            now = time.monotonic()
+            for future,index in list(waiting.items()):
+                deadline = pending[index][2]
+                if deadline is not None and deadline <= now:
+                    # 取消调度器中的协程，还没开始的线程任务不会再执行
+                    future.cancel()
+                    del waiting[future]
+                    _timed_out(index)
+        return [results[index] for index in range(len(pending))]
+
     def _execute_tool_call(self,tool_name:str,parameters:str) -> str:
         """
         执行一个具体的工具调用。
@@ -250,8 +514,11 @@ class MySimpleAgent(SimpleAgent):
                 tool = self.tool_registry.get_tool(tool_name)
                 if not tool:
                     return f"错误：未找到工具{tool_name}"
-                # 运行工具，并传入解析后的参数字典
-                result = tool.run(param_dict)
+                # 运行工具，并传入解析后的参数字典；search 工具的结果优先从缓存中读取
+                if tool_name == "search" and self.search_cache is not None and param_dict.get("query"):
+                    result = self._run_cached_search(tool,param_dict)
+                else:
+                    result = tool.run(param_dict)
             # 返回格式化的成功结果
             return f"工具{tool_name} 执行结果:\n{result}"
 
@@ -259,6 +526,31 @@ class MySimpleAgent(SimpleAgent):
             # 捕获并返回执行过程中的任何异常
             return f"工具调用失败{e}"
 
+    def _run_cached_search(self,tool:Any,param_dict:dict) -> str:
+        """
+        通过搜索结果缓存运行 search 工具。
+        查询归一化后作为缓存键，其余参数（如 limit）放进命名空间，参数不同的调用不会互相命中。
+        """
+        extra = {key:value for key,value in param_dict.items() if key != "query"}
+        namespace = "search:" + json.dumps(extra,ensure_ascii=False,sort_keys=True)
+
+        def fetch(query:str) -> tuple:
+            result = tool.run({**param_dict,"query":query})
+            # 搜索源为 None 时 get_or_fetch 不写入缓存，失败结果不会在整个TTL内被重复返回
+            return result,(None if self._is_search_error(result) else "search")
+
+        return self.search_cache.get_or_fetch(param_dict["query"],fetch,namespace=namespace)
+
+    @staticmethod
+    def _is_search_error(result:Any) -> bool:
+        """ 判断 search 工具的结果是否是错误、空结果或带有搜索源失败提示的降级结果 """
+        if isinstance(result,dict):
+            # 结构化返回模式：没有结果也没有直接答案，或带有失败提示
+            notices = "\n".join(str(notice) for notice in result.get("notices") or [])
+            return not (result.get("results") or result.get("answer")) or bool(_SEARCH_FAILURE_PATTERN.search(notices))
+        text = str(result or "").strip()
+        return not text or text.startswith(_SEARCH_ERROR_PREFIXES) or bool(_SEARCH_FAILURE_PATTERN.search(text))
+
     def _parse_tool_parameters(self,tool_name:str,parameters:str) -> dict:
         """
         智能地将参数字符串解析为字典。
@@ -301,19 +593,24 @@ class MySimpleAgent(SimpleAgent):
 
         return param_dict
 
-    def stream_run(self,input_text:str,**kwargs) -> Iterator[str]:
+    def stream_run(self,input_text:str,max_tool_iterations:int = 3,**kwargs) -> Iterator[str]:
         """
         自定义的流式运行方法。
         此方法会以流的形式逐步返回LLM的响应，而不是等待完整响应生成后再返回。
-        注意：当前实现不支持工具调用。
+        如果启用了工具调用，会边接收边解析工具调用标记，并在模型继续生成时就开始执行工具。
 
         参数:
         - input_text: 用户的输入。
+        - max_tool_iterations: 允许LLM调用工具的最大轮数。
         - **kwargs: 传递给LLM流式调用的额外参数。
 
         返回:
-        - 一个迭代器，每次迭代产生一小块响应文本。
+        - 一个迭代器，每次迭代产生一小块响应文本（不包含工具调用标记）。
         """
+        if self.enable_tool_calling:
+            yield from self._stream_run_with_tools(input_text,max_tool_iterations,**kwargs)
+            return
+
         print(f"{self.name}:开始流式处理:{input_text}")
 
         # 准备发送给LLM的消息列表
@@ -344,6 +641,69 @@ class MySimpleAgent(SimpleAgent):
         self.add_message(Message(full_response,"assistant"))
         print(f"{self.name}:流式响应完毕")
 
+    def _stream_run_with_tools(self,input_text:str,max_tool_iterations:int,**kwargs) -> Iterator[str]:
+        """
+        支持工具调用的流式运行逻辑。
+        每一轮：
+        1. 流式接收LLM输出，普通文本立即产出给调用者。
+        2. 一旦解析出完整的工具调用标记，立刻把工具提交给共用的工具调度器执行，不等待模型生成结束。
+        3. 本轮流结束后按标记顺序收集工具结果，追加到消息列表，再流式请求下一轮回复。
+        达到最大轮数后的最后一轮不再解析工具调用，直接作为最终回复输出。
+        """
+        print(f"{self.name}:开始流式处理(支持工具):{input_text}")
+
+        messages = [{"role":"system","content":self._get_enhanced_system_prompt()}]
+        for msg in self._history:
+            messages.append({"role":msg.role,"content":msg.content})
+        messages.append({"role":"user","content":input_text})
+
+        visible_parts = [] # 所有轮次中产出给用户的文本
+        current_iteration = 0
+        print("实时响应",end="")
+        pending = [] # (工具调用, Future, 截止时间)，顺序与标记出现的顺序一致
+        try:
+            while True:
+                parser = _ToolCallStreamParser(detect_tools=current_iteration < max_tool_iterations)
+                round_text = ""
+                pending = []
+
+                for chunk in self.llm.stream_invoke(messages,**kwargs):
+                    for kind,payload in parser.feed(chunk):
+                        if kind == "tool_call":
+                            print(f"\n检测到工具调用:{payload['tool_name']}，开始执行")
+                            pending.append(self._submit_tool_call(payload))
+                            continue
+                        round_text += payload
+                        print(payload,end="",flush=True)
+                        yield payload
+                for _,payload in parser.flush():
+                    round_text += payload
+                    print(payload,end="",flush=True)
+                    yield payload
+
+                visible_parts.append(round_text)
+                if not pending:
+                    break
+
+                # 按标记顺序收集工具结果，每个工具的截止时间从它被提交时开始计算
+                tool_results = [result for result,_,_ in self._collect_tool_results(pending)]
+                pending = []
+
+                messages.append({"role":"assistant","content":round_text})
+                tool_results_text = "\n\n".join(tool_results)
+                messages.append({"role":"user","content":f"工具执行结果:\n{tool_results_text}\n\n请基于这些结果给出完整的回答。"})
+                current_iteration += 1
+        finally:
+            # 调用方提前停止迭代时，取消本轮还没完成的工具调用
+            for _,future,_ in pending:
+                future.cancel()
+        print()
+
+        full_response = "".join(visible_parts)
+        self.add_message(Message(input_text,"user"))
+        self.add_message(Message(full_response,"assistant"))
+        print(f"{self.name}:流式响应完毕")
+
     def add_tool(self,tool) -> None:
         """
         向Agent动态添加一个工具。
@@ -353,8 +713,7 @@ class MySimpleAgent(SimpleAgent):
         """
         # 如果当前没有工具注册表，则创建一个新的
         if not self.tool_registry:
-            from hello_agents import ToolRegistry
-            self.tool_registry = ToolRegistry()
+            self.tool_registry = VersionedToolRegistry()
             self.enable_tool_calling = True # 同时启用工具调用功能
 
         # 将工具添加到注册表
@@ -0,0 +1,193 @@
+# 搜索结果缓存
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional,Dict,Any,Callable,Tuple,Union,Sequence
+from llm_cache import MemoryLRUCache,SQLiteCache
+
+# 默认的持久化缓存文件，与 llm_cache.db 放在同一目录下
+DEFAULT_SEARCH_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),"memory_data","search_cache.db")
+
+# 查询末尾可以忽略的标点（中英文问号、句号、感叹号等）
+_TRAILING_PUNCTUATION = "?？。.!！,，;；:： "
+
+def normalize_query(query:str) -> str:
+    """
+    归一化搜索查询：全角转半角（NFKC）、统一大小写、折叠连续空白、去掉首尾空白和末尾标点。
+    这样 "Python 编程？" 和 "  python   编程" 会命中同一个缓存条目。
+    """
+    text = unicodedata.normalize("NFKC",query).casefold()
+    text = re.sub(r"\s+"," ",text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+class SearchResultCache:
+    """
+    搜索结果缓存。
+    - 查询先归一化再作为缓存键，空白、大小写、全半角上的差异不会产生新的API调用；
+    - 每个搜索源可以设置不同的TTL（例如新闻类搜索源过期得更快）；
+    - 后端复用 llm_cache 中的 MemoryLRUCache（容量受限的LRU）或 SQLiteCache（持久化）；
+    - 过期时间之后的 stale_ttl 秒内，过期结果仍会立即返回，同时在后台刷新（stale-while-revalidate），
+      热点查询因此始终不用等待网络请求。
+    """
+    def __init__(
+        self,
+        backend:Optional[Any] = None,
+        default_ttl:float = 3600,
+        source_ttls:Optional[Dict[str,float]] = None,
+        stale_ttl:Optional[float] = 3600,
+        max_size:int = 1024,
+        max_revalidate_workers:int = 2
+    ):
+        """
+        Args:
+            backend: 缓存后端，需要提供 get/set 方法；为空时使用容量为 max_size 的 MemoryLRUCache。
+            default_ttl: 没有单独配置的搜索源使用的TTL（秒）。
+            source_ttls: 按搜索源名称单独设置的TTL，例如 {"tavily":1800,"serper":3600}。
+            stale_ttl: 过期后仍可返回旧结果并后台刷新的时间窗口（秒），None 或 0 表示关闭。
+            max_size: 默认内存后端的最大条目数。
+            max_revalidate_workers: 后台刷新使用的线程数。
+        """
+        self.default_ttl = default_ttl
+        self.source_ttls = source_ttls or {}
+        self.stale_ttl = stale_ttl or 0
+        if backend is None:
+            # 后端只负责按容量淘汰和兜底过期，新鲜/陈旧的判断在本类中完成
+            backend = MemoryLRUCache(max_size=max_size,ttl=self._max_age())
+        self.backend = backend
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+        self._revalidating = set() # 正在后台刷新的缓存键，避免同一个键被重复刷新
+        self._executor = ThreadPoolExecutor(max_workers=max_revalidate_workers,thread_name_prefix="search-revalidate")
+
+    @classmethod
+    def sqlite(
+        cls,
+        path:str = DEFAULT_SEARCH_CACHE_PATH,
+        default_ttl:float = 3600,
+        source_ttls:Optional[Dict[str,float]] = None,
+        stale_ttl:Optional[float] = 3600,
+        **kwargs
+    ) -> "SearchResultCache":
+        """ 创建使用 SQLite 持久化后端的缓存，进程重启后缓存依然有效 """
+        max_age = max([default_ttl,*(source_ttls or {}).values()]) + (stale_ttl or 0)
+        backend = SQLiteCache(path=path,ttl=max_age,table="search_cache")
+        return cls(backend=backend,default_ttl=default_ttl,source_ttls=source_ttls,stale_ttl=stale_ttl,**kwargs)
+
+    def _max_age(self) -> float:
+        """ 条目的最长存活时间：最大的TTL加上陈旧窗口，超过后后端可以直接丢弃 """
+        return max([self.default_ttl,*self.source_ttls.values()]) + self.stale_ttl
+
+    def ttl_for(self,source:Union[str,Sequence[str],None]) -> float:
+        """ 返回搜索源的TTL；多个搜索源合并的结果取其中最短的TTL """
+        if source is None:
+            return self.default_ttl
+        sources = [source] if isinstance(source,str) else list(source)
+        return min((self.source_ttls.get(name,self.default_ttl) for name in sources),default=self.default_ttl)
+
+    @staticmethod
+    def key(query:str,namespace:str = "") -> str:
+        payload = json.dumps([namespace,normalize_query(query)],ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self,query:str,namespace:str = "") -> Tuple[Optional[str],Optional[str]]:
+        """
+        查询缓存，不更新统计，也不触发刷新。
+
+        Returns:
+            (结果, 状态)：状态为 "fresh"（未过期）、"stale"（已过期但在陈旧窗口内）或 None（未命中）。
+        """
+        raw = self.backend.get(self.key(query,namespace))
+        if raw is None:
+            return None,None
+        entry = json.loads(raw)
+        age = time.time() - entry["created_at"]
+        if age <= entry["ttl"]:
+            return entry["value"],"fresh"
+        if age <= entry["ttl"] + self.stale_ttl:
+            return entry["value"],"stale"
+        return None,None
+
+    def set(self,query:str,value:str,source:Union[str,Sequence[str],None] = None,namespace:str = ""):
+        """ 写入缓存，TTL 由结果所属的搜索源决定；空结果不缓存 """
+        if not value:
+            return
+        entry = {"value":value,"source":source,"ttl":self.ttl_for(source),"created_at":time.time()}
+        self.backend.set(self.key(query,namespace),json.dumps(entry,ensure_ascii=False))
+
+    def get_or_fetch(
+        self,
+        query:str,
+        fetch:Callable[[str],Tuple[str,Union[str,Sequence[str],None]]],
+        namespace:str = ""
+    ) -> str:
+        """
+        先查缓存，未命中时调用 fetch 获取结果并写入缓存。
+
+        Args:
+            query: 原始查询。
+            fetch: 获取结果的函数，接收原始查询，返回 (结果, 搜索源)；搜索源为 None 表示结果无效，不写入缓存。
+            namespace: 缓存命名空间，用于区分不同工具或不同搜索模式的结果。
+        """
+        value,state = self.lookup(query,namespace)
+        if state == "fresh":
+            with self._lock:
+                self.hits += 1
+            return value
+        if state == "stale":
+            with self._lock:
+                self.stale_hits += 1
+            self._revalidate(query,fetch,namespace)
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value,source = fetch(query)
+        if source is not None:
+            self.set(query,value,source,namespace)
+        return value
+
+    def _revalidate(self,query:str,fetch:Callable,namespace:str):
+        """ 在后台刷新一个过期条目，同一个键同时只刷新一次；刷新失败时保留旧结果 """
+        key = self.key(query,namespace)
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            self.revalidations += 1
+
+        def refresh():
+            try:
+                value,source = fetch(query)
+                if source is not None:
+                    self.set(query,value,source,namespace)
+            except Exception as e:
+                print(f"后台刷新搜索结果失败:{e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        self._executor.submit(refresh)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict[str,Any]:
+        """ 返回命中、陈旧命中、未命中次数以及命中率（陈旧命中也算作命中） """
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                "hits":self.hits,
+                "stale_hits":self.stale_hits,
+                "misses":self.misses,
+                "revalidations":self.revalidations,
+                "hit_rate":(self.hits + self.stale_hits) / total if total else 0.0,
+                "size":len(self.backend),
+            }
@@ -0,0 +1,206 @@
+# 搜索源健康度跟踪与熔断
+import math
+import time
+import threading
+from collections import deque
+from typing import Optional,List,Dict,Any,Iterable
+
+# 熔断器的三种状态
+CLOSED = "closed" # 正常放行
+OPEN = "open" # 熔断中，直接跳过该搜索源
+HALF_OPEN = "half_open" # 冷却结束，放行一个探测请求，成功则恢复，失败则重新熔断
+
+class SourceHealth:
+    """
+    单个搜索源的滚动健康统计。
+    只保留最近 window 次请求（且不早于 max_age 秒），错误率和p95延迟都基于这个窗口计算，
+    几分钟前的故障不会一直拖累现在的排序。
+    """
+    def __init__(self,window:int = 50,max_age:Optional[float] = 300):
+        self.max_age = max_age
+        self._samples:deque = deque(maxlen=window) # (时间戳, 是否成功, 耗时秒数)
+
+    def record(self,seconds:float,ok:bool):
+        self._samples.append((time.monotonic(),ok,seconds))
+
+    def _recent(self,since:Optional[float] = None) -> List[tuple]:
+        cutoff = None if self.max_age is None else time.monotonic() - self.max_age
+        if since is not None:
+            cutoff = since if cutoff is None else max(cutoff,since)
+        if cutoff is None:
+            return list(self._samples)
+        return [sample for sample in self._samples if sample[0] >= cutoff]
+
+    def reset(self):
+        self._samples.clear()
+
+    def snapshot(self,since:Optional[float] = None) -> Dict[str,Any]:
+        """
+        返回窗口内的请求数、错误率和p95延迟（毫秒，没有数据时为 None）。
+        since 不为空时只统计该时刻（time.monotonic）之后的请求。
+        """
+        samples = self._recent(since)
+        if not samples:
+            return {"requests":0,"error_rate":0.0,"p95_ms":None}
+        latencies = sorted(sample[2] for sample in samples)
+        # 最近秩法：取第 ceil(0.95 * n) 个样本
+        p95 = latencies[max(0,math.ceil(0.95 * len(latencies)) - 1)]
+        errors = sum(1 for sample in samples if not sample[1])
+        return {"requests":len(samples),"error_rate":errors / len(samples),"p95_ms":p95 * 1000}
+
+class CircuitBreaker:
+    """
+    熔断器。
+    窗口内请求数不少于 min_requests 且错误率达到 failure_threshold 时打开，之后 cooldown 秒内直接跳过该搜索源；
+    冷却结束后进入半开状态，只放行一个探测请求：成功则关闭，失败则重新打开。
+    关闭后是否再次熔断只看关闭之后的请求，但滚动统计本身保留，排序仍然参考熔断前的表现。
+    """
+    def __init__(self,failure_threshold:float = 0.5,min_requests:int = 5,cooldown:float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.closed_at:Optional[float] = None # 最近一次从半开恢复为关闭的时刻
+        self._probing = False # 半开状态下是否已有探测请求在进行中
+
+    def available(self) -> bool:
+        """ 是否可能放行请求（不占用探测名额），用于排序时过滤 """
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        if self.state == HALF_OPEN:
+            return not self._probing
+        return True
+
+    def allow(self) -> bool:
+        """ 请求发出前调用：返回是否放行。半开状态下放行的请求会占用唯一的探测名额 """
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def on_result(self,ok:bool,health:SourceHealth):
+        """ 请求结束后调用，根据结果和健康统计更新状态 """
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if ok:
+                # 探测成功已经记入统计，这里不清空历史（否则该源得分为0会被排到最前面），
+                # 只让熔断判断从恢复时刻开始计数，避免熔断前的错误立刻再次触发熔断
+                self.state = CLOSED
+                self.closed_at = time.monotonic()
+            else:
+                self._open()
+            return
+        if self.state == CLOSED and not ok:
+            snapshot = health.snapshot(since=self.closed_at)
+            if snapshot["requests"] >= self.min_requests and snapshot["error_rate"] >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """ 放行的请求没有真正发出（例如被取消）时调用，归还探测名额 """
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+class SourceHealthTracker:
+    """
+    所有搜索源的健康度跟踪器。
+    每个搜索源一份滚动统计和一个熔断器；ordered 按观测到的表现给搜索源排序，
+    错误率高、p95延迟大的搜索源排在后面，熔断中的搜索源被跳过。
+    """
+    def __init__(
+        self,
+        window:int = 50,
+        max_age:Optional[float] = 300,
+        failure_threshold:float = 0.5,
+        min_requests:int = 5,
+        cooldown:float = 30.0,
+        error_penalty:float = 4.0
+    ):
+        """
+        Args:
+            window: 每个搜索源保留的最近请求数。
+            max_age: 统计窗口的最长时间（秒），None 表示只按请求数滚动。
+            failure_threshold: 触发熔断的错误率。
+            min_requests: 触发熔断所需的最少请求数，避免一两次偶发失败就熔断。
+            cooldown: 熔断后等待多久（秒）进入半开状态。
+            error_penalty: 排序时错误率的惩罚系数，得分 = p95延迟 * (1 + error_penalty * 错误率)。
+        """
+        self.window = window
+        self.max_age = max_age
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.error_penalty = error_penalty
+        self._health:Dict[str,SourceHealth] = {}
+        self._breakers:Dict[str,CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _ensure(self,source:str):
+        if source not in self._health:
+            self._health[source] = SourceHealth(self.window,self.max_age)
+            self._breakers[source] = CircuitBreaker(self.failure_threshold,self.min_requests,self.cooldown)
+
+    def allow(self,source:str) -> bool:
+        """ 向搜索源发出请求前调用，熔断中返回 False """
+        with self._lock:
+            self._ensure(source)
+            return self._breakers[source].allow()
+
+    def record(self,source:str,seconds:float,ok:bool):
+        """ 记录一次请求的结果，ok 为 False 表示请求抛出了异常或超时 """
+        with self._lock:
+            self._ensure(source)
+            self._health[source].record(seconds,ok)
+            breaker = self._breakers[source]
+            previous = breaker.state
+            breaker.on_result(ok,self._health[source])
+            if breaker.state != previous:
+                print(f"搜索源{source}熔断器状态:{previous} -> {breaker.state}")
+
+    def release(self,source:str):
+        """ allow 放行的请求在发出前被取消时调用 """
+        with self._lock:
+            self._ensure(source)
+            self._breakers[source].release()
+
+    def ordered(self,sources:Iterable[str]) -> List[str]:
+        """
+        按健康度给搜索源排序，并去掉熔断中的搜索源。
+        还没有数据的搜索源得分为0，排在最前面以便尽快获得观测数据；得分相同时保持原有顺序。
+        """
+        with self._lock:
+            scored = []
+            for index,source in enumerate(sources):
+                self._ensure(source)
+                if not self._breakers[source].available():
+                    continue
+                snapshot = self._health[source].snapshot()
+                if snapshot["requests"] == 0:
+                    score = 0.0
+                else:
+                    score = snapshot["p95_ms"] * (1 + self.error_penalty * snapshot["error_rate"])
+                scored.append((score,index,source))
+        return [source for _,_,source in sorted(scored)]
+
+    def state(self,source:str) -> str:
+        with self._lock:
+            self._ensure(source)
+            return self._breakers[source].state
+
+    def snapshot(self) -> Dict[str,Dict[str,Any]]:
+        """ 返回每个搜索源的熔断状态、请求数、错误率和p95延迟 """
+        with self._lock:
+            return {
+                source:{"state":self._breakers[source].state,**health.snapshot()}
+                for source,health in self._health.items()
+            }
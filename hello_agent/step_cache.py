@@ -0,0 +1,135 @@
+# 工具链步骤结果缓存
+import os
+import json
+import hashlib
+import threading
+from typing import Optional,Dict,Any
+from hello_agents import ToolRegistry
+from llm_cache import MemoryLRUCache,SQLiteCache
+
+# 默认的持久化缓存文件，与 llm_cache.db 放在同一目录下
+DEFAULT_STEP_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),"memory_data","step_cache.db")
+
+# 默认可以缓存的工具：输出只由输入决定。搜索等结果随时间变化的工具默认不缓存
+DEFAULT_CACHEABLE_TOOLS:Dict[str,bool] = {"my_calculator":True}
+
+# ToolRegistry.execute_tool 出错时返回的前缀，这样的结果不缓存
+_REGISTRY_ERROR_PREFIX = "错误："
+
+class ToolStepCache:
+    """
+    工具链步骤结果缓存，按 (工具名, 渲染后的输入) 的哈希寻址。
+    - 同一条工具链以相同输入再次执行，或两条工具链有相同的前缀步骤时，直接复用之前的结果；
+    - 两级存储：内存 LRU 在前，可选的磁盘存储（SQLiteCache）在后，磁盘命中的结果会提升到内存中；
+    - 只缓存被标记为可缓存的工具，标记可以按工具设置，也可以在 ToolChain.add_step 中按步骤覆盖。
+    """
+    def __init__(
+        self,
+        disk:Optional[Any] = None,
+        cacheable:Optional[Dict[str,bool]] = None,
+        default_cacheable:bool = False,
+        max_size:int = 1024,
+        ttl:Optional[float] = None
+    ):
+        """
+        Args:
+            disk: 磁盘存储后端，需要提供 get/set 方法，通常是 SQLiteCache；为空时只使用内存。
+            cacheable: 按工具名设置是否可以缓存，与 DEFAULT_CACHEABLE_TOOLS 合并。
+            default_cacheable: 没有设置标记的工具是否缓存。
+            max_size: 内存 LRU 的最大条目数。
+            ttl: 内存条目的过期时间（秒），None 表示永不过期。
+        """
+        self.memory = MemoryLRUCache(max_size=max_size,ttl=ttl)
+        self.disk = disk
+        self.cacheable = {**DEFAULT_CACHEABLE_TOOLS,**(cacheable or {})}
+        self.default_cacheable = default_cacheable
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0 # 不可缓存、直接执行的次数
+        self._lock = threading.Lock()
+
+    @classmethod
+    def sqlite(
+        cls,
+        path:str = DEFAULT_STEP_CACHE_PATH,
+        disk_ttl:Optional[float] = 7 * 24 * 3600,
+        **kwargs
+    ) -> "ToolStepCache":
+        """ 创建带 SQLite 磁盘存储的缓存，进程重启后缓存依然有效 """
+        return cls(disk=SQLiteCache(path=path,ttl=disk_ttl,table="step_cache"),**kwargs)
+
+    @staticmethod
+    def key(tool_name:str,tool_input:str) -> str:
+        payload = json.dumps([tool_name,tool_input],ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def set_cacheable(self,tool_name:str,cacheable:bool = True):
+        self.cacheable[tool_name] = cacheable
+
+    def is_cacheable(self,tool_name:str,override:Optional[bool] = None) -> bool:
+        """ 步骤上的 override 优先，其次是工具的标记，最后是 default_cacheable """
+        if override is not None:
+            return override
+        return self.cacheable.get(tool_name,self.default_cacheable)
+
+    def get(self,tool_name:str,tool_input:str,override:Optional[bool] = None) -> Optional[str]:
+        """ 查询缓存，先查内存再查磁盘，并更新命中/未命中统计；工具不可缓存时记为跳过并返回 None """
+        if not self.is_cacheable(tool_name,override):
+            with self._lock:
+                self.skipped += 1
+            return None
+        key = self.key(tool_name,tool_input)
+        value = self.memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key,value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self,tool_name:str,tool_input:str,result:str,override:Optional[bool] = None):
+        """ 写入缓存；不可缓存的工具和注册表返回的错误信息不写入 """
+        if not self.is_cacheable(tool_name,override):
+            return
+        if result is None or str(result).startswith(_REGISTRY_ERROR_PREFIX):
+            return
+        key = self.key(tool_name,tool_input)
+        self.memory.set(key,result)
+        if self.disk is not None:
+            self.disk.set(key,result)
+
+    def execute(self,registry:ToolRegistry,tool_name:str,tool_input:str,override:Optional[bool] = None) -> str:
+        """ 先查缓存，未命中（或不可缓存）时调用工具并写入缓存 """
+        result = self.get(tool_name,tool_input,override)
+        if result is None:
+            result = registry.execute_tool(tool_name,tool_input)
+            self.set(tool_name,tool_input,result,override)
+        return result
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str,Any]:
+        """ 返回内存/磁盘命中次数、未命中次数、跳过次数和命中率 """
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits":self.memory_hits,
+                "disk_hits":self.disk_hits,
+                "misses":self.misses,
+                "skipped":self.skipped,
+                "hit_rate":hits / total if total else 0.0,
+                "size":len(self.memory),
+            }
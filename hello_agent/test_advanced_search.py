@@ -1,5 +1,7 @@
+import time
 from dotenv import load_dotenv
 from my_advanced_search import create_advanced_search_registry,MyAdvancedSearchTool
+from search_cache import SearchResultCache
 
 load_dotenv()
 
@@ -35,6 +37,27 @@ def test_api_configuration():
     result = search_tool.search("机器学习算法")
     print(f"结果:{result}")
 
+def test_search_modes():
+    """ 测试竞速模式和合并模式，并查看各搜索源的延迟直方图 """
+    print("\n测试并发搜索模式...")
+    for mode in ("race","merge"):
+        search_tool = MyAdvancedSearchTool(mode=mode)
+        result = search_tool.search("大语言模型智能体")
+        print(f"[{mode}] 结果:{result}")
+        for source,stats in search_tool.latency_stats().items():
+            print(f"[{mode}] {source}: 请求{stats['count']}次, 平均{stats['mean_ms']:.0f}ms, p95<={stats['p95_ms']}ms")
+        print(f"[{mode}] 搜索源健康度:{search_tool.health_stats()}")
+
+def test_search_cache():
+    """ 测试搜索结果缓存：只有空白和大小写差异的查询只调用一次API """
+    print("\n测试搜索结果缓存...")
+    search_tool = MyAdvancedSearchTool(cache=SearchResultCache(default_ttl=600))
+    for query in ["Python编程语言的历史","  python编程语言的历史？","PYTHON编程语言的历史"]:
+        start = time.perf_counter()
+        search_tool.search(query)
+        print(f"{query!r}: {(time.perf_counter() - start) * 1000:.1f}ms")
+    print(f"缓存统计:{search_tool.cache.stats()}")
+
 def test_with_agent():
     """ 测试与Agent的集成 """
     print("\n 🤖与Agent的集成测试:")
@@ -48,4 +71,6 @@ def test_with_agent():
 if __name__ == "__main__":
     test_advanced_search()
     test_api_configuration()
+    test_search_modes()
+    test_search_cache()
     test_with_agent()
\ No newline at end of file
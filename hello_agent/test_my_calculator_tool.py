@@ -1,84 +1,221 @@
-from dotenv import load_dotenv
-from my_calculator_tool import create_calculator_registry
+import sys
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from my_calculator_tool import my_calculator,create_calculator_registry
+from calculator_engine import compile_expression,evaluate,evaluate_batch,EvaluationLimits,DEFAULT_LIMITS
 
-# 从 .env 文件中加载环境变量。这是一种常见的实践，用于管理 API 密钥等敏感信息，而无需将其硬编码到代码中。
-load_dotenv()
+# 计算器工具的基准测试与压力测试。
+# 既可以用 pytest 运行其中的 test_* 用例，也可以直接运行本脚本输出吞吐量报告：
+#   python test_my_calculator_tool.py --sizes 1 8 32 128 --count 2000
 
-def test_calculator_tool():
+# 正确性用例：(表达式, 期望结果)
+CORRECTNESS_CASES = [
+    ("2+3","5"),            # 加法
+    ("10-4","6"),           # 减法
+    ("5*6","30"),           # 乘法
+    ("15/3","5.0"),         # 除法
+    ("sqrt(16)","4.0"),     # 平方根函数
+    ("-2**2","-4"),         # 一元负号与乘方的优先级
+    ("7//2 + 7%2","4"),     # 整除与取模
+    ("log(8,2)","3.0"),     # 多参数函数
+    ("factorial(5)","120"), # 整数函数
+]
+
+# 病态输入：(名称, 表达式)。受保护模式下每一条都必须被快速拒绝
+PATHOLOGICAL_CASES = [
+    ("深度嵌套的括号","(" * 5000 + "1" + ")" * 5000),
+    ("深度嵌套的函数调用","abs(" * 60 + "1" + ")" * 60),
+    ("巨大的指数","9**9**9"),
+    ("巨大的乘方结果","2**1000 * 2**1000"),
+    ("pow函数的巨大指数","pow(10,10**6)"),
+    ("整数乘方链","2**2**2**2**2"),
+    ("round的巨大位数","round(1,-10**8)"),
+    ("ldexp的巨大指数","ldexp(1,10**8)"),
+    ("巨大的阶乘","factorial(100000)"),
+    ("巨大的组合数","comb(10**6,5*10**5)"),
+    ("节点过多","max(" + ",".join(["1"] * 300) + ")"),
+    ("超长表达式","1" + "+1" * 2000),
+    ("超大常量","1" + "0" * 200),
+]
+
+# 受保护模式下拒绝一条病态输入允许花费的最长时间（秒）
+MAX_REJECT_SECONDS = 0.5
+
+def generate_expression(size:int,rng:random.Random) -> str:
     """
-    测试自定义计算器工具。
-    
-    这个函数旨在独立地验证计算器工具的基本功能是否正常工作。
-    它通过一系列预定义的简单数学表达式来测试工具的解析和计算能力。
+    生成一个由 size 个运算项组成的随机表达式，项之间用 + - * / 连接，
+    运算项包括数字、函数调用和带括号的子表达式。
     """
-    # 创建一个工具注册表，该注册表包含了我们定义的“my_calculator”工具。
-    registry = create_calculator_registry()
-    print(" 测试自定义计算器工具\n ")
-
-    # 定义一组简单的数学表达式作为测试用例。
-    test_cases = [
-        "2+3",      # 加法
-        "10-4",     # 减法
-        "5*6",      # 乘法
-        "15/3",     # 除法
-        "sqrt(16)", # 平方根函数
-    ]
-    # 遍历所有测试用例，并执行计算。
-    for i,expression in enumerate(test_cases,1):
-        print(f"测试{i}:{expression}")
-        # 通过注册表调用名为 "my_calculator" 的工具，并将表达式字符串作为参数传入。
-        result = registry.execute_tool("my_calculator",expression)
-        print(f"结果:{result}\n")
-
-def test_with_simple_agent():
+    terms = []
+    for _ in range(size):
+        kind = rng.random()
+        number = round(rng.uniform(1,100),2)
+        if kind < 0.5:
+            terms.append(str(number))
+        elif kind < 0.8:
+            terms.append(f"{rng.choice(['sqrt','log','sin','cos','fabs'])}({number})")
+        else:
+            terms.append(f"({number} {rng.choice('+-*')} {round(rng.uniform(1,100),2)})")
+    expression = terms[0]
+    for term in terms[1:]:
+        expression += f" {rng.choice('+-*/')} {term}"
+    return expression
+
+def measure_throughput(expressions:list,limits:EvaluationLimits = False,workers:int = 1) -> tuple:
     """
-    测试计算器工具与一个简单的代理（Agent）的集成。
-    
-    此函数模拟了一个更完整的智能代理工作流程：
-    1. 接收一个包含计算任务的自然语言问题。
-    2. 调用计算器工具来解决问题中的数学部分。
-    3. 将计算结果与原始问题结合，交给大语言模型（LLM）生成最终的、符合自然语言习惯的回答。
+    对给定的表达式逐条调用 my_calculator，limits 默认为 False（不做安全限制）。
+
+    Returns:
+        tuple: (每秒处理的表达式数量, 被安全限制拒绝的表达式数量)
+    """
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [my_calculator(expression,limits) for expression in expressions]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda expression:my_calculator(expression,limits),expressions))
+    elapsed = time.perf_counter() - start
+    rejected = sum(1 for result in results if result.startswith("计算被拒绝"))
+    return (len(expressions) / elapsed if elapsed > 0 else float("inf")),rejected
+
+def run_benchmark(sizes:list,count:int = 1000,seed:int = 0,workers:int = 1) -> list:
     """
-    # 导入我们自定义的大语言模型（LLM）封装类。
-    from hello_agents import HelloAgentsLLM
+    按表达式规模测量吞吐量。
+    每个规模分别测量三种情况：
+      cold:    每条表达式都不相同，每次都要解析和编译
+      warm:    同一批表达式再跑一遍，全部命中编译缓存
+      guarded: 受保护模式下的 warm 吞吐量，rejected 为其中被安全限制拒绝的数量
 
-    # 初始化大语言模型。
-    llm = HelloAgentsLLM()
+    Returns:
+        list: 每个规模一条记录 {"size","cold","warm","guarded","rejected"}，吞吐量单位为 表达式/秒。
+    """
+    rng = random.Random(seed)
+    report = []
+    for size in sizes:
+        expressions = [generate_expression(size,rng) for _ in range(count)]
+        compile_expression.cache_clear()
+        cold,_ = measure_throughput(expressions,workers=workers)
+        warm,_ = measure_throughput(expressions,workers=workers)
+        guarded,rejected = measure_throughput(expressions,DEFAULT_LIMITS,workers=workers)
+        report.append({"size":size,"cold":cold,"warm":warm,"guarded":guarded,"rejected":rejected})
+    return report
 
-    # 创建工具注册表，以便代理可以访问计算器工具。
+def run_stress(limits:EvaluationLimits = DEFAULT_LIMITS) -> list:
+    """
+    用病态输入测试受保护模式。
+
+    Returns:
+        list: 每条输入一条记录 {"name","result","seconds"}。
+    """
+    report = []
+    for name,expression in PATHOLOGICAL_CASES:
+        start = time.perf_counter()
+        result = my_calculator(expression,limits)
+        report.append({"name":name,"result":result,"seconds":time.perf_counter() - start})
+    return report
+
+def test_calculator_tool():
+    """ 通过工具注册表调用计算器，检查基本运算的结果 """
     registry = create_calculator_registry()
-    print("🤖 与 SimpleAgent集成测试:")
-
-    # 定义一个用户的自然语言问题，其中包含一个需要计算的复杂表达式。
-    user_question = "请帮我计算sqrt(16) + 2 * 3"
-    print(f"用户问题:{user_question}")
-
-    # 使用工具注册表执行计算器工具，工具能够从完整的问句中提取并计算数学表达式。
-    calc_result = registry.execute_tool("my_calculator",user_question)
-    print(f"计算结果:{calc_result}")
-
-    # 构建一个消息列表，作为提供给大语言模型的最终提示（prompt）。
-    # 这种结构通常用于与基于对话的 LLM API 进行交互。
-    final_messages = [
-        {"role":"user",
-            # content 字段是关键：它将工具的计算结果和用户的原始问题结合起来，
-            # 指示模型基于这个计算结果来回答最初的问题。
-        "content":f"计算结果是:{calc_result},请用自然语言回答用户问题:{user_question}"}
+    for expression,expected in CORRECTNESS_CASES:
+        assert registry.execute_tool("my_calculator",expression) == expected,expression
+
+def test_invalid_expressions():
+    """ 非法输入返回错误信息而不是抛出异常 """
+    assert my_calculator("   ") == "计算表达式不能为空"
+    for expression in ["__import__('os')","(1).__class__","foo(1)","x+1","'a'*3","2+"]:
+        assert my_calculator(expression) == "计算失败，请检查表达式格式",expression
+        assert my_calculator(expression,DEFAULT_LIMITS) == "计算失败，请检查表达式格式",expression
+
+def test_guarded_rejects_pathological_inputs():
+    """ 受保护模式下每条病态输入都被拒绝，且耗时在限制之内 """
+    for record in run_stress():
+        assert record["result"].startswith("计算被拒绝"),record
+        assert record["seconds"] < MAX_REJECT_SECONDS,record
+
+def test_guarded_matches_unguarded():
+    """ 限制之内的表达式，受保护模式与普通模式结果一致 """
+    rng = random.Random(1)
+    for size in (1,4,16):
+        for _ in range(50):
+            expression = generate_expression(size,rng)
+            assert my_calculator(expression,DEFAULT_LIMITS) == my_calculator(expression,limits=False),expression
+
+def test_guarded_by_default():
+    """ 不传 limits 时默认启用受保护模式，只有显式传入 False 才关闭限制 """
+    assert my_calculator("9**9**9").startswith("计算被拒绝")
+    assert my_calculator("9**9**9",None).startswith("计算被拒绝")
+    assert my_calculator("2**100",limits=False) == str(2**100)
+
+def _outcome(func):
+    """ 返回函数的结果，抛出异常时返回异常类型，便于比较批量求值与逐条求值 """
+    try:
+        return func()
+    except Exception as e:
+        return type(e)
+
+def test_batch_matches_scalar():
+    """ 批量求值与逐条求值的结果（包括结果类型和抛出的异常）一致 """
+    cases = [
+        ("factorial(x)",[{"x":3},{"x":4}]),           # 整数专用的函数
+        ("x // 2 + floor(y)",[{"x":7,"y":2.5},{"x":9,"y":-1.5}]),
+        ("2**x",[{"x":-1},{"x":100}]),                # 负指数和超出 int64 的整数
+        ("x * 2.5 + sin(x)",[{"x":1.0},{"x":2.0}]),
+        ("1/x",[{"x":1.0},{"x":0.0}]),                # 浮点除零
+        ("1/x",[{"x":1},{"x":0}]),                    # 整数除零
+        ("sqrt(x)",[{"x":4.0},{"x":-1.0}]),           # 定义域错误
+        ("x * 1e308",[{"x":10.0}]),                   # 溢出为 inf
+        ("remainder(x,y)",[{"x":2.5,"y":1.0},{"x":5.0,"y":3.0}]), # IEEE 余数，与 np.remainder 不同
+        ("frexp(x)",[{"x":8.0},{"x":0.3}]),           # 返回两个值的函数
+        ("modf(x)",[{"x":2.5},{"x":-1.25}]),
+        ("x ** y",[{"x":1.7,"y":3.3},{"x":-8.0,"y":1/3}]), # 浮点乘方，负数的分数次幂得到复数
     ]
-    print("\nSimpleAgent的回答:")
-    # 调用大语言模型的 `invoke` 方法，发送构造好的提示并获取响应。
-    response = llm.invoke(final_messages)
-    # 以流式（streaming）的方式处理和打印模型的响应。
-    # 这意味着我们会逐块接收和显示文本，而不是等待整个回答生成完毕。
-    for chunk in response:
-        # 打印每个文本块，end="" 防止自动换行，flush=True 确保立即输出到控制台。
-        print(chunk,end="",flush=True)
-    print("\n")
+    for expression,bindings in cases:
+        batch = _outcome(lambda:evaluate_batch(expression,bindings))
+        scalar = _outcome(lambda:[evaluate(expression,binding) for binding in bindings])
+        assert repr(batch) == repr(scalar),expression
+    assert evaluate_batch("factorial(x)",[{"x":3},{"x":4}]) == [6,24]
+
+def test_custom_limits():
+    """ 限制可以按需调整 """
+    strict = EvaluationLimits(max_depth=4,max_magnitude=1000)
+    assert my_calculator("10**3",strict) == "1000"
+    assert my_calculator("10**4",strict).startswith("计算被拒绝")
+    assert my_calculator("((((1))))+1",strict) == "2"
+    assert my_calculator("-(-(-(-1)))",strict).startswith("计算被拒绝")
+
+def test_benchmark_smoke():
+    """ 基准测试本身可以跑通，小规模的表达式不会被安全限制拒绝 """
+    report = run_benchmark([1,8],count=200)
+    assert [record["size"] for record in report] == [1,8]
+    for record in report:
+        assert record["cold"] > 0 and record["warm"] > 0 and record["guarded"] > 0
+        assert record["rejected"] == 0
+
+def main(argv:list = None):
+    parser = argparse.ArgumentParser(description="my_calculator 吞吐量基准测试与安全限制压力测试")
+    parser.add_argument("--sizes",type=int,nargs="+",default=[1,4,16,64,256],help="表达式规模(运算项个数)")
+    parser.add_argument("--count",type=int,default=2000,help="每个规模生成的表达式数量")
+    parser.add_argument("--workers",type=int,default=1,help="并发调用的线程数")
+    parser.add_argument("--seed",type=int,default=0,help="随机种子")
+    args = parser.parse_args(argv)
+
+    print(" 计算器吞吐量(表达式/秒)\n")
+    print(f"{'规模':>6} {'cold':>12} {'warm':>12} {'guarded':>12} {'rejected':>10}")
+    for record in run_benchmark(args.sizes,args.count,args.seed,args.workers):
+        print(f"{record['size']:>6} {record['cold']:>12.0f} {record['warm']:>12.0f} {record['guarded']:>12.0f} {record['rejected']:>10}")
+
+    print("\n 受保护模式压力测试\n")
+    failed = False
+    for record in run_stress():
+        ok = record["result"].startswith("计算被拒绝") and record["seconds"] < MAX_REJECT_SECONDS
+        failed = failed or not ok
+        print(f"{'通过' if ok else '失败'} {record['name']}: {record['seconds'] * 1000:.2f}ms {record['result']}")
+    return 1 if failed else 0
 
 # 这是一个标准的 Python 入口点。
 # 当这个脚本作为主程序直接运行时，下面的代码块才会被执行。
 if __name__ =="__main__":
-    # 首先，运行独立的计算器工具测试。
-    test_calculator_tool()
-    # 然后，运行计算器工具与 Agent 的集成测试。
-    test_with_simple_agent()
+    sys.exit(main())
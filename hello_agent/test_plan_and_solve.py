@@ -0,0 +1,78 @@
+import time
+import asyncio
+import threading
+from agent import drive_steps, adrive_steps
+from my_PlanAndSolve_agent import Executor
+
+# 按依赖调度的用例，可以用 pytest 运行：
+#   python -m pytest -q test_plan_and_solve.py
+
+# 一条慢分支和一条快链，最后一步汇总两者
+PLAN = [
+    {"id": 1, "step": "慢", "deps": []},
+    {"id": 2, "step": "快A", "deps": []},
+    {"id": 3, "step": "快B", "deps": [2]},
+    {"id": 4, "step": "快C", "deps": [3]},
+    {"id": 5, "step": "汇总", "deps": [1, 4]},
+]
+DELAYS = {"慢": 0.6, "快A": 0.05, "快B": 0.05, "快C": 0.05, "汇总": 0.0}
+
+class FakeLLM:
+    """ 按步骤名称延迟返回，并记录每个步骤完成的时刻 """
+    def __init__(self):
+        self.finished = {}
+        self.lock = threading.Lock()
+
+    def invoke(self, messages, **kwargs):
+        step = messages[0]["content"]
+        time.sleep(DELAYS[step])
+        with self.lock:
+            self.finished[step] = time.perf_counter()
+        return f"{step}完成"
+
+    async def ainvoke(self, messages, **kwargs):
+        step = messages[0]["content"]
+        await asyncio.sleep(DELAYS[step])
+        self.finished[step] = time.perf_counter()
+        return f"{step}完成"
+
+def _check_fast_chain_not_held_back(llm, answer):
+    assert answer == "汇总完成"
+    # 快链在慢步骤完成之前就已经走完，而不是等慢步骤所在的一批结束后才开始下一步
+    assert llm.finished["快C"] < llm.finished["慢"]
+    assert llm.finished["汇总"] >= llm.finished["慢"]
+
+def test_fast_chain_not_held_back_by_slow_branch():
+    llm = FakeLLM()
+    executor = Executor(llm, prompt_template="{current_step}", max_concurrency=2)
+    answer = drive_steps(executor.execute_steps("问题", PLAN), llm)
+    _check_fast_chain_not_held_back(llm, answer)
+
+def test_fast_chain_not_held_back_by_slow_branch_async():
+    llm = FakeLLM()
+    executor = Executor(llm, prompt_template="{current_step}", max_concurrency=2)
+    answer = asyncio.run(adrive_steps(executor.execute_steps("问题", PLAN), llm))
+    _check_fast_chain_not_held_back(llm, answer)
+
+def test_max_concurrency_is_respected():
+    """ 同时执行的步骤数不超过 max_concurrency """
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    class CountingLLM(FakeLLM):
+        def invoke(self, messages, **kwargs):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            try:
+                return super().invoke(messages, **kwargs)
+            finally:
+                with lock:
+                    active.pop()
+
+    plan = [{"id": i, "step": "快A", "deps": []} for i in range(1, 7)] + [{"id": 7, "step": "汇总", "deps": list(range(1, 7))}]
+    llm = CountingLLM()
+    executor = Executor(llm, prompt_template="{current_step}", max_concurrency=3)
+    assert drive_steps(executor.execute_steps("问题", plan), llm) == "汇总完成"
+    assert max(peak) == 3
@@ -0,0 +1,35 @@
+from my_reflection_agent import ConvergenceDetector
+
+# 收敛检测的相似度用例，可以用 pytest 运行：
+#   python -m pytest -q test_reflection_agent.py
+
+# 近似但不相同的草稿：(名称, 上一轮结果, 本轮结果)。
+# 它们的字符集合完全相同，只比较字符集合的指标会误判为已经收敛
+NEAR_MISS_DRAFTS = [
+    ("调换了步骤顺序","第一步先加热水，然后放入面条，最后加盐。","第一步先放入面条，然后加盐，最后加热水。"),
+    ("重复了内容","答案很好。","答案很好。答案很好。答案很好。"),
+    ("调换了主语和宾语","Alice sent the report to Bob before the meeting.","Bob sent the report to Alice before the meeting."),
+]
+
+def test_near_miss_drafts_do_not_converge():
+    """ 顺序或重复次数不同的草稿，两种指标都不应达到默认阈值 """
+    for metric in ("jaccard","edit_ratio"):
+        detector = ConvergenceDetector(metric=metric)
+        for name,previous,current in NEAR_MISS_DRAFTS:
+            assert detector.similarity(previous,current) < detector.threshold,(metric,name)
+
+def test_identical_drafts_converge():
+    """ 相同的草稿（包括只在首尾空白上不同的草稿）视为收敛 """
+    detector = ConvergenceDetector()
+    for _,previous,_ in NEAR_MISS_DRAFTS:
+        assert detector.similarity(previous,previous) == 1.0
+        assert detector.similarity(previous,previous + "\n") >= detector.threshold
+    assert detector.similarity("","") == 1.0
+
+def test_similarity_is_order_aware():
+    """ 相同的词以不同顺序出现，相似度低于顺序不变的小改动 """
+    detector = ConvergenceDetector()
+    original = "the quick brown fox jumps over the lazy dog near the river bank today"
+    reordered = "today the river bank near the lazy dog jumps over the quick brown fox"
+    small_edit = "the quick brown fox jumps over the lazy dog near the river bank"
+    assert detector.similarity(original,reordered) < detector.similarity(original,small_edit)
@@ -0,0 +1,31 @@
+# 提示词大小估算工具
+import re
+import math
+from typing import List,Dict,Any
+
+# 中日韩统一表意文字及常见全角标点，这些字符通常每个字符约占一个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+# 每条消息额外的格式开销（角色标记等），与 OpenAI 的计费方式大致相当
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text:str) -> int:
+    """
+    粗略估算一段文本的token数量，不依赖任何分词器。
+    中文等CJK字符按每字1个token计算，其余字符按每4个字符1个token计算。
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + math.ceil(other_count / 4)
+
+def estimate_messages_tokens(messages:List[Dict[str,Any]]) -> int:
+    """ 估算一个消息列表的总token数量 """
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content,list):
+            content = "".join(str(part) for part in content)
+        total += estimate_tokens(content or "") + MESSAGE_OVERHEAD_TOKENS
+    return total
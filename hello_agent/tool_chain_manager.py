@@ -1,22 +1,97 @@
 # 工具链式调用机制
-from typing import Optional,List,Dict,Any
+import os
+import re
+import json
+import time
+import string
+from concurrent.futures import ThreadPoolExecutor,wait,FIRST_COMPLETED
+from typing import Optional,List,Dict,Any,Set,Iterable,Iterator,Tuple,Callable
 from hello_agents import ToolRegistry
+from step_cache import ToolStepCache,_REGISTRY_ERROR_PREFIX
+
+def template_fields(template:str) -> Set[str]:
+    """
+    返回模板中引用的上下文变量名，如 "{a} {b.x} {c[0]} {d:{width}}" -> {"a","b","c","d","width"}
+
+    Raises:
+        ValueError: 模板格式错误（如花括号不配对），或使用了 {} / {0} 这样的位置参数。
+    """
+    fields = set()
+    for _,field_name,format_spec,_ in string.Formatter().parse(template):
+        if field_name is None:
+            continue
+        # 只取变量名本身，去掉属性访问和下标
+        name = re.split(r"[.\[]",field_name,maxsplit=1)[0]
+        if not name or name.isdigit():
+            raise ValueError(f"模板'{template}'使用了位置参数，请使用 {{变量名}}")
+        fields.add(name)
+        # 格式说明中也可以嵌套变量，如 {value:{width}}
+        if format_spec and "{" in format_spec:
+            fields |= template_fields(format_spec)
+    return fields
+
+class CompiledTemplate:
+    """
+    预编译的输入模板。
+    add_step 时解析一次：格式错误立即报错，并提取出引用的变量名供依赖推断和注册时校验使用；
+    渲染时用 format_map 直接查执行上下文，不再像 format(**context) 那样每次复制整个上下文。
+    """
+    def __init__(self,template:str):
+        self.template = template
+        self.fields = frozenset(template_fields(template))
+
+    def render(self,context:Dict[str,Any]) -> str:
+        """ 用上下文渲染模板，缺少变量时抛出 KeyError """
+        return self.template.format_map(context)
+
+    def __repr__(self) -> str:
+        return f"CompiledTemplate({self.template!r})"
+
+class _ChainRun:
+    """ 一个输入在工具链上的执行状态 """
+    def __init__(self,index:int,context:Dict[str,Any]):
+        self.index = index # 输入的序号
+        self.context = context # 该输入独立的执行上下文
+        self.done:Set[int] = set() # 已完成的步骤下标
+        self.running:Set[int] = set() # 正在执行的步骤下标
+        self.error:Optional[str] = None # 执行失败时的错误信息
+        self.exception:Optional[BaseException] = None # 工具抛出的异常
+        self.resumed = False # 是否是从检查点恢复、没有实际执行的输入
+
+    def finished(self,step_count:int) -> bool:
+        return not self.running and (self.error is not None or len(self.done) == step_count)
 
 class ToolChain:
     """ 
-    工具链 - 支持多个工具的顺序执行。
+    工具链 - 支持多个工具的串联执行。
     这个类允许将一系列工具调用串联起来，前一个工具的输出可以作为后一个工具的输入，
     形成一个处理流程。
+    步骤之间的依赖关系从输入模板的 {占位符} 推断：互不依赖的步骤并发执行，
+    execute_stream 还可以把一批输入以流水线方式送入工具链，输入A的第2步与输入B的第1步同时进行。
+    设置 step_cache 后，可缓存的步骤按 (工具名, 渲染后的输入) 复用之前的结果。
     """
-    def __init__(self,name:str,description:str):
+    def __init__(
+        self,
+        name:str,
+        description:str,
+        max_workers:int = 4,
+        step_cache:Optional[ToolStepCache] = None,
+        context_keys:Optional[Iterable[str]] = None
+    ):
         # 工具链的名称，用于唯一标识
         self.name = name
         # 工具链的功能描述
         self.description = description
         # 存储工具链中所有步骤的列表
         self.steps:List[Dict[str,Any]] = []
+        # 同时执行的工具调用数上限，为1时退化为按顺序执行
+        self.max_workers = max(1,max_workers)
+        # 步骤结果缓存，为 None 时每个步骤都调用工具；注册到 ToolChainManager 时会使用管理器的缓存
+        self.step_cache = step_cache
+        # 调用方通过 context 提供的变量名（"input" 总是可用），注册时据此校验所有模板
+        self.context_keys = frozenset(context_keys or ())
 
-    def add_step(self,tool_name:str,input_template:str,output_key:str = None):
+    def add_step(self,tool_name:str,input_template:str,output_key:str = None,cacheable:Optional[bool] = None):
         """ 
         向工具链中添加一个执行步骤。
 
@@ -27,17 +102,70 @@ class ToolChain:
             output_key (str, optional): 当前步骤执行结果在上下文（context）中存储的键名。
                                         如果未提供，会自动生成一个默认的键名。
                                         这个键名可用于后续步骤引用本次执行的结果。
+            cacheable (bool, optional): 是否缓存这个步骤的结果，None 表示按 step_cache 中该工具的标记。
+
+        Raises:
+            ValueError: 输入模板格式错误。
         """
         # 将一个步骤定义（一个字典）追加到步骤列表中
         self.steps.append({
             "tool_name":tool_name, # 工具名
             "input_template":input_template, # 输入模板
-            "output_key":output_key or f"step_{len(self.steps)}_result" # 输出结果的键名，如果未指定则自动生成
+            "template":CompiledTemplate(input_template), # 预编译的输入模板
+            "output_key":output_key or f"step_{len(self.steps)}_result", # 输出结果的键名，如果未指定则自动生成
+            "cacheable":cacheable # 是否缓存结果，None 表示按工具的标记
         })
 
+    def dependencies(self) -> List[Set[int]]:
+        """
+        推断每个步骤依赖的前序步骤下标。
+        步骤i依赖前面的步骤j，当且仅当：i 的模板引用了 j 的 output_key（读后写）、
+        两者的 output_key 相同（写后写），或 i 的 output_key 被 j 的模板引用（写后读）。
+        后两种情况保证并发执行时上下文中的值与按顺序执行时一致。
+        """
+        fields = [step["template"].fields for step in self.steps]
+        deps = []
+        for i,step in enumerate(self.steps):
+            deps.append({
+                j for j,earlier in enumerate(self.steps[:i])
+                if earlier["output_key"] in fields[i]
+                or earlier["output_key"] == step["output_key"]
+                or step["output_key"] in fields[j]
+            })
+        return deps
+
+    def missing_keys(self,available_keys:Iterable[str]) -> List[Tuple[int,str]]:
+        """
+        在不执行任何工具的情况下检查模板：返回 (步骤序号, 变量名) 列表，
+        列出每个步骤引用了、但既不在 available_keys 中也不是前面步骤输出的变量。
+        """
+        known = set(available_keys) | {"input"}
+        missing = []
+        for i,step in enumerate(self.steps,1):
+            missing.extend((i,field) for field in sorted(step["template"].fields - known))
+            known.add(step["output_key"])
+        return missing
+
+    def validate(self):
+        """
+        用声明的 context_keys 校验工具链，注册到 ToolChainManager 时调用。
+
+        Raises:
+            ValueError: 工具链没有步骤，或某个模板引用了不可用的变量。
+        """
+        if not self.steps:
+            raise ValueError(f"工具链{self.name}没有任何步骤")
+        missing = self.missing_keys(self.context_keys)
+        if missing:
+            details = ",".join(f"步骤{i}的{{{field}}}" for i,field in missing)
+            raise ValueError(
+                f"工具链{self.name}的模板变量未定义:{details}。"
+                f"变量应是前面步骤的 output_key，或在 context_keys 中声明"
+            )
+
     def execute(self,registry:ToolRegistry,initial_input:str,context:Dict[str,Any] = None) -> str:
         """ 
-        按顺序执行工具链中的所有步骤。
+        执行工具链中的所有步骤，互不依赖的步骤并发执行。
 
         Args:
             registry (ToolRegistry): 一个包含所有可用工具的工具注册表。
@@ -53,30 +181,16 @@ class ToolChain:
         context["input"] = initial_input
 
         print(f"开始执行工具链:{self.name}")
+        # 在执行任何工具之前检查模板变量，避免前面代价高的步骤白白执行
+        missing = self.missing_keys(context)
+        if missing:
+            return f"工具链执行失败：模版变量'{missing[0][1]}'未找到"
+        run = next(self._pipeline(registry,[(0,context)],max_in_flight=1,verbose=True))
+        if run.exception is not None:
+            raise run.exception
+        if run.error is not None:
+            return run.error
 
-        # 遍历工具链中的每一个步骤并执行
-        for i,step in enumerate(self.steps,1):
-            # 获取当前步骤的工具名称、输入模板和输出键名
-            tool_name = step["tool_name"]
-            input_template = step["input_template"]
-            output_key = step["output_key"]
-
-            try:
-                # 使用上下文中的变量来格式化（渲染）输入模板，生成最终的工具输入
-                tool_input = input_template.format(**context)
-            except KeyError as e:
-                # 如果模板中的某个变量在上下文中找不到，则执行失败并返回错误信息
-                return f"工具链执行失败：模版变量{e}未找到"
-
-            print(f"步骤{i}:使用{tool_name}处理'{tool_input[:50]}...'")
-
-            # 通过工具注册表实际执行工具调用
-            result = registry.execute_tool(tool_name,tool_input)
-            # 将当前步骤的执行结果以指定的 output_key 存入上下文，供后续步骤使用
-            context[output_key] = result
-
-            print(f"  ✅ 步骤 {i} 完成，结果长度: {len(result)} 字符")
-        
         # 获取最后一步的输出键名
         last_step_output_key = self.steps[-1]["output_key"]
         # 从上下文中获取并返回最后一步的执行结果
@@ -84,21 +198,170 @@ class ToolChain:
         print(f"工具链'{self.name}'执行完成")
         return final_result
 
+    def execute_stream(
+        self,
+        registry:ToolRegistry,
+        inputs:Iterable[str],
+        context:Dict[str,Any] = None,
+        max_in_flight:int = None,
+        max_workers:int = None
+    ) -> Iterator[Tuple[int,str]]:
+        """
+        以流水线方式让一批输入通过工具链，每个输入完成后立即产出 (输入序号, 最后一步的结果)，
+        产出顺序是完成顺序而不是输入顺序。某个输入失败时产出它的错误信息，不影响其他输入。
+
+        Args:
+            registry (ToolRegistry): 一个包含所有可用工具的工具注册表。
+            inputs (Iterable[str]): 输入序列，按需读取，可以是生成器。
+            context (Dict[str,Any], optional): 所有输入共享的初始上下文，每个输入使用它的副本。
+            max_in_flight (int, optional): 同时处于工具链中的输入数上限，默认为 max_workers 的两倍。
+            max_workers (int, optional): 同时执行的工具调用数上限，默认使用工具链的 max_workers。
+        """
+        missing = self.missing_keys(context or {})
+        if missing:
+            raise KeyError(f"工具链{self.name}的模版变量'{missing[0][1]}'未找到")
+        max_workers = max_workers or self.max_workers
+        for run in self._pipeline(registry,self._contexts(inputs,context),max_in_flight or max_workers * 2,max_workers=max_workers):
+            yield run.index,self._result_of(run)[1]
+
+    @staticmethod
+    def _contexts(inputs:Iterable[str],context:Dict[str,Any] = None) -> Iterator[Tuple[int,Dict[str,Any]]]:
+        """ 为每个输入生成 (序号, 独立的执行上下文) """
+        base = context or {}
+        for index,item in enumerate(inputs):
+            yield index,{**base,"input":item}
+
+    def _execute_step(self,registry:ToolRegistry,step:Dict[str,Any],tool_input:str) -> str:
+        """ 通过工具注册表实际执行工具调用，并把结果写入步骤缓存 """
+        result = registry.execute_tool(step["tool_name"],tool_input)
+        if self.step_cache:
+            self.step_cache.set(step["tool_name"],tool_input,result,step["cacheable"])
+        return result
+
+    def _result_of(self,run:_ChainRun) -> Tuple[bool,str]:
+        """ 返回 (是否成功, 最后一步的结果或错误信息) """
+        if run.exception is not None:
+            return False,f"工具链执行失败：{run.exception}"
+        if run.error is not None:
+            return False,run.error
+        # ToolRegistry.execute_tool 会把工具抛出的异常转换成错误信息返回，任何一步返回这样的结果都算失败
+        for step in self.steps:
+            value = run.context.get(step["output_key"])
+            if isinstance(value,str) and value.startswith(_REGISTRY_ERROR_PREFIX):
+                return False,value
+        return True,run.context[self.steps[-1]["output_key"]]
+
+    def _pipeline(
+        self,
+        registry:ToolRegistry,
+        contexts:Iterable[Tuple[int,Dict[str,Any]]],
+        max_in_flight:int,
+        max_workers:int = None,
+        verbose:bool = False
+    ) -> Iterator[_ChainRun]:
+        """
+        调度器：把 (输入, 步骤) 作为任务提交到线程池，依赖全部完成的任务才会提交。
+        优先推进先进入工具链的输入，并且同时执行的任务数不超过 max_workers，
+        这样每个输入的延迟接近单独执行时的延迟，而线程池始终保持忙碌。
+        contexts 是 (输入序号, 执行上下文) 的序列，按需读取；
+        其中也可以直接给出已经结束的 _ChainRun（例如从检查点恢复的输入），它会被原样产出。
+        """
+        deps = self.dependencies()
+        step_count = len(self.steps)
+        max_workers = max_workers or self.max_workers
+        source = iter(contexts)
+        exhausted = False
+        runs:List[_ChainRun] = [] # 正在工具链中的输入，按进入的先后排列
+        futures = {} # future -> (输入, 步骤下标)
+
+        with ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix=f"chain-{self.name}") as executor:
+            while True:
+                # 补充新的输入
+                while not exhausted and len(runs) < max_in_flight:
+                    try:
+                        item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    runs.append(item if isinstance(item,_ChainRun) else _ChainRun(*item))
+
+                # 按 (输入先后, 步骤下标) 的顺序提交依赖已满足的步骤
+                for run in runs:
+                    for i,step in enumerate(self.steps):
+                        if len(futures) >= max_workers or run.error is not None:
+                            break
+                        if i in run.done or i in run.running or not deps[i] <= run.done:
+                            continue
+                        try:
+                            # 使用上下文中的变量来格式化（渲染）输入模板，生成最终的工具输入
+                            tool_input = step["template"].render(run.context)
+                        except KeyError as e:
+                            # 如果模板中的某个变量在上下文中找不到，则这个输入执行失败
+                            run.error = f"工具链执行失败：模版变量{e}未找到"
+                            break
+                        if verbose:
+                            print(f"步骤{i + 1}:使用{step['tool_name']}处理'{tool_input[:50]}...'")
+                        cached = self.step_cache.get(step["tool_name"],tool_input,step["cacheable"]) if self.step_cache else None
+                        if cached is not None:
+                            # 命中缓存的步骤直接完成，依赖它的后续步骤在本轮循环中就可以提交
+                            run.context[step["output_key"]] = cached
+                            run.done.add(i)
+                            if verbose:
+                                print(f"  ♻️ 步骤 {i + 1} 命中缓存")
+                            continue
+                        run.running.add(i)
+                        futures[executor.submit(self._execute_step,registry,step,tool_input)] = (run,i)
+
+                # 产出已经结束的输入
+                for run in [run for run in runs if run.finished(step_count)]:
+                    runs.remove(run)
+                    yield run
+
+                if not futures:
+                    if exhausted and not runs:
+                        return
+                    continue
+
+                completed,_ = wait(futures,return_when=FIRST_COMPLETED)
+                for future in completed:
+                    run,i = futures.pop(future)
+                    run.running.discard(i)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        run.exception = e
+                        run.error = f"工具链执行失败：步骤{i + 1}出错:{e}"
+                        continue
+                    # 将当前步骤的执行结果以指定的 output_key 存入上下文，供后续步骤使用
+                    run.context[self.steps[i]["output_key"]] = result
+                    run.done.add(i)
+                    if verbose:
+                        print(f"  ✅ 步骤 {i + 1} 完成，结果长度: {len(result)} 字符")
+
 class ToolChainManager:
     """ 
     工具链管理器。
     负责注册、管理和执行多个工具链。
     """
-    def __init__(self,registry:ToolRegistry):
+    def __init__(self,registry:ToolRegistry,step_cache:Optional[ToolStepCache] = None):
         # 持有一个工具注册表的引用，用于执行工具
         self.registry = registry
+        # 所有工具链共享的步骤结果缓存，不同工具链的相同步骤也能互相复用
+        self.step_cache = step_cache
         # 使用字典来存储所有已注册的工具链，键为工具链名称，值为ToolChain对象
         self.chains:Dict[str,ToolChain] = {}
 
     def register_chain(self,chain:ToolChain):
-        """ 注册一个新的工具链到管理器中。"""
+        """
+        注册一个新的工具链到管理器中。
+        注册前校验所有模板变量，有问题时立即抛出 ValueError，而不是等到执行了前面的步骤之后才失败。
+        """
+        chain.validate()
         # 将工具链实例添加到 chains 字典中
         self.chains[chain.name] = chain
+        # 没有单独设置缓存的工具链使用管理器的共享缓存
+        if chain.step_cache is None:
+            chain.step_cache = self.step_cache
         print(f"工具链{chain.name}注册成功")
 
     def execute_chain(self,chain_name:str,input_data:str,context:Dict[str,Any] = None) -> str:
@@ -112,6 +375,131 @@ class ToolChainManager:
         # 调用该工具链实例的 execute 方法来执行它
         return chain.execute(self.registry,input_data,context)
 
+    def execute_batch(
+        self,
+        chain_name:str,
+        inputs:Iterable[str],
+        context:Dict[str,Any] = None,
+        max_workers:int = 4,
+        ordered:bool = False,
+        checkpoint_path:str = None,
+        verbose:bool = False,
+        progress_every:int = 100,
+        progress_callback:Callable[[Dict[str,Any]],None] = None
+    ) -> Iterator[Tuple[int,str]]:
+        """
+        用一个有界的线程池让大批输入流水线式地通过工具链，每个输入完成后立即产出 (输入序号, 结果)。
+
+        Args:
+            chain_name (str): 已注册的工具链名称。
+            inputs (Iterable[str]): 输入序列，按需读取，可以是逐行读取文件的生成器。
+            context (Dict[str,Any], optional): 所有输入共享的初始上下文。
+            max_workers (int): 同时执行的工具调用数上限。
+            ordered (bool): 为 True 时按输入顺序产出结果，先完成的结果会暂存到前面的输入完成为止。
+            checkpoint_path (str, optional): JSONL 检查点文件。每个成功的输入完成后追加一行，
+                再次运行时跳过已完成的输入，并直接产出检查点中保存的结果。失败的输入不写入，下次会重试。
+            verbose (bool): 为 True 时打印每个步骤的执行过程，默认只汇报进度。
+            progress_every (int): 每完成多少个输入汇报一次进度，0 表示只在结束时汇报。
+            progress_callback (Callable, optional): 接收进度字典的回调，未提供时打印进度。
+
+        Raises:
+            KeyError: 工具链不存在，或 context 缺少模板需要的变量。
+            ValueError: 检查点中记录的输入与本次的输入不一致。
+        """
+        if chain_name not in self.chains:
+            raise KeyError(f"工具链{chain_name}不存在")
+        chain = self.chains[chain_name]
+        missing = chain.missing_keys(context or {})
+        if missing:
+            raise KeyError(f"工具链{chain_name}的模版变量'{missing[0][1]}'未找到")
+        restored = self._load_checkpoint(checkpoint_path) if checkpoint_path else {}
+        report = progress_callback or (lambda progress:print(f"工具链{chain_name}批量执行进度:{progress}"))
+        started = time.perf_counter()
+        progress = {"chain":chain_name,"submitted":0,"completed":0,"failed":0,"resumed":0,"in_flight":0,"elapsed":0.0,"rate":0.0}
+        buffer:Dict[int,str] = {} # 等待产出的结果
+        next_index = 0 # ordered 模式下下一个要产出的序号
+
+        last_key = chain.steps[-1]["output_key"]
+
+        def contexts():
+            # 检查点中已有的输入作为已经结束的运行直接交给调度器产出，其余的送入工具链
+            for index,item in enumerate(inputs):
+                if index in restored:
+                    if restored[index]["input"] != item:
+                        raise ValueError(f"检查点{checkpoint_path}第{index}个输入与本次输入不一致")
+                    run = _ChainRun(index,{"input":item,last_key:restored[index]["result"]})
+                    run.done = set(range(len(chain.steps)))
+                    run.resumed = True
+                    progress["resumed"] += 1
+                    yield run
+                    continue
+                progress["submitted"] += 1
+                yield index,{**(context or {}),"input":item}
+
+        def update(finished:bool = False):
+            progress["in_flight"] = progress["submitted"] - progress["completed"] - progress["failed"]
+            progress["elapsed"] = round(time.perf_counter() - started,2)
+            done = progress["completed"] + progress["failed"]
+            progress["rate"] = round(done / progress["elapsed"],2) if progress["elapsed"] > 0 else 0.0
+            if finished or (progress_every and done % progress_every == 0):
+                report(dict(progress))
+
+        checkpoint = open(checkpoint_path,"a",encoding="utf-8") if checkpoint_path else None
+        if checkpoint and checkpoint.tell() > 0 and not self._ends_with_newline(checkpoint_path):
+            # 上次中断在写一行的中途，先换行，避免新记录接在半行后面
+            checkpoint.write("\n")
+        try:
+            runs = chain._pipeline(self.registry,contexts(),max_in_flight=max_workers * 2,max_workers=max_workers,verbose=verbose)
+            for run in runs:
+                ok,result = chain._result_of(run)
+                if not run.resumed:
+                    # 失败的输入（包括工具返回错误信息的）不写入检查点，下次会重试
+                    if ok:
+                        progress["completed"] += 1
+                        if checkpoint:
+                            checkpoint.write(json.dumps({"index":run.index,"input":run.context["input"],"result":result},ensure_ascii=False) + "\n")
+                            checkpoint.flush()
+                    else:
+                        progress["failed"] += 1
+                    update()
+                buffer[run.index] = result
+                # 产出可以产出的结果
+                if ordered:
+                    while next_index in buffer:
+                        yield next_index,buffer.pop(next_index)
+                        next_index += 1
+                else:
+                    for index in list(buffer):
+                        yield index,buffer.pop(index)
+            # 剩下的结果
+            for index in sorted(buffer):
+                yield index,buffer.pop(index)
+            update(finished=True)
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+    @staticmethod
+    def _load_checkpoint(path:str) -> Dict[int,Dict[str,Any]]:
+        """ 读取检查点文件，返回 输入序号 -> {"input","result"}。中断时写了一半的最后一行会被忽略 """
+        if not os.path.exists(path):
+            return {}
+        restored = {}
+        with open(path,encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                restored[record["index"]] = record
+        return restored
+
+    @staticmethod
+    def _ends_with_newline(path:str) -> bool:
+        with open(path,"rb") as f:
+            f.seek(-1,os.SEEK_END)
+            return f.read(1) == b"\n"
+
     def list_chains(self) -> List[str]:
         """ 列出所有已注册的工具链的名称。"""
         # 返回 chains 字典中所有键的列表
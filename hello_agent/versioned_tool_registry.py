@@ -0,0 +1,121 @@
+# 带版本号的工具注册表
+import threading
+from typing import Optional,Dict,Any,Callable,Hashable
+from hello_agents import ToolRegistry
+
+class VersionedToolRegistry:
+    """
+    工具注册表的包装器。
+    每次增删工具（register_tool / register_function / unregister / clear）都会让版本号加一，
+    工具描述文本以及基于它渲染出的提示词片段按版本号缓存，工具不变时直接复用，
+    既省去了热循环中的重复字符串拼接，也保证同一版本下的提示词前缀逐字节一致。
+
+    其余方法（get_tool、execute_tool、list_tools 等）全部透传给内部的 ToolRegistry。
+    读取版本号时还会比对内部注册表的当前状态（工具/函数的名称、对象和描述），
+    因此绕过包装器直接修改内部注册表，版本号同样会更新，不会用到过期的描述。
+    """
+    def __init__(self,registry:Optional[ToolRegistry] = None):
+        self._registry = registry if registry is not None else ToolRegistry()
+        self._version = 0
+        self._state = self._snapshot()
+        self._lock = threading.Lock()
+        # (版本号, 片段键) -> 渲染结果
+        self._rendered:Dict[tuple,str] = {}
+
+    @property
+    def version(self) -> int:
+        """ 当前注册表版本号，内部注册表的状态变化后自动加一 """
+        state = self._snapshot()
+        if state != self._state:
+            with self._lock:
+                if state != self._state:
+                    self._state = state
+                    self._version += 1
+                    self._rendered.clear()
+        return self._version
+
+    def _snapshot(self) -> tuple:
+        """
+        内部注册表的状态指纹：工具和函数的名称、对象标识和描述。
+        只比较引用和短字符串，开销远小于重新渲染工具描述。
+        """
+        tools = getattr(self._registry,"_tools",None)
+        functions = getattr(self._registry,"_functions",None)
+        if tools is None or functions is None:
+            # 不是 hello_agents 的 ToolRegistry，退回到只比较工具名称
+            return tuple(self._registry.list_tools())
+        return (
+            tuple((name,id(tool),getattr(tool,"description",None)) for name,tool in tools.items()),
+            tuple((name,id(info["func"]),info["description"]) for name,info in functions.items()),
+        )
+
+    @property
+    def registry(self) -> ToolRegistry:
+        """ 被包装的原始注册表 """
+        return self._registry
+
+    def _bump(self):
+        with self._lock:
+            self._version += 1
+            self._state = self._snapshot()
+            # 旧版本的渲染结果不会再被用到，直接清空
+            self._rendered.clear()
+
+    def register_tool(self,tool,*args,**kwargs):
+        result = self._registry.register_tool(tool,*args,**kwargs)
+        self._bump()
+        return result
+
+    def register_function(self,*args,**kwargs):
+        result = self._registry.register_function(*args,**kwargs)
+        self._bump()
+        return result
+
+    def unregister(self,name:str):
+        result = self._registry.unregister(name)
+        self._bump()
+        return result
+
+    def clear(self):
+        result = self._registry.clear()
+        self._bump()
+        return result
+
+    # 与 Agent 上的 add_tool / remove_tool 命名保持一致的别名
+    add_tool = register_tool
+    remove_tool = unregister
+
+    def render(self,key:Hashable,renderer:Callable[[str],str]) -> str:
+        """
+        按当前版本缓存渲染结果。
+
+        Args:
+            key: 片段的标识，不同的提示词片段使用不同的键。
+            renderer: 接收工具描述文本、返回渲染结果的函数，同一版本下只会被调用一次。
+        """
+        cache_key = (self.version,key)
+        cached = self._rendered.get(cache_key)
+        if cached is not None:
+            return cached
+        rendered = renderer(self._registry.get_tools_description())
+        with self._lock:
+            # 渲染期间版本可能已变化，只缓存仍然有效的结果
+            if cache_key[0] == self._version:
+                self._rendered[cache_key] = rendered
+        return rendered
+
+    def get_tools_description(self) -> str:
+        """ 工具描述文本，同一版本只生成一次 """
+        return self.render("tools_description",lambda description:description)
+
+    def __getattr__(self,name:str) -> Any:
+        # 只有在包装器自身找不到属性时才会调用，透传给内部注册表
+        if name == "_registry":
+            raise AttributeError(name)
+        return getattr(self._registry,name)
+
+def ensure_versioned(registry:Optional[ToolRegistry]) -> Optional[VersionedToolRegistry]:
+    """ 如果注册表还没有被包装，则包装成 VersionedToolRegistry；None 原样返回 """
+    if registry is None or isinstance(registry,VersionedToolRegistry):
+        return registry
+    return VersionedToolRegistry(registry)
@@ -2,12 +2,36 @@
 """天气查询 MCP 服务器"""
 
 import json
-import requests
 import os
+import sys
+import time
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future, InvalidStateError
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
 from hello_agents.protocols import MCPServer
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'hello_agent'))
+from http_session import get_session
+
+# 天气数据的上游地址，压力测试时指向本地的模拟服务
+WEATHER_UPSTREAM_URL = os.getenv("WEATHER_UPSTREAM_URL", "https://wttr.in").rstrip("/")
+# wttr.in 的请求超时（连接超时, 读取超时），可以用环境变量 WEATHER_TIMEOUT 统一设置读取超时
+WEATHER_TIMEOUT = (3.05, float(os.getenv("WEATHER_TIMEOUT", "10")))
+# 缓存的新鲜时间（秒），在此时间内同一城市的查询直接返回缓存结果
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+# 预取间隔（秒），后台定期刷新 CITY_MAP 中的城市；设为 0 关闭预取
+WEATHER_PREFETCH_INTERVAL = float(os.getenv("WEATHER_PREFETCH_INTERVAL", str(WEATHER_CACHE_TTL * 0.8)))
+# 异步工具同时向上游发起的最大请求数，也是异步连接池的大小
+WEATHER_MAX_CONCURRENCY = int(os.getenv("WEATHER_MAX_CONCURRENCY", "10"))
+# 传输方式：stdio（默认，每个客户端启动一个服务器进程）或 http / sse（多个客户端共享一个服务器进程）
+WEATHER_MCP_TRANSPORT = os.getenv("WEATHER_MCP_TRANSPORT", "stdio")
+WEATHER_MCP_HOST = os.getenv("WEATHER_MCP_HOST", "127.0.0.1")
+WEATHER_MCP_PORT = int(os.getenv("WEATHER_MCP_PORT", "8000"))
+
 # 创建 MCP 服务器
 weather_server = MCPServer(name="weather-server", description="真实天气查询服务")
 
@@ -19,17 +43,49 @@ CITY_MAP = {
 }
 
 
-def get_weather_data(city: str) -> Dict[str, Any]:
-    """从 wttr.in 获取天气数据"""
-    city_en = CITY_MAP.get(city, city)
-    url = f"https://wttr.in/{city_en}?format=j1"
-    response = requests.get(url, timeout=10)
+def fetch_weather_data(city_en: str) -> Dict[str, Any]:
+    """从 wttr.in 获取天气数据（不经过缓存）"""
+    url = f"{WEATHER_UPSTREAM_URL}/{city_en}?format=j1"
+    # 共享会话保持与 wttr.in 的长连接，并对暂时性错误做带抖动的重试
+    response = get_session("weather", timeout=WEATHER_TIMEOUT).get(url)
     response.raise_for_status()
     data = response.json()
+    return parse_weather(data)
+
+
+# 每个事件循环一份异步连接池和并发信号量（httpx.AsyncClient 和 asyncio.Semaphore 都不能跨事件循环使用）
+_loop_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+
+def get_async_resources() -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+    """返回当前事件循环共享的 (AsyncClient, Semaphore)，第一次调用时创建"""
+    loop = asyncio.get_running_loop()
+    resources = _loop_resources.get(loop)
+    if resources is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(WEATHER_TIMEOUT[1], connect=WEATHER_TIMEOUT[0]),
+            limits=httpx.Limits(max_connections=WEATHER_MAX_CONCURRENCY, max_keepalive_connections=WEATHER_MAX_CONCURRENCY),
+            # 连接失败时自动重试
+            transport=httpx.AsyncHTTPTransport(retries=2),
+        )
+        resources = _loop_resources[loop] = (client, asyncio.Semaphore(WEATHER_MAX_CONCURRENCY))
+    return resources
+
+
+async def afetch_weather_data(city_en: str) -> Dict[str, Any]:
+    """异步地从 wttr.in 获取天气数据（不经过缓存），等待上游时不会阻塞其他客户端的请求"""
+    client, semaphore = get_async_resources()
+    async with semaphore:
+        response = await client.get(f"{WEATHER_UPSTREAM_URL}/{city_en}", params={"format": "j1"})
+    response.raise_for_status()
+    return parse_weather(response.json())
+
+
+def parse_weather(data: Dict[str, Any]) -> Dict[str, Any]:
+    """从 wttr.in 的 JSON 中提取当前天气"""
     current = data["current_condition"][0]
 
     return {
-        "city": city,
         "temperature": float(current["temp_C"]),
         "feels_like": float(current["FeelsLikeC"]),
         "humidity": int(current["humidity"]),
@@ -40,16 +96,185 @@ def get_weather_data(city: str) -> Dict[str, Any]:
     }
 
 
-# 定义工具函数
-def get_weather(city: str) -> str:
+class WeatherCache:
+    """
+    按城市缓存天气数据。
+    - 在 ttl 秒内同一城市的查询直接返回缓存；
+    - 同一城市的并发查询合并为一次上游请求，其余请求等待这次请求的结果，
+      同步调用（预取线程）和异步调用（工具）共用同一张进行中请求表；
+    - 上游请求失败时不写入缓存，错误会同时抛给所有等待的请求。
+    """
+
+    def __init__(self, ttl: float = WEATHER_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[Dict[str, Any], float]] = {}  # 城市 -> (天气数据, 获取时间)
+        self._inflight: Dict[str, Future] = {}  # 城市 -> 正在进行的上游请求
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # 搭上了其他请求的便车、没有自己请求上游的次数
+
+    @staticmethod
+    def key(city: str) -> str:
+        return CITY_MAP.get(city.strip(), city.strip()).lower()
+
+    def _lookup(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """返回未过期的 (天气数据, 缓存年龄)，没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self.hits += 1
+                return entry[0], time.monotonic() - entry[1]
+        return None
+
+    def get(self, city: str) -> Tuple[Dict[str, Any], float]:
+        """返回 (天气数据, 缓存年龄秒数)，缓存过期或不存在时请求上游"""
+        key = self.key(city)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        data, fetched_at = self._fetch(key, CITY_MAP.get(city.strip(), city.strip()))
+        return data, time.monotonic() - fetched_at
+
+    async def aget(self, city: str) -> Tuple[Dict[str, Any], float]:
+        """get 的异步版本，等待上游时让出事件循环"""
+        key = self.key(city)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        data, fetched_at = await self._afetch(key, CITY_MAP.get(city.strip(), city.strip()))
+        return data, time.monotonic() - fetched_at
+
+    def refresh(self, city: str) -> None:
+        """忽略缓存强制刷新一个城市，用于预取"""
+        self._fetch(self.key(city), CITY_MAP.get(city, city))
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """返回该城市进行中的请求，以及调用方是否需要自己请求上游"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            self.misses += 1
+            return future, True
+
+    def _complete(self, key: str, future: Future, data: Optional[Dict[str, Any]] = None, error: Optional[BaseException] = None):
+        """保存上游请求的结果并唤醒所有等待的请求"""
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None:
+                self._entries[key] = (data, time.monotonic())
+                result = self._entries[key]
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            pass  # 共享的 future 已经结束（例如被取消），结果仍然写入了缓存
+
+    def _fetch(self, key: str, city_en: str) -> Tuple[Dict[str, Any], float]:
+        future, leader = self._claim(key)
+        if leader:
+            try:
+                self._complete(key, future, data=fetch_weather_data(city_en))
+            except Exception as e:
+                self._complete(key, future, error=e)
+            except BaseException as e:
+                # 如 KeyboardInterrupt：先让等待的请求失败，再把中断继续抛出
+                self._complete(key, future, error=RuntimeError(f"上游请求被中断: {e!r}"))
+                raise
+        return future.result()
+
+    async def _afetch(self, key: str, city_en: str) -> Tuple[Dict[str, Any], float]:
+        future, leader = self._claim(key)
+        if leader:
+            try:
+                self._complete(key, future, data=await afetch_weather_data(city_en))
+            except Exception as e:
+                self._complete(key, future, error=e)
+            except BaseException:
+                # 发起请求的协程被取消（CancelledError 不是 Exception 的子类）：
+                # 移除进行中的请求并让等待的请求失败，否则它们会永远等下去；取消本身继续向上抛出
+                self._complete(key, future, error=RuntimeError(f"{city_en} 的上游请求已被取消"))
+                raise
+        # 共享的 future 被所有合并的请求等待：用 shield 隔离，某个等待者被取消时不会取消其他人的请求
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self._entries),
+                "ttl": self.ttl,
+            }
+
+
+weather_cache = WeatherCache()
+
+
+def get_weather_data(city: str) -> Dict[str, Any]:
+    """获取天气数据，优先使用缓存；cache_age 为数据获取至今的秒数"""
+    data, age = weather_cache.get(city)
+    return {"city": city, **data, "cache_age": round(age, 1)}
+
+
+async def aget_weather_data(city: str) -> Dict[str, Any]:
+    """get_weather_data 的异步版本"""
+    data, age = await weather_cache.aget(city)
+    return {"city": city, **data, "cache_age": round(age, 1)}
+
+
+def start_prefetch(interval: float = WEATHER_PREFETCH_INTERVAL) -> Optional[threading.Thread]:
+    """启动后台预取线程，定期刷新 CITY_MAP 中的所有城市，使热门城市的查询总能命中缓存"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            for city in CITY_MAP:
+                try:
+                    weather_cache.refresh(city)
+                except Exception as e:
+                    # stdio 模式下标准输出用于 MCP 通信，日志只能写到标准错误
+                    print(f"预取{city}天气失败: {e}", file=sys.stderr)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="weather-prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
+# 定义工具函数。查询天气的工具是异步的，等待上游时服务器可以继续处理其他客户端的请求
+async def get_weather(city: str) -> str:
     """获取指定城市的当前天气"""
     try:
-        weather_data = get_weather_data(city)
+        weather_data = await aget_weather_data(city)
         return json.dumps(weather_data, ensure_ascii=False, indent=2)
     except Exception as e:
         return json.dumps({"error": str(e), "city": city}, ensure_ascii=False)
 
 
+async def get_weather_batch(cities: List[str]) -> str:
+    """并发获取多个城市的当前天气，一次返回所有结果，适合比较多个城市"""
+    # 去掉重复的城市，保持原有顺序
+    unique_cities = list(dict.fromkeys(city.strip() for city in cities if city.strip()))
+
+    async def one(city: str) -> Dict[str, Any]:
+        try:
+            return await aget_weather_data(city)
+        except Exception as e:
+            return {"error": str(e), "city": city}
+
+    results = await asyncio.gather(*(one(city) for city in unique_cities))
+    errors = sum(1 for result in results if "error" in result)
+    return json.dumps({"results": results, "count": len(results), "errors": errors}, ensure_ascii=False, indent=2)
+
+
 def list_supported_cities() -> str:
     """列出所有支持的中文城市"""
     result = {"cities": list(CITY_MAP.keys()), "count": len(CITY_MAP)}
@@ -61,16 +286,22 @@ def get_server_info() -> str:
     info = {
         "name": "Weather MCP Server",
         "version": "1.0.0",
-        "tools": ["get_weather", "list_supported_cities", "get_server_info"]
+        "tools": ["get_weather", "get_weather_batch", "list_supported_cities", "get_server_info"],
+        "cache": weather_cache.stats()
     }
     return json.dumps(info, ensure_ascii=False, indent=2)
 
 
 # 注册工具到服务器
 weather_server.add_tool(get_weather)
+weather_server.add_tool(get_weather_batch)
 weather_server.add_tool(list_supported_cities)
 weather_server.add_tool(get_server_info)
 
 
 if __name__ == "__main__":
-    weather_server.run()
+    start_prefetch()
+    if WEATHER_MCP_TRANSPORT == "stdio":
+        weather_server.run()
+    else:
+        weather_server.run(transport=WEATHER_MCP_TRANSPORT, host=WEATHER_MCP_HOST, port=WEATHER_MCP_PORT)
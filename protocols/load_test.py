@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""天气 MCP 服务器压力测试
+
+用 N 个并发的 MCPClient 按指定的工具调用比例持续调用服务器，统计吞吐量、p50/p95/p99 延迟和错误率，
+输出 JSON 报告。上游天气接口由本地的模拟服务代替，不需要访问网络。
+
+    # 一个 HTTP 服务器进程，依次用 1/4/16/32 个客户端压测，每档 10 秒
+    python load_test.py --concurrency 1 4 16 32 --duration 10 --output load_report.json
+
+    # 调整工具比例、关闭服务器缓存，并让上游变慢、出错
+    python load_test.py --mix get_weather=0.5,get_weather_batch=0.5 --cache-ttl 0 \\
+        --upstream-delay 0.2 --upstream-error-rate 0.05
+
+--transport stdio 时每个客户端各自启动一个服务器进程，测的是多进程的总吞吐量；
+默认的 http 模式下所有客户端共享一个服务器进程，可以看出单个服务器在哪个并发度饱和。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple, Union
+from hello_agents.protocols.mcp.client import MCPClient
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "14_weather_mcp_server.py")
+
+# 默认的工具调用比例
+DEFAULT_MIX = {"get_weather": 0.7, "get_weather_batch": 0.2, "list_supported_cities": 0.1}
+
+
+class StubUpstream:
+    """模拟 wttr.in 的本地 HTTP 服务，可以设置响应延迟和错误率"""
+
+    def __init__(self, delay: float = 0.05, error_rate: float = 0.0, seed: int = 0):
+        self.delay = delay
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _respond(self, handler: BaseHTTPRequestHandler):
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            temperature = self._rng.randint(-5, 35)
+        time.sleep(self.delay)
+        if failed:
+            handler.send_response(503)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        body = json.dumps({
+            "current_condition": [{
+                "temp_C": str(temperature),
+                "FeelsLikeC": str(temperature - 1),
+                "humidity": "55",
+                "weatherDesc": [{"value": "Partly cloudy"}],
+                "windspeedKmph": "12",
+                "visibility": "10",
+            }]
+        }).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self) -> str:
+        """启动服务并返回它的地址"""
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持长连接，和真实上游一致
+
+            def do_GET(self):
+                upstream._respond(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="stub-upstream", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_http_server(env: Dict[str, str], port: int, timeout: float = 30.0) -> subprocess.Popen:
+    """以 HTTP 传输启动一个天气服务器进程，等待端口可以连接"""
+    env = {**env, "WEATHER_MCP_TRANSPORT": "http", "WEATHER_MCP_PORT": str(port)}
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务器进程启动失败，退出码 {process.returncode}")
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return process
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("等待服务器启动超时")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析 "get_weather=0.7,get_weather_batch=0.3" 形式的工具调用比例"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight) if weight else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"无效的工具比例: {text}")
+    return mix
+
+
+def make_arguments(tool: str, cities: List[str], rng: random.Random, batch_size: int) -> Dict[str, Any]:
+    """为一次工具调用随机生成参数"""
+    if tool == "get_weather":
+        return {"city": rng.choice(cities)}
+    if tool == "get_weather_batch":
+        return {"cities": rng.sample(cities, min(batch_size, len(cities)))}
+    return {}
+
+
+def is_tool_error(result: Any) -> bool:
+    """工具把错误放在返回的 JSON 里（get_weather 的 error 字段、get_weather_batch 的 errors 计数）"""
+    try:
+        data = json.loads(result)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(data, dict) and ("error" in data or data.get("errors", 0) > 0)
+
+
+class StageClock:
+    """所有客户端都连接上（或连接失败）之后才开始计时，服务器进程的启动时间不计入压测"""
+
+    def __init__(self, clients: int, warmup: float, duration: float):
+        self.clients = clients
+        self.warmup = warmup
+        self.duration = duration
+        self.measure_start = 0.0
+        self.deadline = 0.0
+        self._arrived = 0
+        self._started = asyncio.Event()
+
+    async def arrive(self):
+        self._arrived += 1
+        if self._arrived == self.clients:
+            self.measure_start = time.perf_counter() + self.warmup
+            self.deadline = self.measure_start + self.duration
+            self._started.set()
+        await self._started.wait()
+
+
+async def client_worker(
+    source: Union[str, List[str]],
+    env: Optional[Dict[str, str]],
+    mix: Dict[str, float],
+    cities: List[str],
+    batch_size: int,
+    clock: StageClock,
+    rng: random.Random,
+    samples: List[Tuple[str, float, str]],
+):
+    """一个客户端：在截止时间前一个接一个地调用工具，记录 (工具名, 耗时, 结果状态)"""
+    tools, weights = list(mix), list(mix.values())
+    arrived = False
+    try:
+        async with MCPClient(source, env=env) as client:
+            arrived = True
+            await clock.arrive()
+            while time.perf_counter() < clock.deadline:
+                tool = rng.choices(tools, weights)[0]
+                arguments = make_arguments(tool, cities, rng, batch_size)
+                start = time.perf_counter()
+                try:
+                    result = await client.call_tool(tool, arguments)
+                    status = "tool_error" if is_tool_error(result) else "ok"
+                except Exception:
+                    status = "exception"
+                # 预热阶段的调用不计入统计
+                if start >= clock.measure_start:
+                    samples.append((tool, time.perf_counter() - start, status))
+    except Exception:
+        samples.append(("connect", 0.0, "exception"))
+        if not arrived:
+            await clock.arrive()
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def summarize(samples: List[Tuple[str, float, str]], elapsed: float) -> Dict[str, Any]:
+    """统计一组调用的吞吐量、延迟（毫秒）和错误率"""
+    latencies = sorted(seconds * 1000 for _, seconds, _ in samples)
+    tool_errors = sum(1 for _, _, status in samples if status == "tool_error")
+    exceptions = sum(1 for _, _, status in samples if status == "exception")
+    count = len(samples)
+
+    def rounded(value):
+        return None if value is None else round(value, 2)
+
+    return {
+        "calls": count,
+        "throughput": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "tool_errors": tool_errors,
+        "exceptions": exceptions,
+        "error_rate": round((tool_errors + exceptions) / count, 4) if count else 0.0,
+        "latency_ms": {
+            "mean": rounded(sum(latencies) / count) if count else None,
+            "p50": rounded(percentile(latencies, 0.50)),
+            "p95": rounded(percentile(latencies, 0.95)),
+            "p99": rounded(percentile(latencies, 0.99)),
+            "max": rounded(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+async def run_stage(source, env, concurrency: int, duration: float, warmup: float,
+                    mix: Dict[str, float], cities: List[str], batch_size: int, seed: int) -> Dict[str, Any]:
+    """用 concurrency 个客户端压测 duration 秒（不含预热），返回这一档的统计"""
+    samples: List[Tuple[str, float, str]] = []
+    clock = StageClock(concurrency, warmup, duration)
+    await asyncio.gather(*(
+        client_worker(source, env, mix, cities, batch_size, clock, random.Random(seed + i), samples)
+        for i in range(concurrency)
+    ))
+    elapsed = max(1e-9, time.perf_counter() - clock.measure_start)
+    connect_failures = sum(1 for tool, _, _ in samples if tool == "connect")
+    samples = [sample for sample in samples if sample[0] != "connect"]
+    return {
+        "concurrency": concurrency,
+        "duration": round(elapsed, 2),
+        "connect_failures": connect_failures,
+        **summarize(samples, elapsed),
+        "by_tool": {tool: summarize([s for s in samples if s[0] == tool], elapsed) for tool in mix},
+    }
+
+
+async def fetch_server_info(source, env) -> Tuple[List[str], Dict[str, Any]]:
+    """返回服务器支持的城市列表和服务器信息"""
+    async with MCPClient(source, env=env) as client:
+        cities = json.loads(await client.call_tool("list_supported_cities", {}))["cities"]
+        info = json.loads(await client.call_tool("get_server_info", {}))
+    return cities, info
+
+
+def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = parse_mix(args.mix) if args.mix else dict(DEFAULT_MIX)
+    upstream = StubUpstream(delay=args.upstream_delay, error_rate=args.upstream_error_rate, seed=args.seed)
+    env = {
+        **os.environ,
+        "WEATHER_UPSTREAM_URL": upstream.start(),
+        "WEATHER_CACHE_TTL": str(args.cache_ttl),
+        "WEATHER_PREFETCH_INTERVAL": "0",
+    }
+    server = None
+    try:
+        if args.transport == "http":
+            port = free_port()
+            server = start_http_server(env, port)
+            source, client_env = f"http://127.0.0.1:{port}/mcp", None
+        else:
+            source, client_env = [sys.executable, SERVER_SCRIPT], env
+
+        stages = []
+        # MCPClient 每次连接和断开都会打印提示，压测期间屏蔽掉
+        with contextlib.redirect_stdout(io.StringIO()):
+            cities, _ = asyncio.run(fetch_server_info(source, client_env))
+        for concurrency in args.concurrency:
+            with contextlib.redirect_stdout(io.StringIO()):
+                stage = asyncio.run(run_stage(source, client_env, concurrency, args.duration, args.warmup,
+                                              mix, cities, args.batch_size, args.seed))
+            stages.append(stage)
+            latency = stage["latency_ms"]
+            print(f"并发 {concurrency:>4}: {stage['throughput']:>8.1f} 次/秒  "
+                  f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+                  f"错误率 {stage['error_rate']:.2%}", file=sys.stderr)
+
+        server_info = None
+        if args.transport == "http":
+            # 只有共享的服务器进程才有跨阶段的缓存统计
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, server_info = asyncio.run(fetch_server_info(source, client_env))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        upstream.stop()
+
+    peak = max(stages, key=lambda stage: stage["throughput"]) if stages else None
+    return {
+        "config": {
+            "transport": args.transport,
+            "mix": mix,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "batch_size": args.batch_size,
+            "cache_ttl": args.cache_ttl,
+            "upstream_delay": args.upstream_delay,
+            "upstream_error_rate": args.upstream_error_rate,
+        },
+        "stages": stages,
+        # 吞吐量最高的并发度，再往上加并发只会增加延迟
+        "peak": {"concurrency": peak["concurrency"], "throughput": peak["throughput"]} if peak else None,
+        "upstream": {"requests": upstream.requests, "errors": upstream.errors},
+        "server": server_info,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="天气 MCP 服务器压力测试")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="依次测试的并发客户端数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每档并发的统计时长（秒）")
+    parser.add_argument("--warmup", type=float, default=1.0, help="每档并发开始统计前的预热时长（秒）")
+    parser.add_argument("--mix", default=None, help="工具调用比例，如 get_weather=0.7,get_weather_batch=0.2,list_supported_cities=0.1")
+    parser.add_argument("--batch-size", type=int, default=4, help="get_weather_batch 每次查询的城市数")
+    parser.add_argument("--transport", choices=["http", "stdio"], default="http", help="http: 所有客户端共享一个服务器进程；stdio: 每个客户端一个进程")
+    parser.add_argument("--cache-ttl", type=float, default=600, help="服务器的天气缓存时间（秒），0 表示每次都请求上游")
+    parser.add_argument("--upstream-delay", type=float, default=0.05, help="模拟上游的响应延迟（秒）")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0, help="模拟上游返回 503 的比例")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", default=None, help="JSON 报告的输出路径，不指定时打印到标准输出")
+    args = parser.parse_args(argv)
+    # hello_agents 导入时把日志级别设成了 INFO，每次 HTTP 请求都会打一行日志，压测时只保留警告
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = run_load_test(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"报告已写入 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
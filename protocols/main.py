@@ -1,12 +1,17 @@
 """在 Agent 中使用天气 MCP 服务器"""
 
 import os
+import sys
 from dotenv import load_dotenv
 from hello_agents import SimpleAgent, HelloAgentsLLM
-from hello_agents.tools import MCPTool
+from mcp_pool import get_pool, PooledMCPTool
 
 load_dotenv()
 
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "14_weather_mcp_server.py")
+# 常驻的天气服务器进程数，所有助手共享
+WEATHER_POOL_SIZE = int(os.getenv("WEATHER_POOL_SIZE", "2"))
+
 
 def create_weather_assistant():
     """创建天气助手"""
@@ -16,13 +21,15 @@ def create_weather_assistant():
         name="天气助手",
         llm=llm,
         system_prompt="""你是天气助手，可以查询城市天气。
-使用 get_weather 工具查询天气，支持中文城市名。
+使用 weather_get_weather 工具查询天气，支持中文城市名；
+需要比较多个城市时使用 weather_get_weather_batch 工具一次查询。
 """
     )
 
-    # 添加天气 MCP 工具
-    server_script = os.path.join(os.path.dirname(__file__), "14_weather_mcp_server.py")
-    weather_tool = MCPTool(server_command=["python", server_script])
+    # 添加天气 MCP 工具。MCPTool 每次调用都会启动一个新的服务器进程，
+    # 这里改用共享的常驻进程池，多个助手、多次调用都复用同一批进程
+    pool = get_pool([sys.executable, SERVER_SCRIPT], size=WEATHER_POOL_SIZE)
+    weather_tool = PooledMCPTool(pool, name="weather")
     assistant.add_tool(weather_tool)
 
     return assistant
@@ -35,6 +42,7 @@ def demo():
     print("\n查询北京天气：")
     response = assistant.run("北京今天天气怎么样？")
     print(f"回答: {response}\n")
+    print(f"进程池指标: {get_pool(['python', SERVER_SCRIPT]).metrics()}")
 
 
 def interactive():
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""常驻 MCP 服务器进程池
+
+MCPTool 每次调用工具都会启动一个新的服务器子进程，每个助手实例还要为工具发现再启动一次，
+Python 解释器和依赖导入的启动开销远大于一次天气查询本身。
+MCPServerPool 维护若干个常驻的服务器进程，由所有助手共享：
+- 连接在后台事件循环中保持打开，调用按轮询方式分发到各个连接；
+- 定期用 list_tools 检查每个连接（部分服务器不支持 ping），进程崩溃或失去响应时自动重启；
+- 统计启动耗时、调用次数、重启次数以及相对"每次调用启动一个进程"节省的启动时间。
+"""
+
+import sys
+import time
+import atexit
+import asyncio
+import itertools
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+from hello_agents.protocols.mcp.client import MCPClient
+from hello_agents.tools.base import Tool
+
+
+class _PoolWorker:
+    """池中的一个服务器进程及其 MCP 连接"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.client: Optional[MCPClient] = None
+        self.task: Optional[asyncio.Task] = None
+        self.ready: Optional[asyncio.Event] = None
+        self.stop: Optional[asyncio.Event] = None
+        self.healthy = False
+        self.restarting = False
+        self.error: Optional[BaseException] = None
+        self.startup_seconds = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.restarts = 0
+
+
+class MCPServerPool:
+    """常驻 MCP 服务器进程池，可以在多个线程、多个助手之间共享"""
+
+    def __init__(
+        self,
+        server_command: List[str],
+        size: int = 2,
+        env: Optional[Dict[str, str]] = None,
+        health_check_interval: float = 30.0,
+        call_timeout: float = 30.0,
+        startup_timeout: float = 30.0,
+    ):
+        """
+        Args:
+            server_command: 服务器启动命令，如 ["python", "server.py"]
+            size: 常驻进程数
+            env: 传给服务器进程的环境变量
+            health_check_interval: 健康检查间隔（秒）
+            call_timeout: 单次工具调用的超时（秒）
+            startup_timeout: 等待进程启动完成的超时（秒）
+        """
+        self.server_command = list(server_command)
+        self.size = size
+        self.env = env
+        self.health_check_interval = health_check_interval
+        self.call_timeout = call_timeout
+        self.startup_timeout = startup_timeout
+        self.tools: List[Dict[str, Any]] = []  # 服务器提供的工具列表，启动时发现一次
+        self._workers = [_PoolWorker(i) for i in range(size)]
+        self._round_robin = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._restart_tasks: Set[asyncio.Task] = set()  # 调用出错时安排的后台重启，保存引用以免任务被回收
+        self._lock = threading.Lock()
+        self._started = False
+        self._total_calls = 0
+
+    # ---- 生命周期 ----
+
+    def start(self) -> "MCPServerPool":
+        """启动后台事件循环和所有服务器进程，等待它们全部就绪"""
+        with self._lock:
+            if self._started:
+                return self
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-pool", daemon=True)
+            self._thread.start()
+            startup = self._submit(self._start_all())
+            try:
+                startup.result(self.startup_timeout * max(1, self.size))
+            except BaseException:
+                # 启动失败：关闭已经启动的进程，并释放事件循环和线程，之后重试会重新创建
+                startup.cancel()
+                self._teardown()
+                raise
+            self._started = True
+        return self
+
+    def _teardown(self):
+        """停止所有进程，关闭后台事件循环并等待线程退出。调用方需持有 self._lock"""
+        try:
+            self._submit(self._stop_all()).result(10)
+        except Exception as e:
+            print(f"关闭 MCP 进程池时出错: {e}", file=sys.stderr)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        if not self._thread.is_alive():
+            self._loop.close()
+        self._loop = None
+        self._thread = None
+        self._health_task = None
+
+    def shutdown(self):
+        """关闭所有服务器进程和后台事件循环"""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            self._teardown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _start_all(self):
+        await asyncio.gather(*(self._spawn(worker) for worker in self._workers))
+        if not any(worker.healthy for worker in self._workers):
+            errors = [str(worker.error) for worker in self._workers if worker.error]
+            raise RuntimeError(f"MCP 服务器全部启动失败: {errors}")
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _stop_all(self):
+        if self._health_task:
+            self._health_task.cancel()
+        for task in list(self._restart_tasks):
+            task.cancel()
+        await asyncio.gather(*self._restart_tasks, return_exceptions=True)
+        await asyncio.gather(*(self._retire(worker) for worker in self._workers), return_exceptions=True)
+
+    # ---- 单个进程的管理 ----
+
+    async def _spawn(self, worker: _PoolWorker):
+        """启动一个服务器进程并等待连接就绪，记录启动耗时"""
+        worker.ready = asyncio.Event()
+        worker.stop = asyncio.Event()
+        worker.healthy = False
+        worker.error = None
+        worker.task = asyncio.create_task(self._hold_connection(worker))
+        try:
+            await asyncio.wait_for(worker.ready.wait(), self.startup_timeout)
+        except asyncio.TimeoutError:
+            worker.error = TimeoutError("服务器启动超时")
+            await self._retire(worker)
+
+    async def _hold_connection(self, worker: _PoolWorker):
+        """
+        在同一个任务中打开并持有连接，直到收到停止信号。
+        MCP 客户端的上下文必须在同一个任务中进入和退出，所以连接的整个生命周期都放在这里。
+        """
+        started = time.perf_counter()
+        try:
+            async with MCPClient(self.server_command, env=self.env) as client:
+                if not self.tools:
+                    self.tools = await client.list_tools()
+                worker.client = client
+                worker.startup_seconds += time.perf_counter() - started
+                worker.healthy = True
+                worker.ready.set()
+                await worker.stop.wait()
+        except Exception as e:
+            worker.error = e
+        finally:
+            worker.healthy = False
+            worker.client = None
+            worker.ready.set()
+
+    async def _retire(self, worker: _PoolWorker):
+        """让持有连接的任务退出，服务器进程随之关闭"""
+        worker.healthy = False
+        if worker.stop:
+            worker.stop.set()
+        if worker.task:
+            try:
+                await asyncio.wait_for(worker.task, 10)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                worker.task.cancel()
+            except Exception:
+                pass
+
+    async def _restart(self, worker: _PoolWorker):
+        # 调用失败和健康检查可能同时发现同一个进程出错，只重启一次
+        if worker.restarting:
+            return
+        worker.restarting = True
+        print(f"MCP 服务器进程 #{worker.index} 无响应，正在重启", file=sys.stderr)
+        await self._retire(worker)
+        worker.restarts += 1
+        try:
+            await self._spawn(worker)
+        finally:
+            worker.restarting = False
+
+    async def _check(self, worker: _PoolWorker) -> bool:
+        """
+        健康检查：连接任务仍在运行且能在限定时间内列出工具。
+        不使用 ping，部分服务器实现（包括 fastmcp 的 stdio 服务器）不支持 ping 方法。
+        """
+        if not worker.healthy or worker.client is None or worker.task is None or worker.task.done():
+            return False
+        try:
+            await asyncio.wait_for(worker.client.list_tools(), 5)
+            return True
+        except Exception:
+            return False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for worker in self._workers:
+                if not worker.restarting and not await self._check(worker):
+                    await self._restart(worker)
+
+    def _schedule_restart(self, worker: _PoolWorker):
+        """在后台重启进程，不阻塞当前调用"""
+        task = asyncio.create_task(self._restart(worker))
+        self._restart_tasks.add(task)
+        task.add_done_callback(self._restart_done)
+
+    def _restart_done(self, task: asyncio.Task):
+        self._restart_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"重启 MCP 服务器进程失败: {task.exception()}", file=sys.stderr)
+
+    # ---- 调用分发 ----
+
+    def _next_worker(self, exclude: Optional[_PoolWorker] = None) -> Optional[_PoolWorker]:
+        """轮询选出下一个健康的进程"""
+        for _ in range(self.size):
+            worker = self._workers[next(self._round_robin) % self.size]
+            if worker.healthy and worker.client is not None and worker is not exclude:
+                return worker
+        return None
+
+    async def _acall(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """调用工具；所选进程出错时立即安排重启，并在另一个进程上重试一次"""
+        failed: Optional[_PoolWorker] = None
+        for _ in range(2):
+            worker = self._next_worker(exclude=failed)
+            if worker is None:
+                break
+            try:
+                result = await worker.client.call_tool(tool_name, arguments)
+                worker.calls += 1
+                self._total_calls += 1
+                return result
+            except Exception as e:
+                worker.failures += 1
+                failed = worker
+                if not await self._check(worker):
+                    self._schedule_restart(worker)
+                last_error = e
+        if failed is not None:
+            raise last_error
+        raise RuntimeError("MCP 进程池中没有可用的服务器进程")
+
+    def call_tool(self, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> Any:
+        """同步调用工具，可以在任意线程中使用"""
+        self.start()
+        return self._submit(self._acall(tool_name, arguments or {})).result(self.call_timeout)
+
+    async def acall_tool(self, tool_name: str, arguments: Optional[Dict[str, Any]] = None) -> Any:
+        """异步调用工具，可以在调用方自己的事件循环中使用"""
+        self.start()
+        return await asyncio.wrap_future(self._submit(self._acall(tool_name, arguments or {})))
+
+    def list_tools(self) -> List[Dict[str, Any]]:
+        self.start()
+        return self.tools
+
+    # ---- 指标 ----
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        进程池指标。
+        estimated_startup_saved_seconds 估算相对"每次调用启动一个新进程"（MCPTool 的做法）节省的启动时间：
+        每次调用本应付出一次平均启动耗时，池本身只为每个进程（含重启）付出一次。
+        """
+        spawns = sum(1 + worker.restarts for worker in self._workers)
+        startup_total = sum(worker.startup_seconds for worker in self._workers)
+        avg_startup = startup_total / spawns if spawns else 0.0
+        return {
+            "size": self.size,
+            "healthy": sum(1 for worker in self._workers if worker.healthy),
+            "calls": self._total_calls,
+            "failures": sum(worker.failures for worker in self._workers),
+            "restarts": sum(worker.restarts for worker in self._workers),
+            "avg_startup_seconds": round(avg_startup, 3),
+            "startup_seconds_total": round(startup_total, 3),
+            "estimated_startup_saved_seconds": round(max(0.0, self._total_calls * avg_startup - startup_total), 3),
+            "workers": [
+                {"index": worker.index, "healthy": worker.healthy, "calls": worker.calls, "restarts": worker.restarts}
+                for worker in self._workers
+            ],
+        }
+
+
+_pools: Dict[Tuple[str, ...], MCPServerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(server_command: List[str], size: int = 2, **kwargs) -> MCPServerPool:
+    """按启动命令返回进程内共享的进程池，第一次调用时创建并启动；之后的调用忽略 size 等参数"""
+    key = tuple(server_command)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = MCPServerPool(server_command, size=size, **kwargs)
+    return pool.start()
+
+
+@atexit.register
+def shutdown_pools():
+    """关闭所有共享的进程池"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+class PooledMCPTool(Tool):
+    """
+    使用共享进程池的 MCP 工具，接口与 MCPTool 一致（action=list_tools / call_tool），
+    auto_expand 为 True 时展开为每个服务器工具一个独立工具，工具名为 "{name}_{工具名}"。
+    """
+
+    def __init__(self, pool: MCPServerPool, name: str = "mcp", description: Optional[str] = None, auto_expand: bool = True):
+        self.pool = pool.start()
+        self.auto_expand = auto_expand
+        self.prefix = f"{name}_" if auto_expand else ""
+        if description is None:
+            tool_names = ", ".join(tool["name"] for tool in self.pool.tools)
+            description = f"MCP工具服务器（常驻进程池），提供{len(self.pool.tools)}个工具: {tool_names}"
+        super().__init__(name=name, description=description, expandable=auto_expand)
+
+    def get_expanded_tools(self) -> List[Tool]:
+        if not self.auto_expand:
+            return []
+        from hello_agents.tools.builtin.mcp_wrapper_tool import MCPWrappedTool
+        return [MCPWrappedTool(mcp_tool=self, tool_info=tool_info, prefix=self.prefix) for tool_info in self.pool.tools]
+
+    def get_parameters(self):
+        return []
+
+    def run(self, parameters: Dict[str, Any]) -> str:
+        action = parameters.get("action", "").lower()
+        if not action and "tool_name" in parameters:
+            action = "call_tool"
+
+        try:
+            if action == "list_tools":
+                tools = self.pool.list_tools()
+                if not tools:
+                    return "没有找到可用的工具"
+                return f"找到 {len(tools)} 个工具:\n" + "".join(f"- {tool['name']}: {tool['description']}\n" for tool in tools)
+            if action == "call_tool":
+                tool_name = parameters.get("tool_name")
+                if not tool_name:
+                    return "错误：必须指定 tool_name 参数"
+                result = self.pool.call_tool(tool_name, parameters.get("arguments", {}))
+                return f"工具 '{tool_name}' 执行结果:\n{result}"
+            return f"错误：不支持的操作 '{action}'"
+        except Exception as e:
+            return f"MCP 操作失败: {e}"
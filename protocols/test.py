@@ -34,6 +34,13 @@ async def test_weather_server():
             if "error" not in weather:
                 print(f"深圳天气: {weather['temperature']}°C, {weather['condition']}")
 
+            # 测试5: 一次调用批量查询多个城市
+            batch = json.loads(await client.call_tool("get_weather_batch", {"cities": ["北京", "上海", "广州", "成都"]}))
+            print(f"\n批量查询: {batch['count']} 个城市, {batch['errors']} 个失败")
+            for weather in batch["results"]:
+                if "error" not in weather:
+                    print(f"  {weather['city']}: {weather['temperature']}°C, {weather['condition']} (缓存 {weather['cache_age']}s)")
+
             print("\n✅ 所有测试完成！")
 
     except Exception as e:
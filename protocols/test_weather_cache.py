@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""天气缓存的合并请求测试，可以用 pytest 运行：python -m pytest -q test_weather_cache.py"""
+
+import asyncio
+import importlib.util
+import os
+
+_spec = importlib.util.spec_from_file_location(
+    "weather_mcp_server", os.path.join(os.path.dirname(os.path.abspath(__file__)), "14_weather_mcp_server.py")
+)
+weather_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(weather_server)
+
+
+def test_cancelled_follower_does_not_break_other_callers(monkeypatch):
+    """取消一个合并的等待者，发起请求的协程和其他等待者仍然拿到数据"""
+    release = asyncio.Event()
+
+    async def slow_fetch(city_en):
+        await release.wait()
+        return {"temperature": 20, "condition": "Sunny"}
+
+    monkeypatch.setattr(weather_server, "afetch_weather_data", slow_fetch)
+    cache = weather_server.WeatherCache(ttl=60)
+
+    async def run():
+        leader = asyncio.create_task(cache.aget("北京"))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.aget("北京")) for _ in range(2)]
+        await asyncio.sleep(0)
+        followers[0].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(leader, *followers, return_exceptions=True)
+
+    leader, cancelled, follower = asyncio.run(run())
+    assert isinstance(cancelled, asyncio.CancelledError)
+    assert leader[0]["temperature"] == 20
+    assert follower[0]["temperature"] == 20
+    assert cache.stats()["coalesced"] == 2